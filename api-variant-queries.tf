@@ -0,0 +1,198 @@
+#
+# variant_queries API Function /variant_queries
+#
+resource "aws_api_gateway_resource" "variant_queries" {
+  path_part   = "variant_queries"
+  parent_id   = aws_api_gateway_rest_api.BeaconApi.root_resource_id
+  rest_api_id = aws_api_gateway_rest_api.BeaconApi.id
+}
+
+resource "aws_api_gateway_method" "variant_queries_post" {
+  rest_api_id   = aws_api_gateway_rest_api.BeaconApi.id
+  resource_id   = aws_api_gateway_resource.variant_queries.id
+  http_method   = "POST"
+  authorization = "COGNITO_USER_POOLS"
+  authorizer_id = aws_api_gateway_authorizer.beacon_user_pool_authorizer.id
+}
+
+resource "aws_api_gateway_method_response" "variant_queries_post" {
+  rest_api_id = aws_api_gateway_method.variant_queries_post.rest_api_id
+  resource_id = aws_api_gateway_method.variant_queries_post.resource_id
+  http_method = aws_api_gateway_method.variant_queries_post.http_method
+  status_code = "202"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Origin" = true
+  }
+
+  response_models = {
+    "application/json" = "Empty"
+  }
+}
+
+# 
+# /variant_queries/{id}
+# 
+resource "aws_api_gateway_resource" "variant_queries-id" {
+  path_part   = "{id}"
+  parent_id   = aws_api_gateway_resource.variant_queries.id
+  rest_api_id = aws_api_gateway_rest_api.BeaconApi.id
+}
+
+resource "aws_api_gateway_method" "variant_queries-id" {
+  rest_api_id   = aws_api_gateway_rest_api.BeaconApi.id
+  resource_id   = aws_api_gateway_resource.variant_queries-id.id
+  http_method   = "GET"
+  authorization = "COGNITO_USER_POOLS"
+  authorizer_id = aws_api_gateway_authorizer.beacon_user_pool_authorizer.id
+
+  request_parameters = {
+    "method.request.path.id" = true
+  }
+}
+
+resource "aws_api_gateway_method_response" "variant_queries-id" {
+  rest_api_id = aws_api_gateway_method.variant_queries-id.rest_api_id
+  resource_id = aws_api_gateway_method.variant_queries-id.resource_id
+  http_method = aws_api_gateway_method.variant_queries-id.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Origin" = true
+  }
+
+  response_models = {
+    "application/json" = "Empty"
+  }
+}
+
+resource "aws_api_gateway_method" "variant_queries-id_post" {
+  rest_api_id   = aws_api_gateway_rest_api.BeaconApi.id
+  resource_id   = aws_api_gateway_resource.variant_queries-id.id
+  http_method   = "POST"
+  authorization = "COGNITO_USER_POOLS"
+  authorizer_id = aws_api_gateway_authorizer.beacon_user_pool_authorizer.id
+
+  request_parameters = {
+    "method.request.path.id" = true
+  }
+}
+
+resource "aws_api_gateway_method_response" "variant_queries-id_post" {
+  rest_api_id = aws_api_gateway_method.variant_queries-id_post.rest_api_id
+  resource_id = aws_api_gateway_method.variant_queries-id_post.resource_id
+  http_method = aws_api_gateway_method.variant_queries-id_post.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Origin" = true
+  }
+
+  response_models = {
+    "application/json" = "Empty"
+  }
+}
+
+# enable CORS
+module "cors-variant_queries" {
+  source  = "squidfunk/api-gateway-enable-cors/aws"
+  version = "0.3.3"
+
+  api_id          = aws_api_gateway_rest_api.BeaconApi.id
+  api_resource_id = aws_api_gateway_resource.variant_queries.id
+  allow_headers   = ["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token", "X-Permissions-Token"]
+}
+
+module "cors-variant_queries-id" {
+  source  = "squidfunk/api-gateway-enable-cors/aws"
+  version = "0.3.3"
+
+  api_id          = aws_api_gateway_rest_api.BeaconApi.id
+  api_resource_id = aws_api_gateway_resource.variant_queries-id.id
+  allow_headers   = ["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Amz-Security-Token", "X-Permissions-Token"]
+}
+
+# wire up lambda variant_queries
+resource "aws_api_gateway_integration" "variant_queries_post" {
+  rest_api_id             = aws_api_gateway_rest_api.BeaconApi.id
+  resource_id             = aws_api_gateway_resource.variant_queries.id
+  http_method             = aws_api_gateway_method.variant_queries_post.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = module.lambda-getGenomicVariants.lambda_function_invoke_arn
+}
+
+resource "aws_api_gateway_integration_response" "variant_queries_post" {
+  rest_api_id = aws_api_gateway_method.variant_queries_post.rest_api_id
+  resource_id = aws_api_gateway_method.variant_queries_post.resource_id
+  http_method = aws_api_gateway_method.variant_queries_post.http_method
+  status_code = aws_api_gateway_method_response.variant_queries_post.status_code
+
+  response_templates = {
+    "application/json" = ""
+  }
+
+  depends_on = [aws_api_gateway_integration.variant_queries_post]
+}
+
+# wire up lambda variant_queries/{id}
+resource "aws_api_gateway_integration" "variant_queries-id" {
+  rest_api_id             = aws_api_gateway_rest_api.BeaconApi.id
+  resource_id             = aws_api_gateway_resource.variant_queries-id.id
+  http_method             = aws_api_gateway_method.variant_queries-id.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = module.lambda-getGenomicVariants.lambda_function_invoke_arn
+}
+
+resource "aws_api_gateway_integration_response" "variant_queries-id" {
+  rest_api_id = aws_api_gateway_method.variant_queries-id.rest_api_id
+  resource_id = aws_api_gateway_method.variant_queries-id.resource_id
+  http_method = aws_api_gateway_method.variant_queries-id.http_method
+  status_code = aws_api_gateway_method_response.variant_queries-id.status_code
+
+  response_templates = {
+    "application/json" = ""
+  }
+
+  depends_on = [aws_api_gateway_integration.variant_queries-id]
+}
+
+resource "aws_api_gateway_integration" "variant_queries-id_post" {
+  rest_api_id             = aws_api_gateway_rest_api.BeaconApi.id
+  resource_id             = aws_api_gateway_resource.variant_queries-id.id
+  http_method             = aws_api_gateway_method.variant_queries-id_post.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = module.lambda-getGenomicVariants.lambda_function_invoke_arn
+}
+
+resource "aws_api_gateway_integration_response" "variant_queries-id_post" {
+  rest_api_id = aws_api_gateway_method.variant_queries-id_post.rest_api_id
+  resource_id = aws_api_gateway_method.variant_queries-id_post.resource_id
+  http_method = aws_api_gateway_method.variant_queries-id_post.http_method
+  status_code = aws_api_gateway_method_response.variant_queries-id_post.status_code
+
+  response_templates = {
+    "application/json" = ""
+  }
+
+  depends_on = [aws_api_gateway_integration.variant_queries-id_post]
+}
+
+# permit lambda invokation
+resource "aws_lambda_permission" "APIvariant_queries" {
+  statement_id  = "AllowAPIvariant_queriesInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = module.lambda-getGenomicVariants.lambda_function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.BeaconApi.execution_arn}/*/*/${aws_api_gateway_resource.variant_queries.path_part}"
+}
+
+resource "aws_lambda_permission" "APIvariant_queriesId" {
+  statement_id  = "AllowAPIvariant_queriesIdInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = module.lambda-getGenomicVariants.lambda_function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.BeaconApi.execution_arn}/*/*/${aws_api_gateway_resource.variant_queries.path_part}/*"
+}
@@ -100,6 +100,20 @@ resource "aws_api_gateway_deployment" "BeaconApi" {
       aws_api_gateway_integration_response.g_variants-id-individuals_post,
       aws_api_gateway_method_response.g_variants-id-individuals,
       aws_api_gateway_method_response.g_variants-id-individuals_post,
+      # /variant_queries
+      aws_api_gateway_method.variant_queries_post,
+      aws_api_gateway_integration.variant_queries_post,
+      aws_api_gateway_integration_response.variant_queries_post,
+      aws_api_gateway_method_response.variant_queries_post,
+      # /variant_queries/{id}
+      aws_api_gateway_method.variant_queries-id,
+      aws_api_gateway_method.variant_queries-id_post,
+      aws_api_gateway_integration.variant_queries-id,
+      aws_api_gateway_integration.variant_queries-id_post,
+      aws_api_gateway_integration_response.variant_queries-id,
+      aws_api_gateway_integration_response.variant_queries-id_post,
+      aws_api_gateway_method_response.variant_queries-id,
+      aws_api_gateway_method_response.variant_queries-id_post,
       # /individuals
       aws_api_gateway_method.individuals,
       aws_api_gateway_method.individuals_post,
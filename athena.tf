@@ -725,6 +725,8 @@ resource "aws_cloudformation_stack" "sbeacon_terms_stack" {
 
 # 
 # Connected entities
+# one partition per dataset, written by submitDataset and
+# registered by the indexer
 # 
 resource "aws_glue_catalog_table" "sbeacon-relations" {
   name          = "sbeacon_relations"
@@ -737,8 +739,13 @@ resource "aws_glue_catalog_table" "sbeacon-relations" {
     "orc.compress" = "SNAPPY"
   }
 
+  partition_keys {
+    name = "datasetid"
+    type = "string"
+  }
+
   storage_descriptor {
-    location      = "s3://${aws_s3_bucket.metadata-bucket.bucket}/relations"
+    location      = "s3://${aws_s3_bucket.metadata-bucket.bucket}/relations-cache"
     input_format  = "org.apache.hadoop.hive.ql.io.orc.OrcInputFormat"
     output_format = "org.apache.hadoop.hive.ql.io.orc.OrcOutputFormat"
 
@@ -754,11 +761,6 @@ resource "aws_glue_catalog_table" "sbeacon-relations" {
       }
     }
 
-    columns {
-      name = "datasetid"
-      type = "string"
-    }
-
     columns {
       name = "individualid"
       type = "string"
@@ -781,6 +783,58 @@ resource "aws_glue_catalog_table" "sbeacon-relations" {
   }
 }
 
+# 
+# Staged sample sets (variant carriers) joined against the entities
+# one partition per query, resolved by partition projection
+# 
+resource "aws_glue_catalog_table" "sbeacon-carriers" {
+  name          = "sbeacon_carriers"
+  database_name = aws_glue_catalog_database.metadata-database.name
+
+  table_type = "EXTERNAL_TABLE"
+
+  parameters = {
+    EXTERNAL                    = "TRUE"
+    "projection.enabled"        = "true"
+    "projection._queryid.type"  = "injected"
+    "storage.location.template" = "s3://${aws_s3_bucket.metadata-bucket.bucket}/carriers-cache/$${_queryid}"
+    "orc.compress"              = "SNAPPY"
+  }
+
+  partition_keys {
+    name = "_queryid"
+    type = "string"
+  }
+
+  storage_descriptor {
+    location      = "s3://${aws_s3_bucket.metadata-bucket.bucket}/carriers-cache"
+    input_format  = "org.apache.hadoop.hive.ql.io.orc.OrcInputFormat"
+    output_format = "org.apache.hadoop.hive.ql.io.orc.OrcOutputFormat"
+
+
+    ser_de_info {
+      name                  = "ORC"
+      serialization_library = "org.apache.hadoop.hive.ql.io.orc.OrcSerde"
+
+      parameters = {
+        "serialization.format"      = 1,
+        "orc.column.index.access"   = "FALSE"
+        "hive.orc.use-column-names" = "TRUE"
+      }
+    }
+
+    columns {
+      name = "_datasetid"
+      type = "string"
+    }
+
+    columns {
+      name = "_vcfsampleid"
+      type = "string"
+    }
+  }
+}
+
 resource "aws_glue_crawler" "sbeacon-crawler" {
   database_name = aws_glue_catalog_database.metadata-database.name
   name          = "sbeacon-crawler"
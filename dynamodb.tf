@@ -182,8 +182,49 @@ resource "aws_dynamodb_table" "clinical_variants" {
   }
 }
 
+# Variant Queries Table
+# Progress of the asynchronous variant query jobs
+resource "aws_dynamodb_table" "variant_queries" {
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "jobId"
+  name         = "sbeacon-variant-queries"
+
+  tags = var.common-tags
+
+  attribute {
+    name = "jobId"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ExpirationTime"
+    enabled        = true
+  }
+}
+
+# Cohort Jobs Table
+# Progress of the distributed cohort exports
+resource "aws_dynamodb_table" "cohort_jobs" {
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "jobId"
+  name         = "sbeacon-cohort-jobs"
+
+  tags = var.common-tags
+
+  attribute {
+    name = "jobId"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ExpirationTime"
+    enabled        = true
+  }
+}
+
 # VCFs  Table
-# So we can keep track of the number of samples in each vcf
+# So we can keep track of the number of samples in each vcf, along with
+# their headers and indexes memoized by etag
 resource "aws_dynamodb_table" "vcfs" {
   billing_mode = "PAY_PER_REQUEST"
   hash_key     = "vcfLocation"
@@ -25,9 +25,31 @@ data "aws_iam_policy_document" "lambda-submitDataset" {
       "s3:CreateMultipartUpload",
       "s3:UploadPart",
       "s3:CompleteMultipartUpload",
+      "s3:DeleteObject",
     ]
     resources = ["*"]
   }
+
+  # asynchronous presence index builds, arn is constructed to avoid a cycle
+  statement {
+    actions = [
+      "lambda:InvokeFunction",
+    ]
+    resources = [
+      "arn:aws:lambda:${var.region}:${data.aws_caller_identity.this.account_id}:function:sbeacon-backend-submitDataset",
+    ]
+  }
+
+  # vcf headers memoized by etag
+  statement {
+    actions = [
+      "dynamodb:GetItem",
+      "dynamodb:UpdateItem",
+    ]
+    resources = [
+      aws_dynamodb_table.vcfs.arn,
+    ]
+  }
 }
 
 #
@@ -221,7 +243,16 @@ data "aws_iam_policy_document" "lambda-splitQuery" {
     ]
     resources = [
       aws_sns_topic.performQuery.arn,
+      aws_sns_topic.splitQuery.arn,
+    ]
+  }
+
+  statement {
+    actions = [
+      "s3:GetObject",
+      "s3:PutObject",
     ]
+    resources = ["${aws_s3_bucket.metadata-bucket.arn}/variant-queries/*"]
   }
 }
 
@@ -322,6 +353,21 @@ data "aws_iam_policy_document" "dynamodb-quota-access" {
   }
 }
 
+# DynamoDB Variant Queries Access
+data "aws_iam_policy_document" "dynamodb-variant-queries-access" {
+  statement {
+    actions = [
+      "dynamodb:DescribeTable",
+      "dynamodb:GetItem",
+      "dynamodb:PutItem",
+      "dynamodb:UpdateItem",
+    ]
+    resources = [
+      aws_dynamodb_table.variant_queries.arn,
+    ]
+  }
+}
+
 # DynamoDB Ontology Related Write Access
 data "aws_iam_policy_document" "dynamodb-onto-write-access" {
   statement {
@@ -560,6 +606,7 @@ data "aws_iam_policy_document" "lambda-updateFiles" {
     actions = [
       "dynamodb:BatchGetItem",
       "dynamodb:DeleteItem",
+      "dynamodb:GetItem",
       "dynamodb:UpdateItem",
     ]
     resources = [
@@ -604,6 +651,7 @@ data "aws_iam_policy_document" "data-portal-lambda-access" {
       aws_dynamodb_table.sbeacon_dataportal_users_info.arn,
       aws_dynamodb_table.dataportal_pricing_cache.arn,
       aws_dynamodb_table.dataportal_cli_upload.arn,
+      aws_dynamodb_table.cohort_jobs.arn,
     ]
   }
 
@@ -773,11 +821,44 @@ data "aws_iam_policy_document" "lambda-generateCohortVCfs" {
     actions = [
       "s3:GetObject",
       "s3:ListBucket",
-      "s3:PutObject"
+      "s3:PutObject",
+      "s3:DeleteObject",
     ]
     resources = ["*"]
   }
 
+  # tasks of the cohort jobs, arn is constructed to avoid a cycle
+  statement {
+    actions = [
+      "lambda:InvokeFunction",
+    ]
+    resources = [
+      "arn:aws:lambda:${var.region}:${data.aws_caller_identity.this.account_id}:function:sbeacon-backend-generateCohortVCfs",
+    ]
+  }
+
+  statement {
+    actions = [
+      "dynamodb:DescribeTable",
+      "dynamodb:GetItem",
+      "dynamodb:PutItem",
+      "dynamodb:UpdateItem",
+    ]
+    resources = [
+      aws_dynamodb_table.cohort_jobs.arn,
+    ]
+  }
+
+  # tasks lambda gave up on, see generateCohortVCfs in lambda.tf
+  statement {
+    actions = [
+      "SNS:Publish",
+    ]
+    resources = [
+      aws_sns_topic.cohortTaskFailures.arn,
+    ]
+  }
+
   statement {
     actions = [
       "cognito-idp:ListUsers",
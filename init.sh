@@ -82,15 +82,18 @@ cd ${REPOSITORY_DIRECTORY}
 # version. Otherwise lambda will use its own boto3 version and
 # pynamodb's botocore version will not match. Version pinning is
 # currently arbitrary.
+pip install aiohttp==3.10.11 --target layers/python_libraries/python
 pip install boto3==1.39.17 --target layers/python_libraries/python
 pip install ijson==3.3.0 --target layers/python_libraries/python
 pip install jsons==1.6.3 --target layers/python_libraries/python
 pip install jsonschema==4.18.0 --target layers/python_libraries/python
 pip install markupsafe==2.0.1 --target layers/python_libraries/python
+pip install pyahocorasick==2.3.1 --target layers/python_libraries/python
 pip install pydantic==2.9.2 --target layers/python_libraries/python
 pip install pyhumps==3.8.0 --target layers/python_libraries/python
 pip install pynamodb==6.0.0 --target layers/python_libraries/python
 pip install pyorc==0.9.0 --target layers/python_libraries/python
+pip install pysam==0.22.1 --target layers/python_libraries/python
 pip install requests==2.31.0 --target layers/python_libraries/python
 pip install smart_open==7.0.4 --target layers/python_libraries/python
 pip install strenum==0.4.15 --target layers/python_libraries/python
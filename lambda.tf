@@ -22,6 +22,31 @@ resource "aws_lambda_permission" "SNSperformQuery" {
 }
 
 
+#
+# generateCohortVCfs Lambda Function
+#
+resource "aws_lambda_permission" "SNScohortTaskFailures" {
+  statement_id  = "SBeaconBackendAllowSNScohortTaskFailuresInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = module.lambda-generateCohortVCfs.lambda_function_arn
+  principal     = "sns.amazonaws.com"
+  source_arn    = aws_sns_topic.cohortTaskFailures.arn
+}
+
+# a task killed by the timeout or running out of memory would only be
+# killed again, it is reported to the function to fail its job instead
+resource "aws_lambda_function_event_invoke_config" "generateCohortVCfs" {
+  function_name          = module.lambda-generateCohortVCfs.lambda_function_name
+  maximum_retry_attempts = 0
+
+  destination_config {
+    on_failure {
+      destination = aws_sns_topic.cohortTaskFailures.arn
+    }
+  }
+}
+
+
 #
 # updateFiles Lambda Function
 #
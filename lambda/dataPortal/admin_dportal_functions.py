@@ -5,7 +5,12 @@ from time import time
 
 from utils.models import Projects, ProjectUsers
 from pynamodb.exceptions import DoesNotExist
-from utils.s3_util import list_s3_prefix, list_s3_folder, delete_s3_objects
+from utils.s3_util import (
+    list_s3_prefix,
+    list_s3_folder,
+    delete_s3_objects,
+    with_part_keys,
+)
 from utils.cognito import get_user_from_attribute, get_user_attribute, list_users
 from utils.lambda_util import invoke_lambda_function
 from shared.cognitoutils import authenticate_manager, require_permissions
@@ -253,8 +258,22 @@ def delete_project(event, context):
             f"terms-cache/analyses-{name}:{dataset_id}",
             f"terms-cache/datasets-{name}:{dataset_id}",
         ]
-        print(cache_prefixes)
-        delete_s3_objects(ATHENA_METADATA_BUCKET, cache_prefixes)
+        cache_folders = [
+            # relations, dropped from the relations table on the next index
+            f"relations-cache/{name}:{dataset_id}/",
+            # variant presence indexes, one per vcf
+            f"variant-index/{name}:{dataset_id}/",
+        ]
+        print(cache_prefixes, cache_folders)
+        delete_s3_objects(
+            ATHENA_METADATA_BUCKET,
+            with_part_keys(ATHENA_METADATA_BUCKET, cache_prefixes)
+            + [
+                key
+                for folder in cache_folders
+                for key in list_s3_prefix(ATHENA_METADATA_BUCKET, folder)
+            ],
+        )
 
     with ProjectUsers.batch_write() as batch:
         for entry in ProjectUsers.query(hash_key=name):
@@ -440,7 +459,21 @@ def un_ingest_dataset_from_sbeacon(event, context):
         f"terms-cache/analyses-{project_name}:{dataset_id}",
         f"terms-cache/datasets-{project_name}:{dataset_id}",
     ]
-    delete_s3_objects(ATHENA_METADATA_BUCKET, cache_prefixes)
+    cache_folders = [
+        # relations, dropped from the relations table on the next index
+        f"relations-cache/{project_name}:{dataset_id}/",
+        # variant presence indexes, one per vcf
+        f"variant-index/{project_name}:{dataset_id}/",
+    ]
+    delete_s3_objects(
+        ATHENA_METADATA_BUCKET,
+        with_part_keys(ATHENA_METADATA_BUCKET, cache_prefixes)
+        + [
+            key
+            for folder in cache_folders
+            for key in list_s3_prefix(ATHENA_METADATA_BUCKET, folder)
+        ],
+    )
 
     project = Projects.get(project_name)
     project.update(actions=[Projects.ingested_datasets.delete([dataset_id])])
@@ -3,8 +3,14 @@ import json
 
 from shared.apiutils import LambdaRouter, PortalError
 from shared.cognitoutils import require_permissions
+from shared.dynamodb import CohortJob, fail_stale_cohort_job
 from utils.models import Projects, ProjectUsers, SavedQueries
-from utils.s3_util import get_presigned_url
+from utils.s3_util import (
+    delete_s3_objects,
+    get_presigned_url,
+    list_s3_prefix,
+    s3,
+)
 from utils.lambda_util import invoke_lambda_function
 
 router = LambdaRouter()
@@ -150,3 +156,31 @@ def create_cohort(event, context):
     invoke_lambda_function(COHORT_MAKER_LAMBDA, body_dict, True)
 
     return {"success": True}
+
+
+@router.attach("/dportal/cohort/{jobId}", "get", require_permissions('sbeacon_query.create'))
+def get_cohort(event, context):
+    sub = event["requestContext"]["authorizer"]["claims"]["sub"]
+    job_id = event["pathParameters"]["jobId"]
+
+    try:
+        job = CohortJob.get(job_id)
+    except CohortJob.DoesNotExist:
+        raise PortalError(404, "Cohort job not found")
+
+    if job.uid != sub:
+        raise PortalError(404, "Cohort job not found")
+
+    # a task lost to a timeout never reports, the job is failed here instead
+    if fail_stale_cohort_job(job):
+        job_prefix = job.jobPath[len(f"s3://{DPORTAL_BUCKET}/") :]
+        s3.put_object(
+            Bucket=DPORTAL_BUCKET,
+            Key=f"{job_prefix}/status.json",
+            Body=json.dumps({"status": "failed", "message": job.error}),
+        )
+        delete_s3_objects(
+            DPORTAL_BUCKET, list_s3_prefix(DPORTAL_BUCKET, f"{job_prefix}/parts/")
+        )
+
+    return job.to_dict()
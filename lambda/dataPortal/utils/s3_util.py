@@ -76,6 +76,14 @@ def delete_s3_objects(bucket, keys):
     return responses
 
 
+def with_part_keys(bucket, keys):
+    # large metadata caches are written as {key}, {key}.part-00001, ...
+    part_keys = [
+        part_key for key in keys for part_key in list_s3_prefix(bucket, f"{key}.part-")
+    ]
+    return keys + part_keys
+
+
 def get_presigned_url(bucket, key):
     return s3.generate_presigned_url(
         ClientMethod="get_object",
@@ -2,19 +2,26 @@ import argparse
 import csv
 import io
 import json
+import multiprocessing
 import os
 import re
 import subprocess
+from collections import deque
 
+import ahocorasick
 import boto3
 import ijson
 
 from file_validation import validate_file
 
 ANNOTATION_PATH = "annotation.vcf.gz"
+ANNOTATION_CHUNK_PATH = "annotation.{:06d}.vcf.gz"
+REGIONS_CHUNK_PATH = "regions.{:06d}.tsv"
 BGZIPPED_PATH = "bgzipped.bcf.gz"
 HEADER_PATH = "header.vcf"
+SAM_HEADER_PATH = "header.sam"
 MAX_LINES_PER_PRINT = 100
+SCAN_BLOCK_BYTES = 16 * 1024 * 1024
 MASK = "XXXXXXXXXX"
 
 INFO_RESERVED_KEYS = {
@@ -66,9 +73,26 @@ PII_PATTERNS = [
     r"^(1[1-9]|21|[37][1-6]|5[1-3]|6[1-5]|[89][12])\d{2}\d{2}([04][1-9]|[1256][0-9]|[37][01])(0[1-9]|1[0-2])\d{2}\d{4}$",  # NIK
     r"\b[A-Z]{1,2} \d{1,4}( [A-Z]{1,3})?\b",  # License plate with enforced spaces
 ]
+ADDRESS_KEYWORDS = [
+    r"Jl\.", "Jalan", "Desa", "Kelurahan", "Kecamatan", "Kab.", "Kab", "Kabupaten",
+    "Kec", "Kec.", "Kecamatan", "Prov.", "Provinsi", "Prov", r"Kode\s?Pos",
+]
+HONORIFICS = [
+    r"Dr\.", r"Prof\.", r"Ir\.", "Haji", "Hajjah", "Putra", "Putri", "Sri", "Adi",
+    "Raden", "Ny", r"H\.", r"Hj\.", "Kiai", "Kyai", r"K\.H\.", r"KH\.", "Gus", "Ning",
+    r"Ir\.", r"Drs\.", r"Dra\.", "Sultan", "Pangeran", r"R\.M\.", r"R\.A\.", r"R\.Ay\.",
+    r"Rr\.", r"Ust\.", "Ustaz", "Ustadz", "Bapak", r"Bpk\.", "Iibu", "Saudara",
+    "Saudari", r"Sdr\.", "Tuan", r"Tn\.", "Nona", r"Nn\.", "Dokter", r"Drg\.",
+    r"Prof\.", "Teungku", "Teuku", r"Tgk\.", "Datuk", "Datuak", "Tengku", "Kemas",
+    "Nyimas", "Kiagus", "Nyanyu", "Tubagus", "Ratu", r"Rd\.", "Rara", "Roro",
+    "Anak Agung", "Gusti", "Dewa", "Desak", "Lalu", "Umbu", "ADaeng", "Puang",
+    "Kapitan", "Adi", "Daeng", "Karaeng", "Arung", "Opu", "Petta", "Latu", "Upu",
+]
 CASE_INSENSITIVE_PII_PATTERNS = [
-    r"\b(?:(?:Jl\.|Jalan|Desa|Kelurahan|Kecamatan|Kab.|Kab|Kabupaten|Kec|Kec.|Kecamatan|Prov.|Provinsi|Prov|Kode\s?Pos)(?:\s?(?:\d{5}|RT\s?\d{1,2}/RW\s?\d{1,2}|[A-Z^RT]+[a-z]*(?:\.\s?\d+)?),?)+,?\s?)+\b",  # Address
-    r"\b(?:Dr\.|Prof\.|Ir\.|Haji|Hajjah|Putra|Putri|Sri|Adi|Raden|Ny|H\.|Hj\.|Kiai|Kyai|K\.H\.|KH\.|Gus|Ning|Ir\.|Drs\.|Dra\.|Sultan|Pangeran|R\.M\.|R\.A\.|R\.Ay\.|Rr\.|Ust\.|Ustaz|Ustadz|Bapak|Bpk\.|Iibu|Saudara|Saudari|Sdr\.|Tuan|Tn\.|Nona|Nn\.|Dokter|Drg\.|Prof\.|Teungku|Teuku|Tgk\.|Datuk|Datuak|Tengku|Kemas|Nyimas|Kiagus|Nyanyu|Tubagus|Ratu|Rd\.|Rara|Roro|Anak Agung|Gusti|Dewa|Desak|Lalu|Umbu|ADaeng|Puang|Kapitan|Adi|Daeng|Karaeng|Arung|Opu|Petta|Latu|Upu)(?:\s[A-Z][a-z]+){1,2}\b",  # Name
+    r"\b(?:(?:"
+    + "|".join(ADDRESS_KEYWORDS)
+    + r")(?:\s?(?:\d{5}|RT\s?\d{1,2}/RW\s?\d{1,2}|[A-Z^RT]+[a-z]*(?:\.\s?\d+)?),?)+,?\s?)+\b",  # Address
+    r"\b(?:" + "|".join(HONORIFICS) + r")(?:\s[A-Z][a-z]+){1,2}\b",  # Name
 ]
 ANY_PII_PATTERN = re.compile(
     "|".join(
@@ -77,6 +101,39 @@ ANY_PII_PATTERN = re.compile(
         + [f"(?i:{pattern})" for pattern in CASE_INSENSITIVE_PII_PATTERNS]
     )
 )
+# Necessary conditions of ANY_PII_PATTERN, cheap enough to rule out most
+# values before running it. Phone numbers and NIKs need these digits, unless
+# the value is nothing but a phone number, and plates need a letter, a space
+# and a digit. They hold for values joined by PII_VALUE_SEPARATOR just when
+# they hold for one of the values.
+PII_VALUE_SEPARATOR = "\x00"
+# Only ever searched in ASCII, where matching it as such is faster
+PII_DIGITS_PATTERN = re.compile(r"\b(?:0\d|\d{10})", re.ASCII)
+PLATE_PREFIX_PATTERN = re.compile(r"[A-Z] \d")
+PHONE_NUMBER_PATTERN = re.compile(
+    r"(?:^|\x00)[-+0-9 \t\n\r\x0b\x0c\x1c-\x1f]{9,}(?:\x00|\Z)"
+)
+
+
+def _literal_prefix(keyword):
+    # what every match of the keyword starts with, e.g. "kode" for Kode\s?Pos
+    literal = re.match(r"(?:[^\\.?*+()\[\]{}|^$]|\\\.)*", keyword).group()
+    return literal.replace("\\.", ".").lower()
+
+
+def _keyword_automaton():
+    # keywords an address or a name has to start with, found in a single pass
+    automaton = ahocorasick.Automaton()
+    # an address keyword needs nothing after it, so it takes precedence
+    for keywords, name in ((HONORIFICS, True), (ADDRESS_KEYWORDS, False)):
+        for keyword in keywords:
+            literal = _literal_prefix(keyword)
+            automaton.add_word(literal, (len(literal), name))
+    automaton.make_automaton()
+    return automaton
+
+
+PII_KEYWORDS = _keyword_automaton()
 INDIVIDUAL_MARKER_FIELDS = {
     "age",
     "umur",
@@ -117,6 +174,9 @@ METADATA_SUFFIXES = [
     ".txt",
 ]
 
+# Values of the string tags of a SAM record, the only fields anonymised
+SAM_STRING_TAG_PATTERN = re.compile(rb"\t[A-Za-z][A-Za-z0-9]:Z:([^\t\n]*)")
+
 SAM_HEADERS_WHITELIST = {
     "HD": {
         "VN",
@@ -162,6 +222,13 @@ SAM_HEADERS_WHITELIST = {
 # Check if the script is running in AWS Lambda.
 # EC2 instances don't have as much space in tmp
 WORKING_DIR = "/tmp" if ("AWS_LAMBDA_FUNCTION_NAME" in os.environ) else "."
+# Outside of lambda, VCF records are deidentified in chunks of at most this
+# many bases of a contig, by a process per core
+RECORD_CHUNK_BASES = 10_000_000
+# End of the regions that run to the end of their contig, VCF positions fit
+# in a signed 32 bit integer
+MAX_POSITION = 2**31 - 1
+RECORD_PROCESSES = 1 if ("AWS_LAMBDA_FUNCTION_NAME" in os.environ) else os.cpu_count()
 
 dynamodb = boto3.client("dynamodb")
 s3 = boto3.client("s3")
@@ -176,6 +243,16 @@ class ProcessError(Exception):
         self.process_args = process_args
         super().__init__(message)
 
+    def __reduce__(self):
+        # Raised again in the parent process when a pool worker fails
+        return ProcessError, (
+            self.message,
+            self.stdout,
+            self.stderr,
+            self.returncode,
+            self.process_args,
+        )
+
     def __str__(self):
         return f"{self.message}\nProcess args: {self.process_args}\nstderr:\n{self.stderr}\nreturncode: {self.returncode}"
 
@@ -279,7 +356,42 @@ class SamReader:
         )
 
 
+def may_contain_pii(input_string):
+    """
+    False only when ANY_PII_PATTERN cannot match, which holds for nearly
+    all of the values of a genomic file, sparing them the full pattern.
+    Given values joined by PII_VALUE_SEPARATOR, False only when it cannot
+    match any of them.
+    """
+    if not input_string.isascii():
+        # unicode digits, spaces and case folding are left to the pattern
+        return True
+    if (
+        "@" in input_string
+        or PII_DIGITS_PATTERN.search(input_string)
+        or PLATE_PREFIX_PATTERN.search(input_string)
+    ):
+        return True
+    if PHONE_NUMBER_PATTERN.search(input_string):
+        return True
+
+    text = input_string.lower()
+    for end, (length, name) in PII_KEYWORDS.iter(text):
+        start = end - length + 1
+        # keywords start at a word boundary
+        if start and (text[start - 1].isalnum() or text[start - 1] == "_"):
+            continue
+        # honorifics are followed by a capitalised name
+        if not name or (
+            text[end + 1 : end + 2].isspace() and text[end + 2 : end + 3].isalpha()
+        ):
+            return True
+    return False
+
+
 def anonymise(input_string):
+    if not may_contain_pii(input_string):
+        return input_string
     return ANY_PII_PATTERN.sub(MASK, input_string)
 
 
@@ -427,15 +539,95 @@ def process_header(file_path):
     return info_whitelist, header_lines, header_changes
 
 
-def process_records(file_path, header_lines, info_whitelist):
+def get_record_chunks(file_path, output_type):
+    """
+    Indexes the file and splits its records into (contig, start, end) regions
+    of at most RECORD_CHUNK_BASES bases, listed by contig with the number of
+    records the index holds for it. Returns None when the records are to be read in
+    a single pass, by a single process or because the file can't be indexed.
+    """
+    if RECORD_PROCESSES == 1 or output_type not in "zb":
+        return None
+    try:
+        index_process = CheckedProcess(
+            args=[
+                "bcftools",
+                "index",
+                "--force",
+                "--threads",
+                str(RECORD_PROCESSES),
+                file_path,
+            ],
+            error_message="Indexing original file failed",
+        )
+        index_process.check()
+    except ProcessError as e:
+        # Most likely gzipped rather than bgzipped
+        print(f"Reading records in a single pass: {e}")
+        return None
+    stats_process = CheckedProcess(
+        args=["bcftools", "index", "--stats", file_path],
+        stdout=subprocess.PIPE,
+        error_message="Reading index failed",
+    )
+    chunks = []
+    for line in stats_process.stdout:
+        contig, length, records = line.rstrip("\r\n").split("\t")
+        if records == "0":
+            continue
+        if length == "." or int(length) <= RECORD_CHUNK_BASES:
+            regions = [(contig, 1, MAX_POSITION)]
+        else:
+            starts = range(1, int(length) + 1, RECORD_CHUNK_BASES)
+            regions = [
+                (contig, start, start + RECORD_CHUNK_BASES - 1)
+                for start in starts[:-1]
+            ]
+            # Records past the length in the header belong to the last chunk
+            regions.append((contig, starts[-1], MAX_POSITION))
+        chunks.append((contig, int(records), regions))
+    stats_process.check()
+    return chunks
+
+
+def write_regions_file(regions_path, regions):
+    """
+    Writes the regions as a tab-separated regions file, which unlike a
+    --regions string can't misread contig names containing colons, such as
+    HLA-A*01:01:01:01.
+    """
+    with open(f"{WORKING_DIR}/{regions_path}", "w") as regions_file:
+        for contig, start, end in regions:
+            print(contig, start, end, sep="\t", file=regions_file)
+
+
+def process_record_chunk(
+    file_path, regions_path, header_lines, info_whitelist, output_path
+):
+    """
+    Writes the records of the regions file, or of the whole file when it is
+    None, that have PII in their INFO column, anonymised, to output_path.
+    Returns the number of records read and the number written.
+    """
+    # A record belongs to the chunk its position is in, however far it spans
+    region_args = (
+        ["--regions-file", regions_path, "--regions-overlap", "pos"]
+        if regions_path
+        else []
+    )
     view_process = CheckedProcess(
-        args=["bcftools", "view", "--drop-genotypes", "--no-header", file_path],
+        args=[
+            "bcftools",
+            "view",
+            "--drop-genotypes",
+            "--no-header",
+            *region_args,
+            file_path,
+        ],
         stdout=subprocess.PIPE,
         error_message="Reading records failed",
     )
-    header_lines = header_lines.copy()
-    # Remove sample columns from header
-    header_lines[-1] = "\t".join(header_lines[-1].split("\t", 8)[:8])
+    num_records = 0
     num_records_changed = 0
     viewer = Viewer(
         [
@@ -445,9 +637,9 @@ def process_records(file_path, header_lines, info_whitelist):
             "--output-type",
             "z",
             "--output",
-            ANNOTATION_PATH,
-            "--write-index",
-        ],
+            output_path,
+        ]
+        + (["--write-index"] if output_path == ANNOTATION_PATH else []),
         "Creating deidentified records failed",
     )
     for line in view_process.stdout:
@@ -457,6 +649,7 @@ def process_records(file_path, header_lines, info_whitelist):
             # No line ending, has view_process crashed?
             view_process.check()
         line = line.rstrip("\r\n")
+        num_records += 1
         new_line = anonymise_vcf_record(line, info_whitelist)
         if new_line is not None:
             if num_records_changed == 0:
@@ -466,6 +659,67 @@ def process_records(file_path, header_lines, info_whitelist):
             num_records_changed += 1
     view_process.check()
     viewer.close()
+    return num_records, num_records_changed
+
+
+def process_records(file_path, header_lines, info_whitelist, chunks):
+    header_lines = header_lines.copy()
+    # Remove sample columns from header
+    header_lines[-1] = "\t".join(header_lines[-1].split("\t", 8)[:8])
+    if chunks is None:
+        _, num_records_changed = process_record_chunk(
+            file_path, None, header_lines, info_whitelist, ANNOTATION_PATH
+        )
+    else:
+        contigs = []
+        tasks = []
+        for contig, _, regions in chunks:
+            for region in regions:
+                output_path = ANNOTATION_CHUNK_PATH.format(len(tasks))
+                regions_path = REGIONS_CHUNK_PATH.format(len(tasks))
+                write_regions_file(regions_path, [region])
+                contigs.append(contig)
+                tasks.append(
+                    (file_path, regions_path, header_lines, info_whitelist, output_path)
+                )
+        print(f"Reading records in {len(tasks)} chunks, {RECORD_PROCESSES} at a time")
+        with multiprocessing.Pool(RECORD_PROCESSES) as pool:
+            results = pool.starmap(process_record_chunk, tasks, chunksize=1)
+        # Chunks meet without overlapping, so each record is read exactly once
+        records_read = {contig: 0 for contig in contigs}
+        for contig, (num_records, _) in zip(contigs, results):
+            records_read[contig] += num_records
+        for contig, num_indexed, _ in chunks:
+            if records_read[contig] != num_indexed:
+                raise ParsingError(
+                    f"Read {records_read[contig]} records of contig {contig},"
+                    f" but its index holds {num_indexed}"
+                )
+        num_records_changed = sum(num_changed for _, num_changed in results)
+        changed_paths = [
+            output_path
+            for (*_, output_path), (_, num_changed) in zip(tasks, results)
+            if num_changed
+        ]
+        if changed_paths:
+            # The chunks share a header, their compressed blocks can be joined
+            concat_process = CheckedProcess(
+                args=[
+                    "bcftools",
+                    "concat",
+                    "--naive",
+                    "--output",
+                    ANNOTATION_PATH,
+                    *changed_paths,
+                ],
+                error_message="Concatenating deidentified records failed",
+            )
+            concat_process.check()
+            index_process = CheckedProcess(
+                args=["bcftools", "index", "--force", ANNOTATION_PATH],
+                error_message="Indexing deidentified records failed",
+            )
+            index_process.check()
     if num_records_changed:
         print(
             f"INFO PII detected, anonymised annotation created for {num_records_changed} record(s)"
@@ -488,6 +742,8 @@ def prepare_for_annotate(file_path):
             "--output",
             BGZIPPED_PATH,
             "--write-index",
+            "--threads",
+            str(RECORD_PROCESSES),
             file_path,
         ],
         stdout=subprocess.PIPE,
@@ -538,7 +794,116 @@ def anonymise_sam_record(record):
     return "\t".join(all_fields) if contains_pii else None
 
 
+def read_line_blocks(stream):
+    # Blocks of about SCAN_BLOCK_BYTES, each ending with a whole line
+    remainder = b""
+    while block := stream.read(SCAN_BLOCK_BYTES):
+        block = remainder + block
+        end = block.rfind(b"\n") + 1
+        yield block[:end]
+        remainder = block[end:]
+    if remainder:
+        yield remainder
+
+
+def sam_tags_may_contain_pii(block):
+    values = set(SAM_STRING_TAG_PATTERN.findall(block))
+    # Non-ASCII values always may, whatever their encoding
+    joined = PII_VALUE_SEPARATOR.encode().join(values).decode("latin-1")
+    return may_contain_pii(joined)
+
+
+def bam_records_may_contain_pii(input_path):
+    """
+    Scans the string tags of the records for values that may hold PII,
+    stopping at the first. The records are decoded by samtools, and blocks
+    of them are scanned in parallel, outside of lambda, looking at nothing
+    but the tag values.
+    """
+    scan_process = CheckedProcess(
+        args=[
+            "samtools",
+            "view",
+            "--no-PG",
+            "--threads",
+            str(RECORD_PROCESSES),
+            input_path,
+        ],
+        stdout=subprocess.PIPE,
+        encoding=None,
+        error_message="Scanning bam file failed",
+    )
+    blocks = read_line_blocks(scan_process.stdout)
+    if RECORD_PROCESSES == 1:
+        found = any(map(sam_tags_may_contain_pii, blocks))
+    else:
+        with multiprocessing.Pool(RECORD_PROCESSES) as pool:
+            # A few blocks ahead of the workers, not the whole file
+            pending = deque()
+            for block in blocks:
+                pending.append(pool.apply_async(sam_tags_may_contain_pii, (block,)))
+                if len(pending) > 2 * RECORD_PROCESSES:
+                    if found := pending.popleft().get():
+                        break
+            else:
+                found = any(result.get() for result in pending)
+    if found:
+        scan_process.process.kill()
+        scan_process.process.wait()
+        return True
+    scan_process.check()
+    return False
+
+
 def anonymise_bam(input_path, output_path):
+    """
+    Only the header is rewritten when no record may hold PII, keeping the
+    compressed records as they are. Otherwise every record is anonymised.
+    """
+    if bam_records_may_contain_pii(input_path):
+        return anonymise_bam_records(input_path, output_path)
+    header_process = CheckedProcess(
+        args=["samtools", "view", "--no-PG", "-H", input_path],
+        stdout=subprocess.PIPE,
+        error_message="Reading bam header failed",
+    )
+    reader = SamReader()
+    header_lines = list(reader.anonymise_lines(header_process.stdout))
+    header_process.check()
+    print(reader.get_summary_string())
+    if reader.header_pii:
+        print("Header PII detected, no PII in records, updating header only")
+        with open(f"{WORKING_DIR}/{SAM_HEADER_PATH}", "w") as header_file:
+            print("\n".join(header_lines), file=header_file)
+        with open(output_path, "wb") as output_file:
+            reheader_process = CheckedProcess(
+                args=["samtools", "reheader", "--no-PG", SAM_HEADER_PATH, input_path],
+                stdout=output_file,
+                error_message="Updating bam header failed",
+            )
+            reheader_process.check()
+    else:
+        print("No PII detected in bam file, copying verbatim")
+        output_path = input_path
+    output_index = f"{output_path}.bai"
+    index_process = CheckedProcess(
+        args=[
+            "samtools",
+            "index",
+            "--threads",
+            str(RECORD_PROCESSES),
+            "-b",
+            "-o",
+            output_index,
+            output_path,
+        ],
+        error_message="Indexing bam file failed",
+    )
+    index_process.check()
+    return [output_path, output_index]
+
+
+def anonymise_bam_records(input_path, output_path):
     # We need to write out the whole bam file as we go anyway,
     # So we might as well always send the created files
     output_index = f"{output_path}.bai"
@@ -583,7 +948,8 @@ def anonymise_sam(input_path, output_path):
 def anonymise_vcf(input_path, output_path):
     output_type = get_output_type(input_path)[1]
     info_whitelist, header_lines, header_changes = process_header(input_path)
-    info_changes = process_records(input_path, header_lines, info_whitelist)
+    chunks = get_record_chunks(input_path, output_type)
+    info_changes = process_records(input_path, header_lines, info_whitelist, chunks)
     base_reheader_args = [
         "bcftools",
         "reheader",
@@ -604,6 +970,8 @@ def anonymise_vcf(input_path, output_path):
         "exact",
         "--output-type",
         output_type,
+        "--threads",
+        str(RECORD_PROCESSES),
         BGZIPPED_PATH,
     ]
     files_to_move = [output_path]
@@ -648,12 +1016,14 @@ def anonymise_vcf(input_path, output_path):
     else:
         print("No PII detected in VCF file, copying verbatim")
         files_to_move = [input_path]
-        if output_type in "zb":
+        # Chunking the records has indexed it already
+        if output_type in "zb" and chunks is None:
             index_process = CheckedProcess(
                 args=["bcftools", "index", "--force", input_path],
                 error_message="Indexing original file failed",
             )
             index_process.check()
+        if output_type in "zb":
             files_to_move.append(f"{input_path}.csi")
     return files_to_move
 
@@ -63,6 +63,7 @@ yum install -y \
 # Install boto3 and ijson
 pip install boto3
 pip install ijson==3.3.0
+pip install pyahocorasick==2.3.1
 pip install python-magic==0.4.27
 
 # Configure default region
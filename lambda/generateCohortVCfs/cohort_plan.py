@@ -0,0 +1,341 @@
+from collections import defaultdict
+
+from shared.utils import get_matching_chromosome
+
+
+# inputs of one bcftools merge, each is held open while merging
+MERGE_FAN_IN = 32
+COHORT_FILE_NAME = "cohort.vcf.gz"
+EXTRACT_STAGE = "extract"
+GATHER_STAGE = "gather"
+MERGE_STAGE = "merge"
+CONCAT_STAGE = "concat"
+
+
+def parts_path(job_path):
+    # intermediate files of the job, removed once it finishes
+    return f"{job_path}/parts"
+
+
+def stage_path(job_path, stage):
+    return f"{parts_path(job_path)}/{stage}.json"
+
+
+def part_path(job_path, stage, n):
+    return f"{parts_path(job_path)}/{stage}/{n:06d}.vcf.gz"
+
+
+def cohort_path(job_path):
+    return f"{job_path}/{COHORT_FILE_NAME}"
+
+
+def regions_path(job_path, n):
+    return f"{parts_path(job_path)}/regions/{n:06d}.tsv"
+
+
+def read_bed(lines):
+    """
+    Regions of a BED file, converted from its 0-based half-open intervals
+    to the 1-based inclusive ones of bcftools.
+    """
+    for line in lines:
+        if not line.strip() or line.startswith(("#", "track", "browser")):
+            continue
+        chrom, start, end = line.split()[:3]
+        yield chrom, int(start) + 1, int(end)
+
+
+def merge_regions(regions):
+    """
+    Sorts the 1-based inclusive regions and merges those overlapping or
+    adjacent, so that no variant is extracted twice.
+    """
+    merged = []
+
+    for chrom, start, end in sorted(
+        (chrom, int(start), int(end)) for chrom, start, end in regions
+    ):
+        if merged and merged[-1][0] == chrom and start <= merged[-1][2] + 1:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([chrom, start, end])
+
+    return [tuple(region) for region in merged]
+
+
+def _stage(name, tasks, files, regions=None):
+    """
+    A stage runs its tasks in parallel, each writing one bgzipped and
+    indexed file. files are the outputs combined by the following stage,
+    grouped by key in order of their order field and sorted by rank within
+    a group. Outputs already in their final place are not among them.
+    regions maps the regions files the tasks read to their contents, they
+    are written before the stage starts.
+    """
+    return {"stage": name, "tasks": tasks, "files": files, "regions": regions or {}}
+
+
+def _file(key, order, rank, path):
+    return {"key": key, "order": order, "rank": rank, "path": path}
+
+
+def _sample_sets(vcfs):
+    """
+    The VCFs grouped by the columns they are extracted into, those of a
+    dataset extracting the same samples, often one VCF per chromosome.
+    """
+    sets = dict()
+
+    for vcf in vcfs:
+        sets.setdefault((vcf["dataset"], tuple(vcf["samples"])), []).append(vcf)
+    return list(sets.values())
+
+
+def _view_args(vcf, *options):
+    return [
+        "bcftools",
+        "view",
+        "--no-version",
+        "-Oz",
+        "-s",
+        ",".join(vcf["samples"]),
+        *options,
+        vcf["vcf"],
+    ]
+
+
+def plan_extraction(job_path, vcfs, *, merge, regions=None):
+    """
+    The first stage of an export, extracting the samples of the cohort from
+    each VCF, one task per chromosome, or when regions are given, a single
+    pass over all of them.
+
+    Without merging, the chromosomes of a VCF are concatenated into its
+    output afterwards. When merging, the extractions are grouped by
+    chromosome instead, and ranked by sample set. A sample set missing a
+    chromosome contributes a header only file to its group, so that every
+    merged chromosome holds the same samples in the same order and can be
+    concatenated.
+    """
+    tasks = []
+    files = []
+
+    def add_task(args, path):
+        tasks.append({"args": args, "output": path})
+
+    if regions is not None:
+        # vcfs naming and ordering their chromosomes alike share a file
+        regions_files = dict()
+
+        for rank, sample_set in enumerate(_sample_sets(vcfs)):
+            for vcf in sample_set:
+                chromosomes = {
+                    reference_name: get_matching_chromosome(
+                        vcf["chromosomes"], reference_name
+                    )
+                    for reference_name in dict.fromkeys(
+                        chrom for chrom, _, _ in regions
+                    )
+                }
+                # in the order of the vcf, for its output to be sorted
+                lines = sorted(
+                    (vcf["chromosomes"].index(chromosomes[chrom]), start, end)
+                    for chrom, start, end in regions
+                    if chromosomes[chrom]
+                )
+
+                # if this vcf has none of the chromosomes, skip it
+                if not lines:
+                    continue
+
+                text = "".join(
+                    f"{vcf['chromosomes'][chrom]}\t{start}\t{end}\n"
+                    for chrom, start, end in lines
+                )
+                regions_files.setdefault(
+                    text, regions_path(job_path, len(regions_files))
+                )
+                args = _view_args(vcf, "-R", regions_files[text])
+                if merge:
+                    path = part_path(job_path, EXTRACT_STAGE, len(tasks))
+                    files.append(_file(None, 0, rank, path))
+                else:
+                    path = vcf["output"]
+                add_task(args, path)
+
+        return _stage(
+            EXTRACT_STAGE,
+            tasks,
+            files,
+            {path: text for text, path in regions_files.items()},
+        )
+
+    if not merge:
+        for rank, vcf in enumerate(vcfs):
+            if len(vcf["chromosomes"]) == 1:
+                add_task(_view_args(vcf), vcf["output"])
+                continue
+
+            for order, chromosome in enumerate(vcf["chromosomes"]):
+                path = part_path(job_path, EXTRACT_STAGE, len(tasks))
+                add_task(_view_args(vcf, "-r", chromosome), path)
+                files.append(_file(vcf["output"], rank, order, path))
+
+        return _stage(EXTRACT_STAGE, tasks, files)
+
+    chromosomes = list(
+        dict.fromkeys(chrom for vcf in vcfs for chrom in vcf["chromosomes"])
+    )
+
+    for rank, sample_set in enumerate(_sample_sets(vcfs)):
+        for vcf in sample_set:
+            for chromosome in vcf["chromosomes"]:
+                path = part_path(job_path, EXTRACT_STAGE, len(tasks))
+                add_task(_view_args(vcf, "-r", chromosome), path)
+                position = chromosomes.index(chromosome)
+                files.append(_file(chromosome, position, rank, path))
+
+        missing = [
+            chromosome
+            for chromosome in chromosomes
+            if not any(chromosome in vcf["chromosomes"] for vcf in sample_set)
+        ]
+        if missing:
+            path = part_path(job_path, EXTRACT_STAGE, len(tasks))
+            add_task(_view_args(sample_set[0], "-h"), path)
+            files.extend(
+                _file(chromosome, chromosomes.index(chromosome), rank, path)
+                for chromosome in missing
+            )
+
+    return _stage(EXTRACT_STAGE, tasks, files)
+
+
+def _gather(job_path, files):
+    """
+    The stage concatenating the files of each sample set within a group,
+    or None when each set has a single file in every group already.
+    """
+    sample_sets = defaultdict(list)
+
+    for file in files:
+        sample_sets[(file["order"], file["key"], file["rank"])].append(file["path"])
+
+    if all(len(paths) == 1 for paths in sample_sets.values()):
+        return None
+
+    tasks = []
+    files = []
+
+    for (order, key, rank), paths in sample_sets.items():
+        if len(paths) == 1:
+            files.append(_file(key, order, rank, paths[0]))
+            continue
+
+        path = part_path(job_path, GATHER_STAGE, len(tasks))
+        tasks.append(
+            {
+                "args": [
+                    "bcftools",
+                    "concat",
+                    "--no-version",
+                    "--allow-overlaps",
+                    "-Oz",
+                    *paths,
+                ],
+                "output": path,
+            }
+        )
+        files.append(_file(key, order, rank, path))
+
+    return _stage(GATHER_STAGE, tasks, files)
+
+
+def _groups(files):
+    groups = defaultdict(list)
+
+    for file in sorted(files, key=lambda file: (file["order"], file["rank"])):
+        groups[(file["order"], file["key"])].append(file["path"])
+    return groups
+
+
+def next_stage(job_path, stage, merge):
+    """
+    The stage combining the files of the given one, or None when the export
+    is complete. Without merging, the chromosomes of each VCF are
+    concatenated into its output. When merging, the files of a sample set
+    are first concatenated within each chromosome, each chromosome is then
+    merged across the sample sets in a tree of at most MERGE_FAN_IN inputs
+    per merge, and the merged chromosomes are concatenated into the cohort
+    file.
+    """
+    if merge and stage["stage"] == EXTRACT_STAGE:
+        if (gather := _gather(job_path, stage["files"])) is not None:
+            return gather
+
+    groups = _groups(stage["files"])
+
+    if not groups:
+        return None
+
+    if not merge:
+        tasks = [
+            {
+                "args": ["bcftools", "concat", "--no-version", "-Oz", *paths],
+                "output": key,
+            }
+            for (_, key), paths in groups.items()
+        ]
+        return _stage(CONCAT_STAGE, tasks, [])
+
+    if all(len(paths) == 1 for paths in groups.values()):
+        if stage["stage"] == CONCAT_STAGE:
+            return None
+        paths = [paths[0] for paths in groups.values()]
+        tasks = [
+            {
+                "args": ["bcftools", "concat", "--no-version", "-Oz", *paths],
+                "output": cohort_path(job_path),
+            }
+        ]
+        return _stage(CONCAT_STAGE, tasks, [])
+
+    level = (
+        int(stage["stage"].split("-")[1]) + 1
+        if stage["stage"].startswith(MERGE_STAGE)
+        else 1
+    )
+    name = f"{MERGE_STAGE}-{level}"
+    # a single chromosome merged in one go is the cohort file itself
+    last = len(groups) == 1 and len(next(iter(groups.values()))) <= MERGE_FAN_IN
+    tasks = []
+    files = []
+
+    for (order, key), paths in groups.items():
+        for rank, start in enumerate(range(0, len(paths), MERGE_FAN_IN)):
+            chunk = paths[start : start + MERGE_FAN_IN]
+
+            if len(chunk) == 1:
+                files.append(_file(key, order, rank, chunk[0]))
+                continue
+
+            path = (
+                cohort_path(job_path) if last else part_path(job_path, name, len(tasks))
+            )
+            tasks.append(
+                {
+                    "args": [
+                        "bcftools",
+                        "merge",
+                        "--no-version",
+                        "--force-samples",
+                        "-Oz",
+                        *chunk,
+                    ],
+                    "output": path,
+                }
+            )
+            if not last:
+                files.append(_file(key, order, rank, path))
+
+    return _stage(name, tasks, files)
@@ -1,21 +1,229 @@
 import json
 import os
+from urllib.parse import urlparse
 
+import boto3
 from smart_open import open as sopen
 
 from shared.apiutils import parse_request
+from shared.dynamodb import (
+    CohortJob,
+    advance_cohort_job,
+    create_cohort_job,
+    fail_cohort_job,
+    record_cohort_task,
+)
+from shared.utils.async_lambda import AsyncLambdaClient
 
-from metadata_utils import gather_metadata, extract_vcfs
+from cohort_plan import (
+    EXTRACT_STAGE,
+    cohort_path,
+    merge_regions,
+    next_stage,
+    parts_path,
+    plan_extraction,
+    read_bed,
+    stage_path,
+)
+from metadata_utils import CohortMetadata, gather_metadata, run_bcftools
 from utils import get_user_identity
 
 DPORTAL_BUCKET = os.environ["DPORTAL_BUCKET"]
+# task invocations in flight at once while publishing a stage
+MAX_IN_FLIGHT = 50
+# asynchronous invocations return once queued
+INVOKE_DEADLINE = 60
+
+
+aws_lambda = AsyncLambdaClient(MAX_IN_FLIGHT, INVOKE_DEADLINE)
+s3 = boto3.client("s3")
+
+
+def write_status(job_path, status, **fields):
+    with sopen(f"{job_path}/status.json", "w") as f:
+        json.dump({"status": status, **fields}, f)
+
+
+def delete_parts(job_path):
+    url = urlparse(parts_path(job_path))
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(Bucket=url.netloc, Prefix=f"{url.path[1:]}/"):
+        objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+        if objects:
+            s3.delete_objects(Bucket=url.netloc, Delete={"Objects": objects})
+
+
+def fail_job(job_id, job_path, error):
+    # only the first failure reports and cleans up
+    if fail_cohort_job(job_id, error):
+        write_status(job_path, "failed", message=str(error))
+        delete_parts(job_path)
+
+
+def user_path(sub):
+    return f"s3://{DPORTAL_BUCKET}/private/{get_user_identity(sub)}"
+
+
+def fail_invocation(record):
+    """
+    Fails the job of an invocation that lambda gave up on, such as a task
+    killed by the timeout or by running out of memory, which never reaches
+    the except clause of the handler. Sent by the on-failure destination.
+    """
+    request = record["requestPayload"]
+    error = (record.get("responsePayload") or {}).get(
+        "errorMessage", record["requestContext"]["condition"]
+    )
+    print(f"Invocation failed: {error}")
+
+    # reporting a failure failed, do not report that in turn
+    if "Records" in request:
+        return
+
+    if task := request.get("cohortTask"):
+        fail_job(task["jobId"], task["jobPath"], error)
+        return
+
+    job_path = f"{user_path(request['sub'])}/cohorts/{request['jobId']}"
+    try:
+        CohortJob.get(request["jobId"])
+    except CohortJob.DoesNotExist:
+        # failed before the tasks were planned
+        write_status(job_path, "failed", message=str(error))
+        return
+    fail_job(request["jobId"], job_path, error)
+
+
+def cohort_regions(event, variants, user_path):
+    """
+    The regions of a g_variants cohort, sorted and merged. They are listed
+    in the job, or read from a BED file among the files of the user, and
+    default to the single region of the query.
+    """
+    if regions := event.get("regions"):
+        regions = [
+            (region["referenceName"], region["start"], region["end"])
+            for region in regions
+        ]
+    elif bed := event.get("bed"):
+        with sopen(f"{user_path}/{bed}") as f:
+            regions = list(read_bed(f))
+    else:
+        assert (
+            len(variants.start) == len(variants.end) == 1
+        ), "start and end must not be intervals"
+        regions = [(variants.reference_name, variants.start[0], variants.end[0])]
+
+    return merge_regions(regions)
+
+
+def start_stage(job: CohortJob, stage):
+    """
+    Publishes the tasks of the stage the job has just entered, one
+    invocation each. Stages without tasks are passed over, and the job is
+    finished when no stage is left.
+    """
+    while stage is not None and not stage["tasks"]:
+        following = next_stage(job.jobPath, stage, job.merge)
+        advance_cohort_job(
+            job.jobId,
+            stage["stage"],
+            following and following["stage"],
+            following and len(following["tasks"]),
+        )
+        stage = following
+
+    if stage is None:
+        delete_parts(job.jobPath)
+        write_status(job.jobPath, "completed")
+        print(f"Cohort job {job.jobId} completed")
+        return
+
+    for path, text in stage.pop("regions").items():
+        with sopen(path, "w") as f:
+            f.write(text)
+    with sopen(stage_path(job.jobPath, stage["stage"]), "w") as f:
+        json.dump(stage, f)
+    write_status(
+        job.jobPath,
+        "running",
+        stage=stage["stage"],
+        totalTasks=len(stage["tasks"]),
+    )
+    print(f"Cohort job {job.jobId} {stage['stage']}: {len(stage['tasks'])} tasks")
+
+    futures = [
+        aws_lambda.submit(
+            FunctionName=os.environ["AWS_LAMBDA_FUNCTION_NAME"],
+            InvocationType="Event",
+            Payload=json.dumps(
+                {
+                    "cohortTask": {
+                        "jobId": job.jobId,
+                        "jobPath": job.jobPath,
+                        "stage": stage["stage"],
+                        "task": task,
+                    }
+                }
+            ),
+        )
+        for task in range(len(stage["tasks"]))
+    ]
+    for future in futures:
+        future.result()
+
+
+def run_cohort_task(job_id, job_path, stage_name, task):
+    """
+    Runs one task of a stage. The task finishing the stage plans the next
+    one and publishes it.
+    """
+    try:
+        with sopen(stage_path(job_path, stage_name)) as f:
+            stage = json.load(f)
+        command = stage["tasks"][task]
+        run_bcftools(command["args"], command["output"])
+        job = record_cohort_task(job_id, stage_name, task)
+
+        # stale or failed jobs are left as they are
+        if job is None or not job.stage_done():
+            return
+
+        following = next_stage(job_path, stage, job.merge)
+        if advance_cohort_job(
+            job_id,
+            stage_name,
+            following and following["stage"],
+            following and len(following["tasks"]),
+        ):
+            start_stage(job, following)
+    except Exception as e:
+        print(f"Cohort job {job_id} {stage_name} task {task} failed: {e}")
+        fail_job(job_id, job_path, e)
 
 
 def lambda_handler(event, context):
+    if "Records" in event:
+        for record in event["Records"]:
+            fail_invocation(json.loads(record["Sns"]["Message"]))
+        return
+
+    if "cohortTask" in event:
+        task = event["cohortTask"]
+        print(f"Cohort job {task['jobId']} {task['stage']} task {task['task']}")
+        return run_cohort_task(
+            task["jobId"], task["jobPath"], task["stage"], task["task"]
+        )
+
     print("Backend Event Received: {}".format(json.dumps(event)))
     sub = event["sub"]
     job_id = event["jobId"]
     scope = event["scope"]
+    # a single multi-sample file instead of one per source vcf
+    merge = bool(event.get("merge", False))
+    # the metadata is always written as parquet, csv on request
+    metadata_formats = ("parquet", "csv") if event.get("metadataCsv") else ("parquet",)
     query_event = {
         "httpMethod": "POST",
         "requestContext": {
@@ -36,32 +244,45 @@ def lambda_handler(event, context):
         return {"success": False, "errors": errors}
 
     sub = request_params.sub
-    identity_id = get_user_identity(sub)
-    job_path = f"s3://{DPORTAL_BUCKET}/private/{identity_id}/cohorts/{job_id}"
+    private_path = user_path(sub)
+    job_path = f"{private_path}/cohorts/{job_id}"
+    job = None
 
     try:
-        with sopen(f"{job_path}/status.json", "w") as f:
-            json.dump({"status": "running"}, f)
+        write_status(job_path, "running")
+        regions = None
         if scope == "individuals":
             print("Extraction using individuals")
-            metadata_file_path = gather_metadata(request_params)
-            print("Metadata file name: ", metadata_file_path)
-            extract_vcfs(job_path, metadata_file_path)
-            print("Extracted VCFs")
         if scope == "g_variants":
             print("Extraction using g_variants")
-            metadata_file_path = gather_metadata(request_params)
-            print("Metadata file name: ", metadata_file_path)
-            extract_vcfs(
-                job_path, metadata_file_path, request_params.query.request_parameters
+            regions = cohort_regions(
+                event,
+                request_params.query.request_parameters,
+                private_path,
+            )
+            print(f"Extracting {len(regions)} regions")
+        metadata_path = gather_metadata(request_params)
+        print("Metadata path: ", metadata_path)
+
+        with CohortMetadata(metadata_path) as metadata:
+            vcfs = metadata.vcfs(job_path)
+            metadata.write(
+                job_path,
+                {
+                    vcf["vcf"]: cohort_path(job_path) if merge else vcf["output"]
+                    for vcf in vcfs
+                },
+                metadata_formats,
             )
-            print("Extracted VCFs")
-        with sopen(f"{job_path}/status.json", "w") as f:
-            json.dump({"status": "completed"}, f)
+        stage = plan_extraction(job_path, vcfs, merge=merge, regions=regions)
+        job = create_cohort_job(
+            job_id, sub, job_path, merge, EXTRACT_STAGE, len(stage["tasks"])
+        )
+        start_stage(job, stage)
     except Exception as e:
         print("Error", str(e))
-        with sopen(f"{job_path}/status.json", "w") as f:
-            json.dump({"status": "failed", "message": str(e)}, f)
+        if job is None or fail_cohort_job(job_id, e):
+            write_status(job_path, "failed", message=str(e))
 
 
 if __name__ == "__main__":
@@ -71,6 +292,8 @@ if __name__ == "__main__":
         "sub": "f98e24c8-2011-70ae-9d93-084eb3f4b282",
         "projects": ["Example Query Project"],
         "scope": "individuals",
+        "merge": False,
+        "metadataCsv": False,
         "query": {"filters": [], "requestedGranularity": "record"},
         "meta": {"apiVersion": "v2.0"},
     }
@@ -79,6 +302,11 @@ if __name__ == "__main__":
     #     "jobId": "test_var_cohort",
     #     "projects": ["Example Query Project"],
     #     "scope": "g_variants",
+    #     # or "bed": "<key of a BED file among the user's files>"
+    #     "regions": [
+    #         {"referenceName": "1", "start": 546801, "end": 546810},
+    #         {"referenceName": "1", "start": 546805, "end": 546900},
+    #     ],
     #     "sub": "f98e24c8-2011-70ae-9d93-084eb3f4b282",
     #     "query": {
     #         "filters": [],
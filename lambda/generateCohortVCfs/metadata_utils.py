@@ -1,18 +1,36 @@
-import csv
 import json
-from collections import defaultdict
+import os
+import shutil
 import subprocess
+import tempfile
+import uuid
+from urllib.parse import urlparse
 
+import boto3
+import duckdb
 from smart_open import open as sopen
 
 from shared.athena import Individual, entity_search_conditions
-from shared.apiutils import RequestParams, Granularity, RequestQueryParams
+from shared.apiutils import RequestParams, Granularity
 from shared.athena.common import ApprovedProjects
-from shared.utils import ENV_ATHENA, get_matching_chromosome
+from shared.utils import ENV_ATHENA
 
 from utils import run_custom_query, generate_aliases
 
 
+REGION = os.environ["AWS_REGION"]
+# formats the cohort metadata can be written in
+COPY_OPTIONS = {
+    "parquet": "FORMAT PARQUET, COMPRESSION SNAPPY",
+    "csv": "FORMAT CSV, HEADER",
+}
+# read size when copying extracted output into its upload
+EXTRACTION_CHUNK_BYTES = 1024 * 1024
+
+
+s3 = boto3.client("s3")
+
+
 def _generate_query(conditions=""):
     query = f"""
     SELECT {generate_aliases()}
@@ -31,6 +49,10 @@ def _generate_query(conditions=""):
 
 
 def gather_metadata(request: RequestParams):
+    """
+    Unloads the metadata of the cohort as parquet and returns the S3 folder
+    holding it.
+    """
     conditions, execution_parameters = entity_search_conditions(
         request.query.filters,
         "individuals",
@@ -47,26 +69,28 @@ def gather_metadata(request: RequestParams):
     ).get_approved_projects()
     projects_statement = ",".join([" ? " for a in approved_projects])
 
+    # every entity is joined on the project of the individual
     if conditions:
         conditions += f"""
         AND individuals._projectName IN ({projects_statement})
-        AND biosamples._projectName IN ({projects_statement})
-        AND runs._projectName IN ({projects_statement})
-        AND analyses._projectName IN ({projects_statement})
-        AND datasets._projectName IN ({projects_statement})
         """
-        execution_parameters += approved_projects * 5
+        execution_parameters += approved_projects
     else:
         conditions = f"""
         WHERE individuals._projectName IN ({projects_statement})
-        AND biosamples._projectName IN ({projects_statement})
-        AND runs._projectName IN ({projects_statement})
-        AND analyses._projectName IN ({projects_statement})
-        AND datasets._projectName IN ({projects_statement})
         """
-        execution_parameters = approved_projects * 5
+        execution_parameters = approved_projects
+
+    metadata_path = (
+        f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/cohorts/"
+        f"{uuid.uuid4().hex}/"
+    )
     # this is the query we will run
-    query = _generate_query(conditions)
+    query = f"""
+    UNLOAD ({_generate_query(conditions)})
+    TO '{metadata_path}'
+    WITH (format = 'PARQUET', compression = 'SNAPPY')
+    """
 
     exec_id = run_custom_query(
         query,
@@ -76,97 +100,194 @@ def gather_metadata(request: RequestParams):
         return_id=True,
     )
 
-    metadata_file_name = (
-        f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{exec_id}.csv"
-    )
-    return metadata_file_name
-
-
-def extract_vcfs(job_path, metadata_file_path, variants: RequestQueryParams = None):
-    # this contains samples we must extract from relevant vcf files
-    vcf_samples = defaultdict(set)
-    vcf_chromosome_map = dict()
-
-    with sopen(metadata_file_path) as s3file:
-        reader = csv.DictReader(s3file)
-
-        for row in reader:
-            vcf_sample_id = row["analyses_vcfSampleId"]
-            project_name = row["datasets_projectName"]
-            dataset_id = row["datasets_datasetName"]
-            vcfs = json.loads(row["datasets_vcfLocations"])
-
-            for vcf in vcfs:
-                vcf_samples[(project_name, dataset_id, vcf)].add(vcf_sample_id)
-                vcf_chromosome_map[(project_name, dataset_id, vcf)] = [
-                    entry["chromosomes"]
-                    for entry in json.loads(row["datasets_vcfChromosomeMap"])
-                    if entry["vcf"] == vcf
-                ][0]
-
-    vcf_rename = dict()
-    for (
-        (project_name, dataset_id, vcf),
-        samples,
-    ) in vcf_samples.items():
-        samples = list(samples)
-        file_name = vcf.split("/")[-1]
-
-        if file_name.endswith(".gz"):
-            file_name = file_name[:-3]
-
-        vcf_rename[vcf] = f"{job_path}/{project_name}-{dataset_id}-{file_name}"
-        args = ["bcftools", "view", "-s", ",".join(samples)]
-
-        if variants:
-            start = variants.start
-            end = variants.end
-            reference_name = variants.reference_name
-            
-            chromosome_name = get_matching_chromosome(
-                vcf_chromosome_map[(project_name, dataset_id, vcf)], reference_name
-            )
+    if exec_id is None:
+        raise Exception("Gathering the cohort metadata failed")
 
-            # if this vcf does not have the chromosome name, skip it
-            if not chromosome_name:
-                continue
+    return metadata_path
 
-            assert len(start) == len(end) == 1, "start and end must not be intervals"
-            start = start[0]
-            end = end[0]
 
-            args += [
-                "-r",
-                f"{chromosome_name}:{start}-{end}",
-            ]
-        args += [f'{vcf}']
+class CohortMetadata:
+    """
+    The unloaded metadata of a cohort, read by duckdb straight from S3.
+    Each VCF takes the samples of the rows of its dataset, so the sample
+    sets are aggregated per dataset and the VCF locations and chromosome
+    maps of a dataset are decoded once.
+    """
 
-        print(f"Running command: {' '.join(args)}")
-        query_process = subprocess.Popen(
-            args, stdout=subprocess.PIPE, cwd="/tmp", encoding="ascii"
+    def __init__(self, metadata_path):
+        self.metadata_path = metadata_path
+        self.con = duckdb.connect()
+        self.con.execute("SET home_directory='/tmp';")
+        self.con.execute("INSTALL httpfs; LOAD httpfs;")
+        self.con.execute(f"SET s3_region='{REGION}';")
+        self.con.execute(f"SET s3_endpoint='s3.{REGION}.amazonaws.com';")
+        self.con.execute(
+            f"""
+            CREATE VIEW metadata AS
+            SELECT * FROM read_parquet('{metadata_path}*')
+            """
         )
 
-        with sopen(vcf_rename[vcf], mode="w") as s3file:
-            s3file.write(query_process.stdout.read())
-
-    with sopen(metadata_file_path) as s3infile, sopen(
-        f"{job_path}/cohort-metadata.csv", "w"
-    ) as s3outfile:
-        reader = csv.DictReader(s3infile)
-        writer = csv.DictWriter(
-            s3outfile,
-            fieldnames=[
-                field
-                for field in reader.fieldnames
-                if field != "datasets_vcfChromosomeMap"
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.con.close()
+        url = urlparse(self.metadata_path)
+        paginator = s3.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=url.netloc, Prefix=url.path[1:]):
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                s3.delete_objects(Bucket=url.netloc, Delete={"Objects": objects})
+
+    def datasets(self):
+        return self.con.execute(
+            """
+            SELECT DISTINCT
+                datasets_projectName,
+                datasets_datasetName,
+                datasets_vcfLocations,
+                datasets_vcfChromosomeMap
+            FROM metadata
+            ORDER BY datasets_projectName, datasets_datasetName
+            """
+        ).fetchall()
+
+    def vcfs(self, job_path):
+        """
+        The VCFs holding the cohort, each with its dataset, the samples to
+        extract from it, its chromosomes and the file it is exported to on
+        its own.
+        """
+        dataset_samples = {
+            (project_name, dataset_id): samples
+            for project_name, dataset_id, samples in self.con.execute(
+                """
+                SELECT
+                    datasets_projectName,
+                    datasets_datasetName,
+                    list_sort(list(DISTINCT analyses_vcfSampleId))
+                FROM metadata
+                WHERE analyses_vcfSampleId IS NOT NULL
+                GROUP BY datasets_projectName, datasets_datasetName
+                """
+            ).fetchall()
+        }
+        vcfs = []
+
+        for project_name, dataset_id, locations, chromosome_map in self.datasets():
+            chromosomes = {
+                entry["vcf"]: entry["chromosomes"]
+                for entry in json.loads(chromosome_map)
+            }
+            prefix = f"{job_path}/{project_name}-{dataset_id}"
+            vcfs.extend(
+                {
+                    "vcf": vcf,
+                    "dataset": f"{project_name}:{dataset_id}",
+                    "samples": dataset_samples.get((project_name, dataset_id), []),
+                    "chromosomes": chromosomes[vcf],
+                    "output": f"{prefix}-{_output_name(vcf)}",
+                }
+                for vcf in json.loads(locations)
+            )
+
+        return vcfs
+
+    def write(self, job_path, vcf_locations, formats=("parquet",)):
+        """
+        Writes the metadata of the cohort, pointing at the exported files,
+        as cohort-metadata.parquet and optionally cohort-metadata.csv.
+        """
+        self.con.execute(
+            """
+            CREATE TABLE locations (
+                project_name VARCHAR, dataset_id VARCHAR, vcf_locations VARCHAR
+            )
+            """
+        )
+        self.con.executemany(
+            "INSERT INTO locations VALUES (?, ?, ?)",
+            [
+                (
+                    project_name,
+                    dataset_id,
+                    json.dumps([vcf_locations[vcf] for vcf in json.loads(locations)]),
+                )
+                for project_name, dataset_id, locations, _ in self.datasets()
             ],
         )
-        writer.writeheader()
 
-        for row in reader:
-            del row["datasets_vcfChromosomeMap"]
+        for file_format in formats:
+            self.con.execute(
+                f"""
+                COPY (
+                    SELECT metadata.* EXCLUDE (datasets_vcfChromosomeMap)
+                    REPLACE (locations.vcf_locations AS datasets_vcfLocations)
+                    FROM metadata
+                    JOIN locations
+                    ON metadata.datasets_projectName = locations.project_name
+                    AND metadata.datasets_datasetName = locations.dataset_id
+                ) TO '{job_path}/cohort-metadata.{file_format}'
+                ({COPY_OPTIONS[file_format]})
+                """
+            )
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def _output_name(vcf):
+    file_name = vcf.split("/")[-1]
+
+    for suffix in (".gz", ".vcf", ".bcf"):
+        file_name = file_name.removesuffix(suffix)
 
-            vcfs = [vcf_rename[vcf] for vcf in json.loads(row["datasets_vcfLocations"])]
-            row["datasets_vcfLocations"] = json.dumps(vcfs)
+    return f"{file_name}.vcf.gz"
+
+
+def run_bcftools(args, output_path):
+    """
+    Streams the bgzipped output of bcftools into a multipart upload at
+    output_path, then indexes the uploaded file in place. Nothing larger
+    than a part of the upload is held in memory.
+    """
+    print(f"Running command: {' '.join(args)}")
+
+    with tempfile.TemporaryFile(dir="/tmp") as stderr:
+        with sopen(output_path, "wb") as s3file:
+            query_process = subprocess.Popen(
+                args, stdout=subprocess.PIPE, stderr=stderr, cwd="/tmp"
+            )
+            shutil.copyfileobj(query_process.stdout, s3file, EXTRACTION_CHUNK_BYTES)
+            query_process.stdout.close()
+
+            # raising inside the upload aborts it, no partial file is left behind
+            if query_process.wait() != 0:
+                stderr.seek(0)
+                raise ExtractionError(
+                    f"bcftools {args[1]} of {output_path} failed: "
+                    f"{stderr.read().decode()}"
+                )
+
+    # bcftools can only write an index next to a local file, so the uploaded
+    # file is indexed over S3 and the small index uploaded beside it
+    with tempfile.TemporaryDirectory(dir="/tmp") as index_dir:
+        index_path = f"{index_dir}/index.csi"
+        index_process = subprocess.run(
+            ["bcftools", "index", "--csi", "--output", index_path, output_path],
+            capture_output=True,
+            cwd="/tmp",
+        )
+
+        if index_process.returncode != 0:
+            raise ExtractionError(
+                f"Indexing {output_path} failed: {index_process.stderr.decode()}"
+            )
 
-            writer.writerow(row)
+        with open(index_path, "rb") as index_file, sopen(
+            f"{output_path}.csi", "wb"
+        ) as s3file:
+            shutil.copyfileobj(index_file, s3file)
@@ -1,9 +1,8 @@
 import json
-from concurrent.futures import ThreadPoolExecutor
 
 import jsons
 
-from shared.athena import entity_search_conditions
+from shared.athena import entity_search_conditions, get_record_page
 from shared.apiutils import (
     RequestParams,
     Granularity,
@@ -33,17 +32,6 @@ def get_bool_query(conditions=""):
     return query
 
 
-def get_record_query(skip, limit, conditions=""):
-    query = f"""
-    SELECT * FROM "{{database}}"."{{table}}"
-    {conditions}
-    ORDER BY id
-    OFFSET {skip}
-    LIMIT {limit};
-    """
-    return query
-
-
 def route(request: RequestParams):
     conditions, execution_parameters = entity_search_conditions(
         request.query.filters, "analyses", "analyses"
@@ -82,36 +70,16 @@ def route(request: RequestParams):
         return bundle_response(200, response)
 
     if request.query.requested_granularity == Granularity.RECORD:
-        executor = ThreadPoolExecutor(2)
-        # records fetching
-        record_query = get_record_query(
-            request.query.pagination.skip, request.query.pagination.limit, conditions
-        )
-        record_future = executor.submit(
-            Analysis.get_by_query,
-            record_query,
-            execution_parameters=execution_parameters,
-            projects=request.projects,
-            sub=request.sub,
-        )
-        # counts fetching
-        count_query = get_count_query(conditions)
-        count_future = executor.submit(
-            Analysis.get_count_by_query,
-            count_query,
-            execution_parameters=execution_parameters,
-            projects=request.projects,
-            sub=request.sub,
+        analyses, count, next_page = get_record_page(
+            Analysis, request, conditions, execution_parameters
         )
-        executor.shutdown()
-        count = count_future.result()
-        analyses = record_future.result()
         response = build_beacon_resultset_response(
             jsons.dump(analyses, strip_privates=True),
             count,
             request,
             {},
             DefaultSchemas.ANALYSES,
+            next_page=next_page,
         )
         print("Returning Response: {}".format(json.dumps(response)))
         return bundle_response(200, response)
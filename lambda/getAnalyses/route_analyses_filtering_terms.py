@@ -8,11 +8,11 @@ from shared.apiutils import (
     build_filtering_terms_response,
     bundle_response,
 )
-from shared.athena import run_custom_query
+from shared.athena import get_catalog_filtering_terms, run_custom_query
 from shared.utils import ENV_ATHENA
 
 
-def route(request: RequestParams):
+def query_filtering_terms(request: RequestParams):
     query = f"""
     SELECT DISTINCT term, label, type 
     FROM "{ENV_ATHENA.ATHENA_TERMS_TABLE}"
@@ -37,6 +37,21 @@ def route(request: RequestParams):
                 continue
             term, label, typ = row
             filteringTerms.append({"id": term, "label": label, "type": typ})
+    return filteringTerms
+
+
+def route(request: RequestParams):
+    filteringTerms = get_catalog_filtering_terms(
+        skip=request.query.pagination.skip,
+        limit=request.query.pagination.limit,
+        search=request.query._search,
+        kind="analyses",
+        projects=request.projects,
+        sub=request.sub,
+    )
+    # until the indexer has published the catalog
+    if filteringTerms is None:
+        filteringTerms = query_filtering_terms(request)
 
     response = build_filtering_terms_response(filteringTerms, [], request)
 
@@ -3,7 +3,7 @@ import csv
 
 from smart_open import open as sopen
 
-from shared.athena import run_custom_query
+from shared.athena import get_catalog_filtering_terms, run_custom_query
 from shared.dynamodb import Ontology
 from shared.utils import ENV_ATHENA
 from shared.apiutils import (
@@ -13,7 +13,7 @@ from shared.apiutils import (
 )
 
 
-def route(request: RequestParams, dataset_id):
+def query_filtering_terms(request: RequestParams, dataset_id):
     query = f"""
         SELECT DISTINCT term, label, type 
         FROM "{ENV_ATHENA.ATHENA_TERMS_TABLE}"
@@ -82,7 +82,6 @@ def route(request: RequestParams, dataset_id):
         execution_parameters=execution_parameters,
     )
     filteringTerms = []
-    ontologies = set()
 
     with sopen(
         f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{exec_id}.csv"
@@ -93,8 +92,23 @@ def route(request: RequestParams, dataset_id):
             if n == 0:
                 continue
             term, label, typ = row
-            ontologies.add(term.split(":")[0].lower())
             filteringTerms.append({"id": term, "label": label, "type": typ})
+    return filteringTerms
+
+
+def route(request: RequestParams, dataset_id):
+    filteringTerms = get_catalog_filtering_terms(
+        skip=request.query.pagination.skip,
+        limit=request.query.pagination.limit,
+        search=request.query._search,
+        dataset_id=dataset_id,
+        projects=request.projects,
+        sub=request.sub,
+    )
+    # until the indexer has published the catalog
+    if filteringTerms is None:
+        filteringTerms = query_filtering_terms(request, dataset_id)
+    ontologies = {term["id"].split(":")[0].lower() for term in filteringTerms}
 
     resources = [
         ontology.attribute_values for ontology in Ontology.batch_get(ontologies)
@@ -2,7 +2,7 @@ from collections import defaultdict
 import json
 import base64
 
-from shared.variantutils import perform_variant_search
+from shared.variantutils import get_catalog_datasets, perform_variant_search
 from shared.utils import ENV_ATHENA
 from shared.athena import (
     Dataset,
@@ -72,14 +72,24 @@ def route(request: RequestParams, dataset_id):
         )
         datasets, samples = parse_datasets_with_samples(exec_id)
     else:
-        execution_parameters = [f"'{query_params.assembly_id}'", f"'{dataset_id}'"]
-        query = datasets_query_fast()
-        datasets = Dataset.get_by_query(
-            query,
-            execution_parameters=execution_parameters,
+        datasets = get_catalog_datasets(
+            query_params.assembly_id,
             projects=request.projects,
             sub=request.sub,
+            dataset_id=dataset_id,
         )
+        if datasets is None:
+            execution_parameters = [
+                f"'{query_params.assembly_id}'",
+                f"'{dataset_id}'",
+            ]
+            query = datasets_query_fast()
+            datasets = Dataset.get_by_query(
+                query,
+                execution_parameters=execution_parameters,
+                projects=request.projects,
+                sub=request.sub,
+            )
         samples = []
 
     query_responses = perform_variant_search(
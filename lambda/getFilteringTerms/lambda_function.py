@@ -2,11 +2,12 @@ import csv
 
 from smart_open import open as sopen
 
-from shared.athena import run_custom_query
+from shared.athena import get_catalog_filtering_terms, run_custom_query
 from shared.dynamodb import Ontology
 from shared.utils import ENV_ATHENA
 from shared.apiutils import (
     LambdaRouter,
+    RequestParams,
     build_filtering_terms_response,
     parse_request,
     bundle_response,
@@ -15,12 +16,7 @@ from shared.apiutils import (
 router = LambdaRouter()
 
 
-@router.attach("/filtering_terms", "post")
-def get_filtering_terms(event, context):
-    request, errors, status = parse_request(event)
-    if errors:
-        return bundle_response(status, errors)
-    
+def query_filtering_terms(request: RequestParams):
     query = f"""
     SELECT DISTINCT term, label, type 
     FROM "{ENV_ATHENA.ATHENA_TERMS_TABLE}"
@@ -32,7 +28,6 @@ def get_filtering_terms(event, context):
         query, return_id=True, projects=request.projects, sub=request.sub
     )
     filteringTerms = []
-    ontologies = set()
 
     with sopen(
         f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{exec_id}.csv"
@@ -43,8 +38,27 @@ def get_filtering_terms(event, context):
             if n == 0:
                 continue
             term, label, typ = row
-            ontologies.add(term.split(":")[0].lower())
             filteringTerms.append({"id": term, "label": label, "type": typ})
+    return filteringTerms
+
+
+@router.attach("/filtering_terms", "post")
+def get_filtering_terms(event, context):
+    request, errors, status = parse_request(event)
+    if errors:
+        return bundle_response(status, errors)
+
+    filteringTerms = get_catalog_filtering_terms(
+        skip=request.query.pagination.skip,
+        limit=request.query.pagination.limit,
+        search=request.query._search,
+        projects=request.projects,
+        sub=request.sub,
+    )
+    # until the indexer has published the catalog
+    if filteringTerms is None:
+        filteringTerms = query_filtering_terms(request)
+    ontologies = {term["id"].split(":")[0].lower() for term in filteringTerms}
 
     resources = [
         ontology.attribute_values for ontology in Ontology.batch_get(ontologies)
@@ -1,10 +1,13 @@
 from shared.apiutils import LambdaRouter, parse_request, bundle_response, require_quota
 from shared.cognitoutils import require_permissions
+from shared.utils import ENV_CONFIG
 
 from route_g_variants import route as route_g_variants
 from route_g_variants_id import route as route_g_variants_id
 from route_g_variants_id_individuals import route as route_g_variants_id_individuals
 from route_g_variants_id_biosamples import route as route_g_variants_id_biosamples
+from route_variant_queries import route_status as route_variant_queries_id
+from route_variant_queries import route_submit as route_variant_queries
 
 router = LambdaRouter()
 
@@ -50,6 +53,32 @@ def get_g_variants_biosamples(event, context):
     return route_g_variants_id_biosamples(request_params, variant_id)
 
 
+@router.attach("/variant_queries", "post", require_permission_and_quota)
+def submit_variant_query(event, context):
+    # jobs are not bound by the api gateway timeout, so allow larger ranges
+    request_params, errors, status = parse_request(
+        event, max_base_range=ENV_CONFIG.CONFIG_MAX_VARIANT_QUERY_JOB_BASE_RANGE
+    )
+    if errors:
+        return bundle_response(status, errors)
+    return route_variant_queries(request_params)
+
+
+@router.attach(
+    "/variant_queries/{id}", "get", require_permissions("sbeacon_query.create")
+)
+@router.attach(
+    "/variant_queries/{id}", "post", require_permissions("sbeacon_query.create")
+)
+def get_variant_query(event, context):
+    # polling is not charged against the quota, the submission was
+    request_params, errors, status = parse_request(event)
+    if errors:
+        return bundle_response(status, errors)
+    job_id = event["pathParameters"]["id"]
+    return route_variant_queries_id(request_params, job_id)
+
+
 def lambda_handler(event, context):
     return router.handle_route(event, context)
 
@@ -2,7 +2,11 @@ from collections import defaultdict
 import json
 import base64
 
-from shared.variantutils import perform_variant_search
+from shared.variantutils import (
+    get_catalog_datasets,
+    perform_variant_search,
+    perform_variant_search_page,
+)
 from shared.utils import ENV_ATHENA
 from shared.athena import (
     Dataset,
@@ -20,6 +24,8 @@ from shared.apiutils import (
     build_beacon_count_response,
     bundle_response,
     get_variant_entry,
+    decode_page_token,
+    encode_page_token,
 )
 
 
@@ -45,15 +51,15 @@ def datasets_query_fast():
     return query
 
 
-def route(request: RequestParams):
+def get_datasets(request: RequestParams):
+    """
+    Datasets of the requested assembly visible to the user, with the
+    samples selected by the filters (empty when there are no filters).
+    """
     conditions, execution_parameters = entity_search_conditions(
         request.query.filters, "analyses", "analyses", id_modifier="A.id"
     )
     query_params = request.query.request_parameters
-    check_all = request.query.include_resultset_responses in (
-        IncludeResultsetResponses.HIT,
-        IncludeResultsetResponses.ALL,
-    )
 
     if conditions:
         execution_parameters.append(query_params.assembly_id)
@@ -67,14 +73,31 @@ def route(request: RequestParams):
         )
         datasets, samples = parse_datasets_with_samples(exec_id)
     else:
-        query = datasets_query_fast()
-        datasets = Dataset.get_by_query(
-            query,
-            execution_parameters=[query_params.assembly_id],
-            projects=request.projects,
-            sub=request.sub,
+        datasets = get_catalog_datasets(
+            query_params.assembly_id, projects=request.projects, sub=request.sub
         )
+        if datasets is None:
+            query = datasets_query_fast()
+            datasets = Dataset.get_by_query(
+                query,
+                execution_parameters=[query_params.assembly_id],
+                projects=request.projects,
+                sub=request.sub,
+            )
         samples = []
+    return datasets, samples
+
+
+def route(request: RequestParams):
+    query_params = request.query.request_parameters
+    check_all = request.query.include_resultset_responses in (
+        IncludeResultsetResponses.HIT,
+        IncludeResultsetResponses.ALL,
+    )
+    datasets, samples = get_datasets(request)
+
+    if request.query.requested_granularity == Granularity.RECORD and check_all:
+        return route_records(request, datasets, samples)
 
     query_responses = perform_variant_search(
         datasets=datasets,
@@ -169,5 +192,69 @@ def route(request: RequestParams):
         return bundle_response(200, response)
 
 
+def route_records(request: RequestParams, datasets, samples):
+    query_params = request.query.request_parameters
+    pagination = request.query.pagination
+    cursor = (
+        decode_page_token(pagination.current_page)
+        if pagination.current_page
+        else None
+    )
+
+    hits, next_cursor = perform_variant_search_page(
+        datasets=datasets,
+        reference_name=query_params.reference_name,
+        reference_bases=query_params.reference_bases,
+        alternate_bases=query_params.alternate_bases,
+        start=query_params.start,
+        end=query_params.end,
+        variant_type=query_params.variant_type,
+        variant_min_length=query_params.variant_min_length,
+        variant_max_length=query_params.variant_max_length,
+        dataset_samples=samples,
+        # skip is relative to the start of the search, the cursor replaces it
+        skip=0 if cursor else pagination.skip,
+        limit=pagination.limit,
+        cursor=cursor,
+    )
+
+    results = list()
+    variant_info_mapping = dict()
+
+    for variant, query_response in hits:
+        chrom, pos, ref, alt, typ = variant.split("\t")
+        internal_id = f"{query_params.assembly_id}\t{chrom}\t{pos}\t{ref}\t{alt}"
+        variant_internal_id = base64.b64encode(f"{internal_id}".encode()).decode()
+        results.append(
+            get_variant_entry(
+                variant_internal_id,
+                query_params.assembly_id,
+                ref,
+                alt,
+                int(pos),
+                int(pos) + len(alt),
+                typ,
+            )
+        )
+        variant_info_mapping[variant_internal_id] = {
+            "projectName": query_response.project_name,
+            "datasetName": query_response.dataset_name,
+        }
+
+    # the walk stops at the page boundary, so the total is unknown, the
+    # nextPage token tells whether there are more results
+    response = build_beacon_resultset_response(
+        results,
+        None,
+        request,
+        {},
+        DefaultSchemas.GENOMICVARIATIONS,
+        variant_info_mapping,
+        next_page=encode_page_token(next_cursor) if next_cursor else None,
+    )
+    print("Returning Response: {}".format(json.dumps(response)))
+    return bundle_response(200, response)
+
+
 if __name__ == "__main__":
     pass
@@ -2,7 +2,11 @@ from collections import defaultdict
 import json
 import base64
 
-from shared.variantutils import perform_variant_search
+from shared.variantutils import (
+    filter_datasets_by_presence,
+    get_catalog_datasets,
+    perform_variant_search,
+)
 from shared.utils import ENV_ATHENA
 from shared.athena import (
     Dataset,
@@ -73,15 +77,24 @@ def route(request: RequestParams, variant_id):
         )
         datasets, samples = parse_datasets_with_samples(exec_id)
     else:
-        query = datasets_query_fast()
-        datasets = Dataset.get_by_query(
-            query,
-            execution_parameters=[assembly_id],
-            projects=request.projects,
-            sub=request.sub,
+        datasets = get_catalog_datasets(
+            assembly_id, projects=request.projects, sub=request.sub
         )
+        if datasets is None:
+            query = datasets_query_fast()
+            datasets = Dataset.get_by_query(
+                query,
+                execution_parameters=[assembly_id],
+                projects=request.projects,
+                sub=request.sub,
+            )
         samples = []
 
+    # skip the vcfs known not to have a record at this position
+    datasets, samples = filter_datasets_by_presence(
+        datasets, samples, reference_name, pos + 1
+    )
+
     variants = set()
     results = list()
     found = set()
@@ -4,7 +4,11 @@ import base64
 
 import jsons
 
-from shared.variantutils import perform_variant_search
+from shared.variantutils import (
+    filter_datasets_by_presence,
+    get_catalog_datasets,
+    perform_variant_search,
+)
 from shared.utils import ENV_ATHENA
 from shared.athena import (
     Biosample,
@@ -12,6 +16,7 @@ from shared.athena import (
     parse_datasets_with_samples,
     entity_search_conditions,
     run_custom_query,
+    stage_carriers,
 )
 from shared.apiutils import (
     RequestParams,
@@ -46,68 +51,21 @@ def datasets_query_fast():
     return query
 
 
-def get_count_query(dataset_id, sample_names):
-    query = f"""
-    SELECT COUNT(id)
-    FROM 
-        "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}" JOIN "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"
-    ON 
-        "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}".biosampleid
-        =
-        "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}".id
-    WHERE 
-            "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"._datasetid='{dataset_id}'
-        AND 
-            "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}"._datasetid='{dataset_id}'
-        AND
-            "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"._vcfsampleid
-        IN 
-            ({','.join([f"'{sn}'" for sn in sample_names])})
-    """
-    return query
-
-
-def get_bool_query(dataset_id, sample_names):
+def get_record_query(query_id):
     query = f"""
-    SELECT 1
+    SELECT DISTINCT B.*
     FROM 
-        "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}" JOIN "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"
+        "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}" B
+    JOIN 
+        "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}" A
     ON 
-        "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}".biosampleid
-        =
-        "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}".id
-    WHERE 
-            "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"._datasetid='{dataset_id}'
-        AND 
-            "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}"._datasetid='{dataset_id}'
-        AND
-            "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"._vcfsampleid
-        IN 
-            ({','.join([f"'{sn}'" for sn in sample_names])})
-    LIMIT 1
-    """
-    return query
-
-
-# TODO break into many queries (ATHENA SQL LIMIT)
-# https://docs.aws.amazon.com/athena/latest/ug/service-limits.html
-def get_record_query(dataset_id, sample_names):
-    query = f"""
-    SELECT "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}".* 
-    FROM 
-        "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}" JOIN "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"
+        A.biosampleid = B.id AND A._datasetid = B._datasetid
+    JOIN 
+        "{{database}}"."{ENV_ATHENA.ATHENA_CARRIERS_TABLE}" C
     ON 
-        "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}".biosampleid
-        =
-        "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}".id
+        A._datasetid = C._datasetid AND A._vcfsampleid = C._vcfsampleid
     WHERE 
-            "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"._datasetid='{dataset_id}'
-        AND 
-            "{{database}}"."{ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE}"._datasetid='{dataset_id}'
-        AND
-            "{{database}}"."{ENV_ATHENA.ATHENA_ANALYSES_TABLE}"._vcfsampleid
-        IN 
-            ({','.join([f"'{sn}'" for sn in sample_names])})
+        C._queryid = '{query_id}'
     """
     return query
 
@@ -142,15 +100,24 @@ def route(request: RequestParams, variant_id):
         )
         datasets, samples = parse_datasets_with_samples(exec_id)
     else:
-        query = datasets_query_fast()
-        datasets = Dataset.get_by_query(
-            query,
-            execution_parameters=[assembly_id],
-            projects=request.projects,
-            sub=request.sub,
+        datasets = get_catalog_datasets(
+            assembly_id, projects=request.projects, sub=request.sub
         )
+        if datasets is None:
+            query = datasets_query_fast()
+            datasets = Dataset.get_by_query(
+                query,
+                execution_parameters=[assembly_id],
+                projects=request.projects,
+                sub=request.sub,
+            )
         samples = []
 
+    # skip the vcfs known not to have a record at this position
+    datasets, samples = filter_datasets_by_presence(
+        datasets, samples, reference_name, pos + 1
+    )
+
     query_responses = perform_variant_search(
         datasets=datasets,
         reference_name=reference_name,
@@ -175,7 +142,7 @@ def route(request: RequestParams, variant_id):
                 sorted(query_response.sample_names)
             )
 
-    queries = []
+    chosen_dataset_samples = dict()
 
     dataset_samples_sorted = OrderedDict(sorted(dataset_samples.items()))
     iterated_biosamples = 0
@@ -204,8 +171,7 @@ def route(request: RequestParams, variant_id):
                 if chosen_biosamples == request.query.pagination.limit:
                     break
             if len(chosen_samples) > 0:
-                query = get_record_query(dataset_id, chosen_samples)
-                queries.append(query)
+                chosen_dataset_samples[dataset_id] = chosen_samples
 
     if request.query.requested_granularity == Granularity.BOOLEAN:
         response = build_beacon_boolean_response(
@@ -222,12 +188,13 @@ def route(request: RequestParams, variant_id):
         return bundle_response(200, response)
 
     if request.query.requested_granularity == Granularity.RECORD:
-        query = " UNION ".join(queries)
-        biosamples = (
-            Biosample.get_by_query(query, projects=request.projects, sub=request.sub)
-            if len(queries) > 0
-            else []
-        )
+        if chosen_dataset_samples:
+            query = get_record_query(stage_carriers(chosen_dataset_samples))
+            biosamples = Biosample.get_by_query(
+                query, projects=request.projects, sub=request.sub
+            )
+        else:
+            biosamples = []
         response = build_beacon_resultset_response(
             jsons.dump(biosamples, strip_privates=True),
             total_biosamples,
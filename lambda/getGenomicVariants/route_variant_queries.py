@@ -0,0 +1,164 @@
+import base64
+import json
+import uuid
+
+import boto3
+
+from shared.variantutils import plan_variant_query_job, submit_variant_query_job
+from shared.dynamodb import (
+    VariantQuery,
+    VariantQueryStatus,
+    create_variant_query,
+    fail_stale_variant_query,
+    variant_query_result_key,
+)
+from shared.utils import ENV_ATHENA
+from shared.apiutils import (
+    RequestParams,
+    Granularity,
+    DefaultSchemas,
+    build_beacon_boolean_response,
+    build_beacon_resultset_response,
+    build_beacon_count_response,
+    bundle_response,
+    get_variant_entry,
+    decode_page_token,
+    encode_page_token,
+)
+from route_g_variants import get_datasets
+
+
+s3 = boto3.client("s3")
+
+
+def route_submit(request: RequestParams):
+    query_params = request.query.request_parameters
+    datasets, samples = get_datasets(request)
+    job_id = uuid.uuid4().hex
+
+    plan = plan_variant_query_job(
+        datasets=datasets,
+        reference_name=query_params.reference_name,
+        reference_bases=query_params.reference_bases,
+        alternate_bases=query_params.alternate_bases,
+        start=query_params.start,
+        end=query_params.end,
+        variant_type=query_params.variant_type,
+        variant_min_length=query_params.variant_min_length,
+        variant_max_length=query_params.variant_max_length,
+        query_id=job_id,
+        dataset_samples=samples,
+    )
+    job = create_variant_query(
+        job_id,
+        request.sub,
+        query_params.assembly_id,
+        query_params.reference_name,
+        len(plan["chunks"]),
+    )
+    if plan["chunks"]:
+        submit_variant_query_job(job_id, plan)
+
+    return bundle_response(202, job.to_dict())
+
+
+def read_results(job_id, chunk_counts, skip, limit):
+    """
+    Reads the variants [skip, skip + limit) of a completed job, fetching
+    only the result objects of the chunks overlapping that range.
+    """
+    records = []
+    chunk_start = 0
+
+    for chunk, count in enumerate(chunk_counts):
+        chunk_end = chunk_start + count
+
+        if count and chunk_end > skip and chunk_start < skip + limit:
+            body = s3.get_object(
+                Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+                Key=variant_query_result_key(job_id, chunk),
+            )["Body"]
+            lines = body.read().decode().splitlines()
+            first = max(0, skip - chunk_start)
+            last = min(count, skip + limit - chunk_start)
+            records.extend(json.loads(line) for line in lines[first:last])
+        if chunk_end >= skip + limit:
+            break
+        chunk_start = chunk_end
+
+    return records
+
+
+def route_status(request: RequestParams, job_id):
+    try:
+        job = VariantQuery.get(job_id)
+    except VariantQuery.DoesNotExist:
+        job = None
+
+    # jobs of other users are reported as missing
+    if job is None or job.uid != request.sub:
+        return bundle_response(404, {"error": "Variant query not found"})
+
+    fail_stale_variant_query(job)
+
+    if job.status != VariantQueryStatus.COMPLETED:
+        return bundle_response(200, job.to_dict())
+
+    total = sum(job.chunk_counts())
+
+    if request.query.requested_granularity == Granularity.BOOLEAN:
+        response = build_beacon_boolean_response(
+            {}, total, request, {}, DefaultSchemas.GENOMICVARIATIONS
+        )
+        return bundle_response(200, response)
+
+    if request.query.requested_granularity == Granularity.COUNT:
+        response = build_beacon_count_response(
+            {}, total, request, {}, DefaultSchemas.GENOMICVARIATIONS
+        )
+        return bundle_response(200, response)
+
+    pagination = request.query.pagination
+    skip = (
+        int(decode_page_token(pagination.current_page)["offset"])
+        if pagination.current_page
+        else pagination.skip
+    )
+    records = read_results(job_id, job.chunk_counts(), skip, pagination.limit)
+
+    results = list()
+    variant_info_mapping = dict()
+
+    for record in records:
+        chrom, pos, ref, alt, typ = record["variant"].split("\t")
+        internal_id = f"{job.assemblyId}\t{chrom}\t{pos}\t{ref}\t{alt}"
+        variant_internal_id = base64.b64encode(f"{internal_id}".encode()).decode()
+        results.append(
+            get_variant_entry(
+                variant_internal_id,
+                job.assemblyId,
+                ref,
+                alt,
+                int(pos),
+                int(pos) + len(alt),
+                typ,
+            )
+        )
+        variant_info_mapping[variant_internal_id] = {
+            "projectName": record["projectName"],
+            "datasetName": record["datasetName"],
+        }
+
+    next_offset = skip + pagination.limit
+    response = build_beacon_resultset_response(
+        results,
+        total,
+        request,
+        {},
+        DefaultSchemas.GENOMICVARIATIONS,
+        variant_info_mapping,
+        next_page=(
+            encode_page_token({"offset": next_offset}) if next_offset < total else None
+        ),
+    )
+    return bundle_response(200, response)
@@ -3,7 +3,7 @@ import csv
 
 from smart_open import open as sopen
 
-from shared.athena import run_custom_query
+from shared.athena import get_catalog_filtering_terms, run_custom_query
 from shared.dynamodb import Ontology
 from shared.utils import ENV_ATHENA
 from shared.apiutils import (
@@ -13,7 +13,7 @@ from shared.apiutils import (
 )
 
 
-def route(request: RequestParams):
+def query_filtering_terms(request: RequestParams):
     query = f"""
     SELECT DISTINCT term, label, type 
     FROM "{ENV_ATHENA.ATHENA_TERMS_TABLE}"
@@ -39,7 +39,6 @@ def route(request: RequestParams):
         execution_parameters=execution_parameters,
     )
     filteringTerms = []
-    ontologies = set()
 
     with sopen(
         f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{exec_id}.csv"
@@ -50,8 +49,23 @@ def route(request: RequestParams):
             if n == 0:
                 continue
             term, label, typ = row
-            ontologies.add(term.split(":")[0].lower())
             filteringTerms.append({"id": term, "label": label, "type": typ})
+    return filteringTerms
+
+
+def route(request: RequestParams):
+    filteringTerms = get_catalog_filtering_terms(
+        skip=request.query.pagination.skip,
+        limit=request.query.pagination.limit,
+        search=request.query._search,
+        kind="runs",
+        projects=request.projects,
+        sub=request.sub,
+    )
+    # until the indexer has published the catalog
+    if filteringTerms is None:
+        filteringTerms = query_filtering_terms(request)
+    ontologies = {term["id"].split(":")[0].lower() for term in filteringTerms}
 
     resources = [
         ontology.attribute_values for ontology in Ontology.batch_get(ontologies)
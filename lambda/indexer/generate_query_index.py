@@ -6,7 +6,7 @@ WITH (
     external_location = '{uri}',
     partitioned_by = ARRAY['kind'], 
     bucketed_by = ARRAY['term'],
-    bucket_count = 50
+    bucket_count = {bucket_count}
 )
 AS
 SELECT id, term, _projectname, kind FROM "{table}";
@@ -1,31 +1,46 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
+from functools import partial
 import threading
 import time
 import json
+import csv
+import sys
 
 from smart_open import open as sopen
 import boto3
 
 from shared.dynamodb import Descendants, Anscestors, Ontology
 from shared.ontoutils import request_hierarchy
-from shared.utils import ENV_ATHENA
+from shared.utils import (
+    ENV_ATHENA,
+    DATASET_CATALOG_KEY,
+    FILTERING_TERMS_MANIFEST_KEY,
+    FILTERING_TERMS_PREFIX,
+    build_dataset_catalog,
+    build_filtering_terms_catalogs,
+    filtering_terms_catalog_key,
+)
 from shared.dynamodb.locks import release_lock
 from ctas_queries import QUERY as CTAS_TEMPLATE
 from generate_query_index import QUERY as INDEX_QUERY
 from generate_query_terms import QUERY as TERMS_QUERY
 from generate_query_relations import QUERY as RELATIONS_QUERY
+from table_layout import TABLE_LAYOUTS_KEY, cache_stats, choose_layout
 
 
 athena = boto3.client("athena")
+glue = boto3.client("glue")
 s3 = boto3.client("s3")
 sns = boto3.client("sns")
+csv.field_size_limit(sys.maxsize)
 
 
 ENSEMBL_OLS = "https://www.ebi.ac.uk/ols/api/ontologies"
 ONTOSERVER = "https://r4.ontoserver.csiro.au/fhir/ValueSet/$expand"
 ONTO_TERMS_QUERY = f""" SELECT term,tablename,colname,type,label FROM "{ENV_ATHENA.ATHENA_TERMS_TABLE}" """
-INDEX_QUERY = INDEX_QUERY.format(
+INDEX_QUERY = partial(
+    INDEX_QUERY.format,
     table=ENV_ATHENA.ATHENA_TERMS_CACHE_TABLE,
     uri=f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/terms-index/",
 )
@@ -33,13 +48,18 @@ TERMS_QUERY = TERMS_QUERY.format(
     table=ENV_ATHENA.ATHENA_TERMS_CACHE_TABLE,
     uri=f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/terms/",
 )
-RELATIONS_QUERY = RELATIONS_QUERY.format(
-    uri=f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/relations/",
+# submitDataset writes the relations of each dataset under a folder of its own
+RELATIONS_PREFIX = "relations-cache/"
+RELATIONS_QUERY = partial(
+    RELATIONS_QUERY.format,
+    datasets_table=ENV_ATHENA.ATHENA_DATASETS_TABLE,
     individuals_table=ENV_ATHENA.ATHENA_INDIVIDUALS_TABLE,
     biosamples_table=ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE,
     runs_table=ENV_ATHENA.ATHENA_RUNS_TABLE,
     analyses_table=ENV_ATHENA.ATHENA_ANALYSES_TABLE,
 )
+# relations of older datasets rebuilt at once, within athena's query quota
+RELATIONS_BACKFILL_THREADS = 10
 
 
 def get_ontologie_terms_in_beacon():
@@ -173,7 +193,12 @@ def clean_files(bucket, prefix):
 
 
 def ctas_basic_tables(
-    *, source_table, destination_table, destination_prefix, bucket_count, bucket_by
+    *,
+    source_table,
+    destination_table,
+    destination_prefix,
+    bucket_count,
+    bucket_by,
 ):
     clean_files(ENV_ATHENA.ATHENA_METADATA_BUCKET, destination_prefix)
     drop_tables(destination_table)
@@ -193,12 +218,12 @@ def ctas_basic_tables(
     await_result(response["QueryExecutionId"])
 
 
-def index_terms():
+def index_terms(layout):
     clean_files(ENV_ATHENA.ATHENA_METADATA_BUCKET, "terms-index/")
     drop_tables(ENV_ATHENA.ATHENA_TERMS_INDEX_TABLE)
 
     response = athena.start_query_execution(
-        QueryString=INDEX_QUERY,
+        QueryString=INDEX_QUERY(bucket_count=layout["bucket_count"]),
         QueryExecutionContext={"Database": ENV_ATHENA.ATHENA_METADATA_DATABASE},
         WorkGroup=ENV_ATHENA.ATHENA_WORKGROUP,
     )
@@ -217,58 +242,214 @@ def record_terms():
     await_result(response["QueryExecutionId"])
 
 
-def record_relations():
-    clean_files(ENV_ATHENA.ATHENA_METADATA_BUCKET, "relations/")
-    drop_tables(ENV_ATHENA.ATHENA_RELATIONS_TABLE)
+def list_folders(bucket, prefix):
+    paginator = s3.get_paginator("list_objects_v2")
+    folders = set()
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        for folder in page.get("CommonPrefixes", []):
+            folders.add(folder["Prefix"][len(prefix) : -1])
+    return folders
+
 
+def unload_relations(dataset_id):
     response = athena.start_query_execution(
-        QueryString=RELATIONS_QUERY,
+        QueryString=RELATIONS_QUERY(
+            dataset_id=dataset_id.replace("'", "''"),
+            uri=f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/{RELATIONS_PREFIX}{dataset_id}/",
+        ),
         QueryExecutionContext={"Database": ENV_ATHENA.ATHENA_METADATA_DATABASE},
         WorkGroup=ENV_ATHENA.ATHENA_WORKGROUP,
     )
     await_result(response["QueryExecutionId"])
 
 
-def reindex_tables():
+def backfill_relations(folders):
+    """
+    Writes the relations folders of datasets submitted before submitDataset
+    wrote them, from the entity tables. Returns the datasets written.
+    """
+    response = athena.start_query_execution(
+        QueryString=f'SELECT id FROM "{ENV_ATHENA.ATHENA_DATASETS_TABLE}"',
+        QueryExecutionContext={"Database": ENV_ATHENA.ATHENA_METADATA_DATABASE},
+        WorkGroup=ENV_ATHENA.ATHENA_WORKGROUP,
+    )
+    execution_id = response["QueryExecutionId"]
+    await_result(execution_id)
+
+    with sopen(
+        f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{execution_id}.csv"
+    ) as s3f:
+        missing = sorted(
+            {row["id"] for row in csv.DictReader(s3f)} - folders - {""}
+        )
+
+    if missing:
+        print(f"Backfilling the relations of {missing}")
+        with ThreadPoolExecutor(RELATIONS_BACKFILL_THREADS) as executor:
+            list(executor.map(unload_relations, missing))
+    return set(missing)
+
+
+def record_relations():
+    """
+    Registers the relations folder of every submitted dataset as a
+    partition of the relations table, and drops the partitions of
+    datasets whose folders have been removed. Datasets without a folder
+    have theirs written first.
+    """
+    table = glue.get_table(
+        DatabaseName=ENV_ATHENA.ATHENA_METADATA_DATABASE,
+        Name=ENV_ATHENA.ATHENA_RELATIONS_TABLE,
+    )["Table"]
+    datasets = list_folders(ENV_ATHENA.ATHENA_METADATA_BUCKET, RELATIONS_PREFIX)
+    datasets |= backfill_relations(datasets)
+    partitions = set()
+
+    paginator = glue.get_paginator("get_partitions")
+    for page in paginator.paginate(
+        DatabaseName=ENV_ATHENA.ATHENA_METADATA_DATABASE,
+        TableName=ENV_ATHENA.ATHENA_RELATIONS_TABLE,
+    ):
+        partitions.update(partition["Values"][0] for partition in page["Partitions"])
+
+    added = sorted(datasets - partitions)
+    removed = sorted(partitions - datasets)
+    print(f"Relations partitions added: {added}, removed: {removed}")
+
+    location = f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/{RELATIONS_PREFIX}"
+
+    for n in range(0, len(added), 100):
+        response = glue.batch_create_partition(
+            DatabaseName=ENV_ATHENA.ATHENA_METADATA_DATABASE,
+            TableName=ENV_ATHENA.ATHENA_RELATIONS_TABLE,
+            PartitionInputList=[
+                {
+                    "Values": [dataset],
+                    "StorageDescriptor": {
+                        **table["StorageDescriptor"],
+                        "Location": f"{location}{dataset}/",
+                    },
+                }
+                for dataset in added[n : n + 100]
+            ],
+        )
+        if response.get("Errors"):
+            print("Error: ", response["Errors"])
+
+    for n in range(0, len(removed), 25):
+        glue.batch_delete_partition(
+            DatabaseName=ENV_ATHENA.ATHENA_METADATA_DATABASE,
+            TableName=ENV_ATHENA.ATHENA_RELATIONS_TABLE,
+            PartitionsToDelete=[
+                {"Values": [dataset]} for dataset in removed[n : n + 25]
+            ],
+        )
+
+
+# cache table, table, prefix, bucketed by
+ENTITY_TABLES = (
+    (
+        ENV_ATHENA.ATHENA_DATASETS_CACHE_TABLE,
+        ENV_ATHENA.ATHENA_DATASETS_TABLE,
+        "datasets/",
+        "'id', '_assemblyid'",
+    ),
+    (
+        ENV_ATHENA.ATHENA_INDIVIDUALS_CACHE_TABLE,
+        ENV_ATHENA.ATHENA_INDIVIDUALS_TABLE,
+        "individuals/",
+        "'id', '_datasetid'",
+    ),
+    (
+        ENV_ATHENA.ATHENA_BIOSAMPLES_CACHE_TABLE,
+        ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE,
+        "biosamples/",
+        "'id', '_datasetid'",
+    ),
+    (
+        ENV_ATHENA.ATHENA_RUNS_CACHE_TABLE,
+        ENV_ATHENA.ATHENA_RUNS_TABLE,
+        "runs/",
+        "'id', '_datasetid'",
+    ),
+    (
+        ENV_ATHENA.ATHENA_ANALYSES_CACHE_TABLE,
+        ENV_ATHENA.ATHENA_ANALYSES_TABLE,
+        "analyses/",
+        "'id', '_datasetid'",
+    ),
+)
+# the terms index has a partition for each kind of entity
+TERM_KINDS = 5
+
+
+def count_rows(tables):
+    query = " UNION ALL ".join(
+        f"""SELECT '{table}' AS tablename, COUNT(*) AS count FROM "{table}" """
+        for table in tables
+    )
+    response = athena.start_query_execution(
+        QueryString=query,
+        QueryExecutionContext={"Database": ENV_ATHENA.ATHENA_METADATA_DATABASE},
+        WorkGroup=ENV_ATHENA.ATHENA_WORKGROUP,
+    )
+    execution_id = response["QueryExecutionId"]
+    await_result(execution_id)
+
+    with sopen(
+        f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{execution_id}.csv"
+    ) as s3f:
+        return {row["tablename"]: int(row["count"]) for row in csv.DictReader(s3f)}
+
+
+def list_objects(bucket, prefix):
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+def plan_table_layouts():
+    """
+    Sizes up the cache tables and chooses the bucketing and sorting of the
+    tables built from them. The layouts are recorded in the metadata bucket.
+    """
+    tables = [
+        (table, src, f"{prefix[:-1]}-cache/") for src, table, prefix, _ in ENTITY_TABLES
+    ]
+    rows = count_rows(
+        [src for _, src, _ in tables] + [ENV_ATHENA.ATHENA_TERMS_CACHE_TABLE]
+    )
+    layouts = dict()
+
+    for table, src, cache_prefix in tables:
+        stats = cache_stats(
+            list_objects(ENV_ATHENA.ATHENA_METADATA_BUCKET, cache_prefix)
+        )
+        layouts[table] = choose_layout(stats, rows[src])
+
+    stats = cache_stats(list_objects(ENV_ATHENA.ATHENA_METADATA_BUCKET, "terms-cache/"))
+    layouts[ENV_ATHENA.ATHENA_TERMS_INDEX_TABLE] = choose_layout(
+        stats,
+        rows[ENV_ATHENA.ATHENA_TERMS_CACHE_TABLE],
+        partitions=TERM_KINDS,
+    )
+
+    print(f"Table layouts: {json.dumps(layouts)}")
+    s3.put_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=TABLE_LAYOUTS_KEY,
+        Body=json.dumps({"time": int(time.time()), "tables": layouts}).encode(),
+        ContentType="application/json",
+    )
+    return layouts
+
+
+def reindex_tables(layouts):
     # CTAS this must finish before all
     threads = []
-    for src, dest, prefix, bucket_count, bucket_by in (
-        (
-            ENV_ATHENA.ATHENA_DATASETS_CACHE_TABLE,
-            ENV_ATHENA.ATHENA_DATASETS_TABLE,
-            "datasets/",
-            10,
-            "'id', '_assemblyid'",
-        ),
-        (
-            ENV_ATHENA.ATHENA_INDIVIDUALS_CACHE_TABLE,
-            ENV_ATHENA.ATHENA_INDIVIDUALS_TABLE,
-            "individuals/",
-            50,
-            "'id', '_datasetid'",
-        ),
-        (
-            ENV_ATHENA.ATHENA_BIOSAMPLES_CACHE_TABLE,
-            ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE,
-            "biosamples/",
-            50,
-            "'id', '_datasetid'",
-        ),
-        (
-            ENV_ATHENA.ATHENA_RUNS_CACHE_TABLE,
-            ENV_ATHENA.ATHENA_RUNS_TABLE,
-            "runs/",
-            50,
-            "'id', '_datasetid'",
-        ),
-        (
-            ENV_ATHENA.ATHENA_ANALYSES_CACHE_TABLE,
-            ENV_ATHENA.ATHENA_ANALYSES_TABLE,
-            "analyses/",
-            50,
-            "'id', '_datasetid'",
-        ),
-    ):
+    for src, dest, prefix, bucket_by in ENTITY_TABLES:
         threads.append(
             threading.Thread(
                 target=ctas_basic_tables,
@@ -276,7 +457,7 @@ def reindex_tables():
                     "source_table": src,
                     "destination_table": dest,
                     "destination_prefix": prefix,
-                    "bucket_count": bucket_count,
+                    "bucket_count": layouts[dest]["bucket_count"],
                     "bucket_by": bucket_by,
                 },
             )
@@ -285,6 +466,118 @@ def reindex_tables():
     [thread.join() for thread in threads]
 
 
+def publish_dataset_catalog():
+    query = f"""
+    SELECT id, _assemblyid, _projectname, _datasetname, _vcflocations, _vcfchromosomemap
+    FROM "{ENV_ATHENA.ATHENA_DATASETS_TABLE}"
+    """
+    response = athena.start_query_execution(
+        QueryString=query,
+        QueryExecutionContext={"Database": ENV_ATHENA.ATHENA_METADATA_DATABASE},
+        WorkGroup=ENV_ATHENA.ATHENA_WORKGROUP,
+    )
+    execution_id = response["QueryExecutionId"]
+    await_result(execution_id)
+    datasets = []
+
+    with sopen(
+        f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{execution_id}.csv"
+    ) as s3f:
+        for row in csv.DictReader(s3f):
+            datasets.append(
+                {
+                    "id": row["id"],
+                    "assemblyId": row["_assemblyid"],
+                    "projectName": row["_projectname"],
+                    "datasetName": row["_datasetname"],
+                    "vcfLocations": json.loads(row["_vcflocations"] or "[]"),
+                    "vcfChromosomeMap": json.loads(row["_vcfchromosomemap"] or "[]"),
+                }
+            )
+
+    catalog = build_dataset_catalog(datasets, int(time.time()))
+    s3.put_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=DATASET_CATALOG_KEY,
+        Body=json.dumps(catalog).encode(),
+        ContentType="application/json",
+    )
+    print(f"Published dataset catalog version {catalog['version']}")
+
+
+def publish_filtering_terms_catalogs():
+    """
+    Publishes the filtering terms catalog of every project, with the
+    datasets and kinds of entities each term is found in, then the
+    manifest pointing the filtering terms routes at them.
+    """
+    entities = " UNION ALL ".join(
+        f"""SELECT id, {dataset_column} AS _datasetid, _projectname, '{kind}' AS kind FROM "{table}" """
+        for kind, table, dataset_column in (
+            ("datasets", ENV_ATHENA.ATHENA_DATASETS_TABLE, "id"),
+            ("individuals", ENV_ATHENA.ATHENA_INDIVIDUALS_TABLE, "_datasetid"),
+            ("biosamples", ENV_ATHENA.ATHENA_BIOSAMPLES_TABLE, "_datasetid"),
+            ("runs", ENV_ATHENA.ATHENA_RUNS_TABLE, "_datasetid"),
+            ("analyses", ENV_ATHENA.ATHENA_ANALYSES_TABLE, "_datasetid"),
+        )
+    )
+    query = f"""
+    SELECT DISTINCT T._projectname, T.term, T.label, T.type, T.kind, E._datasetid
+    FROM "{ENV_ATHENA.ATHENA_TERMS_CACHE_TABLE}" T
+    LEFT JOIN ({entities}) E
+    ON E.id = T.id AND E.kind = T.kind AND E._projectname = T._projectname
+    """
+    response = athena.start_query_execution(
+        QueryString=query,
+        QueryExecutionContext={"Database": ENV_ATHENA.ATHENA_METADATA_DATABASE},
+        WorkGroup=ENV_ATHENA.ATHENA_WORKGROUP,
+    )
+    execution_id = response["QueryExecutionId"]
+    await_result(execution_id)
+
+    with sopen(
+        f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/query-results/{execution_id}.csv"
+    ) as s3f:
+        reader = csv.reader(s3f)
+        next(reader, None)
+        catalogs = build_filtering_terms_catalogs(reader, int(time.time()))
+
+    # the manifest holds the etag of each catalog, so that warm lambdas
+    # only fetch the catalogs that have changed
+    manifest = {"version": int(time.time()), "projects": dict()}
+
+    for project, catalog in catalogs.items():
+        response = s3.put_object(
+            Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+            Key=filtering_terms_catalog_key(project),
+            Body=json.dumps(catalog, separators=(",", ":")).encode(),
+            ContentType="application/json",
+        )
+        manifest["projects"][project] = response["ETag"]
+
+    s3.put_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=FILTERING_TERMS_MANIFEST_KEY,
+        Body=json.dumps(manifest).encode(),
+        ContentType="application/json",
+    )
+
+    published = {filtering_terms_catalog_key(project) for project in catalogs}
+    stale = [
+        {"Key": item["Key"]}
+        for item in list_objects(
+            ENV_ATHENA.ATHENA_METADATA_BUCKET, f"{FILTERING_TERMS_PREFIX}projects/"
+        )
+        if item["Key"] not in published
+    ]
+    for n in range(0, len(stale), 1000):
+        s3.delete_objects(
+            Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+            Delete={"Objects": stale[n : n + 1000]},
+        )
+    print(f"Published filtering terms of {len(catalogs)} projects")
+
+
 def clean_onto_index_tables():
     with Anscestors.batch_write() as batch:
         for entry in Anscestors.scan():
@@ -308,8 +601,12 @@ def lambda_handler(event, context):
         return
 
     # re-index all tables using CTAS
+    layouts = None
     if re_index_tables:
-        reindex_tables()
+        layouts = plan_table_layouts()
+        reindex_tables(layouts)
+        # variant queries read the datasets from here instead of athena
+        publish_dataset_catalog()
 
     # cleanup recorded terms in DynamoDB
     if re_index_ontology_tables:
@@ -318,10 +615,13 @@ def lambda_handler(event, context):
     # index terms and corresponding entity type and id they appear
     index_thread = None
     if re_index_tables:
-        index_thread = threading.Thread(target=index_terms)
+        index_thread = threading.Thread(
+            target=index_terms,
+            args=(layouts[ENV_ATHENA.ATHENA_TERMS_INDEX_TABLE],),
+        )
         index_thread.start()
 
-    # the massive JOIN operation between all tables to create the links
+    # register the relations written by submitDataset, one partition per dataset
     relations_thread = None
 
     if re_index_tables:
@@ -333,6 +633,10 @@ def lambda_handler(event, context):
     if event.get("reIndexTables", True):
         record_terms()
 
+    # served by the filtering terms routes instead of querying athena
+    if re_index_tables:
+        publish_filtering_terms_catalogs()
+
     # build ontology tree
     index_terms_tree()
 
@@ -0,0 +1,47 @@
+import math
+import re
+
+
+# ORC files written per bucket are aimed at this size, athena reads small
+# files poorly and cannot split a bucket file across more than a few workers
+TARGET_FILE_BYTES = 128 * 1024 * 1024
+# a bucket should at least fill the default ORC row index stride
+MIN_BUCKET_ROWS = 10000
+MIN_BUCKETS = 1
+MAX_BUCKETS = 100
+# the cache files of a dataset are named {kind}-cache/{dataset id}[.part-n]
+part_pattern = re.compile(r"\.part-\d+$")
+# chosen layouts are recorded here for inspection
+TABLE_LAYOUTS_KEY = "indexer/table-layouts.json"
+
+
+def cache_stats(objects):
+    """
+    Summarises the S3 objects of a cache table into its size in bytes,
+    its number of files and the number of datasets written to it.
+    """
+    objects = list(objects)
+    return {
+        "bytes": sum(item["Size"] for item in objects),
+        "files": len(objects),
+        "datasets": len({part_pattern.sub("", item["Key"]) for item in objects}),
+    }
+
+
+def choose_layout(stats, rows, *, partitions=1):
+    """
+    Bucket count of a CTAS table, from the stats of its cache table and its
+    row count. Buckets are sized towards TARGET_FILE_BYTES, without leaving
+    fewer than MIN_BUCKET_ROWS rows in any of them. The files of a
+    partitioned table are shared among its `partitions`.
+    """
+    by_size = math.ceil(stats["bytes"] / (TARGET_FILE_BYTES * partitions))
+    by_rows = rows // (MIN_BUCKET_ROWS * partitions)
+    bucket_count = max(MIN_BUCKETS, min(by_size, by_rows, MAX_BUCKETS))
+
+    return {
+        "bucket_count": bucket_count,
+        "target_file_bytes": TARGET_FILE_BYTES,
+        "rows": rows,
+        **stats,
+    }
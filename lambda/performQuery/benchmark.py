@@ -0,0 +1,67 @@
+"""
+Compares the vcf query engines on the same payloads.
+
+    python benchmark.py payloads.json --repeat 5
+
+payloads.json holds a list of performQuery payloads (as sent by splitQuery).
+Both engines must return identical responses, the timings of the first
+(cold) and remaining (warm) rounds are reported per engine.
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from query_engine import perform_query
+from vcf_readers import VCF_READERS
+
+
+def run_round(payloads, engine):
+    responses = []
+    start = time.perf_counter()
+
+    for payload in payloads:
+        responses.append(perform_query(payload, engine=engine))
+    return time.perf_counter() - start, responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("payloads", help="json file with a list of payloads")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--engines", nargs="+", default=list(VCF_READERS), choices=list(VCF_READERS)
+    )
+    args = parser.parse_args()
+
+    with open(args.payloads) as f:
+        payloads = json.load(f)
+
+    results = dict()
+
+    for engine in args.engines:
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, responses = run_round(payloads, engine)
+            timings.append(elapsed)
+        results[engine] = responses
+        warm = timings[1:] or timings
+        print(
+            f"{engine}: cold {timings[0]:.3f}s, "
+            f"warm median {statistics.median(warm):.3f}s "
+            f"over {len(payloads)} payloads"
+        )
+
+    reference_engine, *other_engines = args.engines
+
+    for engine in other_engines:
+        for payload, expected, actual in zip(
+            payloads, results[reference_engine], results[engine]
+        ):
+            if expected != actual:
+                print(f"MISMATCH {reference_engine} vs {engine} for {payload}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,22 @@
 import os
 import re
-import subprocess
 
 import boto3
 
 from shared.apiutils.requests import Granularity
-from query_builder import QueryBuiler
+from vcf_readers import get_reader
 
 
 # uncomment below for debugging
 # os.environ['LD_DEBUG'] = 'all'
-all_count_pattern = re.compile("[0-9]+")
-get_all_calls = all_count_pattern.findall
 s3 = boto3.client("s3")
+# "bcftools" runs a subprocess per query, "pysam" reads in-process
+VCF_QUERY_ENGINE = os.environ.get("VCF_QUERY_ENGINE", "bcftools")
 
 
-def perform_query(payload: dict(), is_async: bool = False):
+def perform_query(
+    payload: dict(), is_async: bool = False, engine: str = VCF_QUERY_ENGINE
+):
     region = payload["region"]
     variant_type = payload.get("variant_type", "")
     variant_prefix = f"<{variant_type}"
@@ -41,9 +42,12 @@ def perform_query(payload: dict(), is_async: bool = False):
     requested_granularity = payload.get("requested_granularity", Granularity.BOOLEAN)
     # details
     include_details = payload.get("include_details", False)
-    chosen_samples = payload.get("samples", [])
+    # staged subset of the vcf samples, None for all
+    sample_set = payload.get("sample_set", None)
     # samples
     include_samples = payload.get("include_samples", False)
+    # number of variants after which the query may stop early
+    limit = payload.get("limit", None)
     # query id
     query_id = payload.get("query_id", "-")
     dataset_id = payload.get("dataset_id", "-")
@@ -54,48 +58,34 @@ def perform_query(payload: dict(), is_async: bool = False):
     call_count = 0
     all_alleles_count = 0
     sample_indices = set()
-    all_sample_names = []
     sample_names = []
-
-    bcftools_query = QueryBuiler()
-    bcftools_query = bcftools_query.set_samples(chosen_samples)
-    bcftools_query = bcftools_query.set_region(region)
-    bcftools_query = bcftools_query.set_return_samples(include_samples)
-
-    bcftools_query = bcftools_query.set_vcf(payload["vcf_location"])
-    args = bcftools_query.build()
-
-    print("Iterating bcftools result")
-    query_process = subprocess.Popen(
-        args, stdout=subprocess.PIPE, cwd="/tmp", encoding="ascii"
+    # position at which the limit was reached, and the last fully scanned one
+    stop_after = None
+    horizon = None
+
+    reader = get_reader(
+        engine,
+        payload["vcf_location"],
+        region,
+        sample_set,
+        include_samples,
     )
 
-    # iterate through bcftools output
-    for line in query_process.stdout:
-        try:
-            (
-                vcf_position,
-                vcf_reference,
-                vcf_all_alts,
-                vcf_info_str,
-                vcf_genotypes,
-                vcf_samples,
-            ) = bcftools_query.parse_line(line)
-
-            if not all_sample_names and vcf_samples:
-                all_sample_names = [
-                    sample for sample in vcf_samples.strip().strip(",").split(",")
-                ]
-        except ValueError as e:
-            print(repr(line.split("\t")))
-            raise e
+    print(f"Iterating {engine} result")
 
-        vcf_position = int(vcf_position)
+    for record in reader:
+        vcf_position = record.position
+        vcf_reference = record.reference
         # Ensure each variant will only be found by one process
         # TODO handle CNVs
         if not first_base_pos <= vcf_position <= last_base_pos:
             continue
 
+        # limit was reached and every record at that position has been seen
+        if stop_after is not None and vcf_position > stop_after:
+            horizon = stop_after
+            break
+
         vcf_reference_length = len(vcf_reference)
 
         # must be within end range
@@ -107,7 +97,7 @@ def perform_query(payload: dict(), is_async: bool = False):
         if vcf_reference.upper() != reference_bases and reference_bases != "N":
             continue
 
-        vcf_all_alts = vcf_all_alts.split(",")
+        vcf_all_alts = record.alts
 
         # alternate base not defined
         if alternate_bases == "N" and variant_type is not None:
@@ -208,22 +198,11 @@ def perform_query(payload: dict(), is_async: bool = False):
         # Look through INFO for AC and AN, used for efficient calculations. Note
         # we cannot request them explicitly in the query, as bcftools will crash
         # if they aren't present.
-        all_alt_counts = None
-        total_count = None
-        vcf_variant_type = "N/A"
-
-        for info in vcf_info_str.split(";"):
-            if info.startswith("AC="):
-                all_alt_counts = info[3:]
-            elif info.startswith("AN="):
-                total_count = int(info[3:])
-            elif info.startswith("VT="):
-                vcf_variant_type = info[3:]
+        alt_counts, total_count, vcf_variant_type = record.counts()
 
         all_calls = None
         # if AC=X was there
-        if all_alt_counts is not None:
-            alt_counts = [int(c) for c in all_alt_counts.split(",")]
+        if alt_counts is not None:
             call_counts = [alt_counts[i] for i in hit_indexes]
             # ["Chr1 123 A G SNP"]
             variants += [
@@ -235,8 +214,7 @@ def perform_query(payload: dict(), is_async: bool = False):
         # otherwise
         else:
             # Much slower, but doesn't require INFO/AC
-            # parsing 0|0,0|0,0|0,0|0
-            all_calls = [int(g) for g in get_all_calls(vcf_genotypes)]
+            all_calls = record.calls()
             hit_set = {i + 1 for i in hit_indexes}
             # ["Chr1 123 A G SNP"]
             variants += [
@@ -245,20 +223,17 @@ def perform_query(payload: dict(), is_async: bool = False):
             ]
             call_count += sum(1 for call in all_calls if call in hit_set)
 
+        if limit and stop_after is None and len(variants) >= limit:
+            stop_after = vcf_position
+
         # if there are actual variants
         if call_count:
             exists = True
             if not include_details:
                 break
-            hit_string = "|".join(str(i + 1) for i in hit_indexes)
-            pattern = re.compile(f"(^|[|/])({hit_string})([|/]|$)")
             if requested_granularity == Granularity.RECORD and include_samples:
                 sample_indices.update(
-                    [
-                        i
-                        for i, gt in enumerate(vcf_genotypes.split(","))
-                        if pattern.search(gt)
-                    ]
+                    record.carriers({i + 1 for i in hit_indexes})
                 )
 
         # Used for calculating frequency. This will be a misleading value if the
@@ -272,20 +247,21 @@ def perform_query(payload: dict(), is_async: bool = False):
         else:
             # Much slower, but doesn't require INFO/AN
             if all_calls is None:
-                all_calls = get_all_calls(vcf_genotypes)
+                all_calls = record.calls()
             all_alleles_count += len(all_calls)
 
         # if only bool is asked and a variant if found
         if requested_granularity == Granularity.BOOLEAN and exists:
             break
-    query_process.stdout.close()
 
     if requested_granularity == Granularity.RECORD and include_samples:
         sample_names = [
-            sample for n, sample in enumerate(all_sample_names) if n in sample_indices
+            sample
+            for n, sample in enumerate(reader.sample_names)
+            if n in sample_indices
         ]
 
-    print("Iterating bcftools result complete")
+    print(f"Iterating {engine} result complete")
 
     response = {
         "dataset_id": dataset_id,
@@ -294,6 +270,7 @@ def perform_query(payload: dict(), is_async: bool = False):
         "variants": variants,
         "call_count": call_count,
         "sample_names": [] if not include_samples else sample_names,
+        "horizon": horizon,
     }
 
     return response
@@ -0,0 +1,306 @@
+from collections import OrderedDict
+from itertools import compress
+import os
+import re
+import subprocess
+
+import boto3
+
+from shared.utils import get_vcf_samples
+from shared.utils.vcf_header import split_s3_location
+from query_builder import QueryBuiler
+
+
+all_count_pattern = re.compile("[0-9]+")
+get_all_calls = all_count_pattern.findall
+# remote handles and their indexes kept across warm invocations
+MAX_OPEN_VCFS = 32
+# sample sets are content addressed, so cached entries never go stale, vcf
+# samples and masks are keyed by the ETag of the vcf so a replaced one is reread
+MAX_CACHED_MASKS = 256
+
+s3 = boto3.client("s3")
+_sample_sets = OrderedDict()
+_vcf_samples = OrderedDict()
+_sample_masks = OrderedDict()
+
+
+def _cache_put(cache, key, value, max_size):
+    cache[key] = value
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+    return value
+
+
+def vcf_etag(vcf_location):
+    bucket, key = split_s3_location(vcf_location)
+
+    if bucket is None:
+        return None
+    return s3.head_object(Bucket=bucket, Key=key)["ETag"]
+
+
+def load_sample_set(sample_set_uri):
+    if sample_set_uri in _sample_sets:
+        return _sample_sets[sample_set_uri]
+
+    bucket, key = sample_set_uri[len("s3://") :].split("/", 1)
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode()
+
+    return _cache_put(
+        _sample_sets, sample_set_uri, frozenset(body.split("\n")), MAX_CACHED_MASKS
+    )
+
+
+def get_sample_mask(vcf_key, vcf_sample_names, sample_set_uri):
+    """
+    Bitmask of the staged sample set over the sample order of the vcf,
+    identified by vcf_key, its (location, ETag).
+    """
+    cache_key = (vcf_key, sample_set_uri)
+
+    if cache_key in _sample_masks:
+        return _sample_masks[cache_key]
+
+    sample_set = load_sample_set(sample_set_uri)
+    mask = [name in sample_set for name in vcf_sample_names]
+
+    return _cache_put(_sample_masks, cache_key, mask, MAX_CACHED_MASKS)
+
+
+class BcftoolsRecord:
+    """
+    Record parsed from a line of bcftools query output, INFO and genotypes
+    are only decoded when the filters ask for them.
+    """
+
+    __slots__ = ("position", "reference", "alts", "_info", "_genotypes", "_mask")
+
+    def __init__(self, position, reference, alts, info, genotypes, mask):
+        self.position = position
+        self.reference = reference
+        self.alts = alts
+        self._info = info
+        self._genotypes = genotypes
+        self._mask = mask
+
+    def counts(self):
+        alt_counts = None
+        total_count = None
+        variant_type = "N/A"
+
+        for info in self._info.split(";"):
+            # missing counts are left to be counted from the genotypes
+            if info.startswith("AC=") and "." not in info[3:].split(","):
+                alt_counts = [int(c) for c in info[3:].split(",")]
+            elif info.startswith("AN=") and info[3:] != ".":
+                total_count = int(info[3:])
+            elif info.startswith("VT="):
+                variant_type = info[3:]
+
+        return alt_counts, total_count, variant_type
+
+    def calls(self):
+        # parsing 0|0,0|0,0|0,0|0
+        if self._mask is None:
+            return [int(g) for g in get_all_calls(self._genotypes)]
+        return [
+            int(g)
+            for gt in compress(self._genotypes.split(","), self._mask)
+            for g in get_all_calls(gt)
+        ]
+
+    def carriers(self, hit_alleles):
+        hit_string = "|".join(str(i) for i in hit_alleles)
+        pattern = re.compile(f"(^|[|/])({hit_string})([|/]|$)")
+        genotypes = enumerate(self._genotypes.split(","))
+
+        if self._mask is not None:
+            genotypes = compress(genotypes, self._mask)
+        return [i for i, gt in genotypes if pattern.search(gt)]
+
+
+class BcftoolsReader:
+    def __init__(self, vcf_location, region, sample_set, include_samples):
+        self.sample_names = []
+        self._mask = None
+
+        if sample_set:
+            # subset by masking the decoded genotypes, not with --samples
+            vcf_key = (vcf_location, vcf_etag(vcf_location))
+
+            if vcf_key not in _vcf_samples:
+                errored, error, names = get_vcf_samples(vcf_location)
+                if errored:
+                    raise Exception(error)
+                _cache_put(_vcf_samples, vcf_key, names, MAX_CACHED_MASKS)
+            self.sample_names = _vcf_samples[vcf_key]
+            self._mask = get_sample_mask(vcf_key, self.sample_names, sample_set)
+
+        self._query = (
+            QueryBuiler()
+            .set_region(region)
+            .set_return_samples(include_samples and not self.sample_names)
+            .set_vcf(vcf_location)
+        )
+        self._args = self._query.build()
+
+    def __iter__(self):
+        query_process = subprocess.Popen(
+            self._args, stdout=subprocess.PIPE, cwd="/tmp", encoding="ascii"
+        )
+
+        try:
+            for line in query_process.stdout:
+                try:
+                    (
+                        position,
+                        reference,
+                        all_alts,
+                        info,
+                        genotypes,
+                        samples,
+                    ) = self._query.parse_line(line)
+
+                    if not self.sample_names and samples:
+                        self.sample_names = samples.strip().strip(",").split(",")
+                except ValueError as e:
+                    print(repr(line.split("\t")))
+                    raise e
+
+                yield BcftoolsRecord(
+                    int(position),
+                    reference,
+                    # "." when there are no alternate alleles
+                    [] if all_alts == "." else all_alts.split(","),
+                    info,
+                    genotypes,
+                    self._mask,
+                )
+        finally:
+            query_process.stdout.close()
+
+
+class PysamRecord:
+    """
+    Record backed by a pysam.VariantRecord, fields are already typed.
+    """
+
+    __slots__ = ("position", "reference", "alts", "_record", "_samples")
+
+    def __init__(self, record, samples):
+        self.position = record.pos
+        self.reference = record.ref
+        self.alts = list(record.alts or ())
+        self._record = record
+        self._samples = samples
+
+    def counts(self):
+        info = self._record.info
+        alt_counts = info["AC"] if "AC" in info else None
+        total_count = info["AN"] if "AN" in info else None
+        variant_type = info["VT"] if "VT" in info else "N/A"
+
+        # a scalar when the header declares AC with Number=1
+        if alt_counts is not None and not isinstance(alt_counts, tuple):
+            alt_counts = (alt_counts,)
+        # missing counts are left to be counted from the genotypes
+        if alt_counts is not None:
+            alt_counts = None if None in alt_counts else list(alt_counts)
+        if isinstance(variant_type, tuple):
+            variant_type = ",".join(variant_type)
+        return alt_counts, total_count, variant_type
+
+    def _genotypes(self):
+        samples = self._record.samples
+        # records without GT have no calls, as bcftools reads them as "."
+        has_genotypes = "GT" in self._record.format
+
+        for name in self._samples:
+            yield (samples[name]["GT"] or ()) if has_genotypes else ()
+
+    def calls(self):
+        return [
+            allele
+            for genotype in self._genotypes()
+            for allele in genotype
+            if allele is not None
+        ]
+
+    def carriers(self, hit_alleles):
+        return [
+            i
+            for i, genotype in enumerate(self._genotypes())
+            if any(allele in hit_alleles for allele in genotype)
+        ]
+
+
+_open_vcfs = OrderedDict()
+
+
+def _get_vcf(vcf_location):
+    """
+    Open handle of the vcf and its (location, ETag), a handle opened on an
+    earlier version of the file is reopened.
+    """
+    # pysam is only needed when this engine is selected
+    import pysam
+
+    vcf_key = (vcf_location, vcf_etag(vcf_location))
+
+    if vcf_location in _open_vcfs:
+        open_key, vcf = _open_vcfs[vcf_location]
+        if open_key == vcf_key:
+            _open_vcfs.move_to_end(vcf_location)
+            return vcf_key, vcf
+        del _open_vcfs[vcf_location]
+        vcf.close()
+
+    # htslib saves remote indexes to the working directory
+    os.chdir("/tmp")
+    vcf = pysam.VariantFile(vcf_location)
+    _open_vcfs[vcf_location] = (vcf_key, vcf)
+
+    if len(_open_vcfs) > MAX_OPEN_VCFS:
+        _, (_, evicted) = _open_vcfs.popitem(last=False)
+        evicted.close()
+    return vcf_key, vcf
+
+
+class PysamReader:
+    def __init__(self, vcf_location, region, sample_set, include_samples):
+        self._vcf_location = vcf_location
+        self._chromosome = region[: region.find(":")]
+        self._start = int(region[region.find(":") + 1 : region.find("-")])
+        self._end = int(region[region.find("-") + 1 :])
+        self._sample_set = sample_set
+        self.sample_names = []
+
+    def __iter__(self):
+        try:
+            vcf_key, vcf = _get_vcf(self._vcf_location)
+            samples = list(vcf.header.samples)
+
+            if self._sample_set:
+                mask = get_sample_mask(vcf_key, samples, self._sample_set)
+                samples = list(compress(samples, mask))
+            self.sample_names = samples
+            # fetch takes 0-based half open coordinates
+            for record in vcf.fetch(self._chromosome, self._start - 1, self._end):
+                yield PysamRecord(record, samples)
+        except (OSError, ValueError):
+            # drop the handle, it will be reopened by the next invocation
+            stale = _open_vcfs.pop(self._vcf_location, None)
+            if stale is not None:
+                stale[1].close()
+            raise
+
+
+VCF_READERS = {
+    "bcftools": BcftoolsReader,
+    "pysam": PysamReader,
+}
+
+
+def get_reader(engine, vcf_location, region, sample_set, include_samples):
+    return VCF_READERS[engine](vcf_location, region, sample_set, include_samples)
@@ -1,39 +1,233 @@
-from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List
 import gzip
 import base64
+import heapq
+import math
 
 import boto3
 
-from shared.utils import LambdaClient
+from shared.dynamodb import (
+    fail_variant_query,
+    record_variant_query_chunk,
+    record_variant_query_part,
+    variant_query_part_key,
+    variant_query_plan_key,
+    variant_query_result_key,
+)
+from shared.utils import ENV_ATHENA
+from shared.utils.async_lambda import AsyncLambdaClient
 
 
 PERFORM_QUERY = os.environ["PERFORM_QUERY_LAMBDA"]
-THREADS = 50
+# performQuery invocations in flight at once
+MAX_IN_FLIGHT = 50
+# performQuery times out after 10s, stop waiting shortly after
+PERFORM_QUERY_DEADLINE = 15
+SPLIT_QUERY_TOPIC_ARN = os.environ["SPLIT_QUERY_TOPIC_ARN"]
+# sns takes at most 10 messages per batch
+PUBLISH_BATCH_SIZE = 10
+PUBLISH_THREADS = 32
 
 
-aws_lambda = LambdaClient()
+aws_lambda = AsyncLambdaClient(MAX_IN_FLIGHT, PERFORM_QUERY_DEADLINE)
+s3 = boto3.client("s3")
 sns = boto3.client("sns")
 
 
 def perform_query(payload: dict):
-    response = aws_lambda.invoke(
+    return aws_lambda.submit(
         FunctionName=PERFORM_QUERY,
         InvocationType="RequestResponse",
         Payload=json.dumps(payload),
     )
 
-    return json.loads(response["Payload"].read())
-
 
 # TODO if the response is too big upload to S3
 def split_query(payloads: List[dict], is_async: bool = False):
-    executor = ThreadPoolExecutor(THREADS)
-    futures = [executor.submit(perform_query, payload) for payload in payloads]
+    futures = [perform_query(payload) for payload in payloads]
+
+    return [json.loads(future.result()) for future in futures]
+
+
+def unpack(event):
+    # if gzipped
+    if not isinstance(event, list):
+        event = base64.b64decode(event.encode())
+        event = gzip.decompress(event)
+        event = json.loads(event)
+    return event
+
+
+@lru_cache(maxsize=4)
+def read_variant_query_plan(job_id: str):
+    # plans do not change, parts of the same job often share a container
+    body = s3.get_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=variant_query_plan_key(job_id),
+    )["Body"]
+    return json.loads(body.read())
+
+
+def variant_query_parts(plan: dict):
+    return math.ceil(len(plan["targets"]) / plan["partSize"]) if plan["targets"] else 0
+
+
+def variant_query_payloads(plan: dict, chunk: int, part: int):
+    """
+    The performQuery payloads of a part of a chunk, its windows across the
+    vcfs of the part, in position order.
+    """
+    chunk_start, chunk_end = plan["chunks"][chunk]
+    split_size = plan["splitSize"]
+    targets = plan["targets"][part * plan["partSize"] : (part + 1) * plan["partSize"]]
+    payloads = []
+    split_start = chunk_start
+
+    while split_start <= chunk_end:
+        split_end = min(split_start + split_size - 1, chunk_end)
+        for target in targets:
+            payloads.append(
+                {
+                    **target["payload"],
+                    "region": f"{target['chromosome']}:{split_start}-{split_end}",
+                }
+            )
+        split_start += split_size
+
+    return payloads
+
+
+def publish_variant_query_job(job_id: str):
+    """
+    Publishes a message per part of each chunk of a submitted job, for
+    splitQuery to search them.
+    """
+    try:
+        plan = read_variant_query_plan(job_id)
+        parts = range(variant_query_parts(plan))
+        entries = [
+            {
+                "Id": str(n),
+                "Message": json.dumps(
+                    {"variantQuery": {"jobId": job_id, "chunk": chunk, "part": part}}
+                ),
+            }
+            for n, (chunk, part) in enumerate(
+                (chunk, part) for chunk in range(len(plan["chunks"])) for part in parts
+            )
+        ]
+
+        def publish(batch):
+            response = sns.publish_batch(
+                TopicArn=SPLIT_QUERY_TOPIC_ARN, PublishBatchRequestEntries=batch
+            )
+            if failed := response.get("Failed"):
+                raise Exception(f"Publishing failed: {failed[0].get('Message')}")
+
+        with ThreadPoolExecutor(PUBLISH_THREADS) as executor:
+            list(
+                executor.map(
+                    publish,
+                    (
+                        entries[n : n + PUBLISH_BATCH_SIZE]
+                        for n in range(0, len(entries), PUBLISH_BATCH_SIZE)
+                    ),
+                )
+            )
+        print(f"Variant query {job_id}: published {len(entries)} parts")
+    except Exception as e:
+        print(f"Variant query {job_id} publishing failed: {e}")
+        fail_variant_query(job_id, e)
 
-    return [future.result() for future in futures]
+
+def _record_key(record):
+    _, pos, ref, alt, _ = record["variant"].split("\t")
+    return int(pos), ref, alt
+
+
+def _write_records(key, records):
+    s3.put_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=key,
+        Body="".join(json.dumps(record) + "\n" for record in records),
+    )
+
+
+def _read_records(key):
+    body = s3.get_object(Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET, Key=key)["Body"]
+    return [json.loads(line) for line in body.read().decode().splitlines()]
+
+
+def merge_variant_query_parts(job_id: str, chunk: int, parts: int):
+    """
+    Merges the ordered results of the parts of a chunk into the chunk's
+    result, a variant found in several parts keeps the record of the first.
+    Returns the number of distinct variants of the chunk.
+    """
+    merged = []
+    last_key = None
+
+    for record in heapq.merge(
+        *(
+            _read_records(variant_query_part_key(job_id, chunk, part))
+            for part in range(parts)
+        ),
+        key=_record_key,
+    ):
+        if (key := _record_key(record)) != last_key:
+            merged.append(record)
+            last_key = key
+
+    _write_records(variant_query_result_key(job_id, chunk), merged)
+    return len(merged)
+
+
+def run_variant_query_chunk(job_id: str, chunk: int, part: int):
+    """
+    Searches a part of a chunk of an asynchronous variant query job and
+    stores its distinct variants in position order. The result of a chunk
+    searched in one part is stored directly, otherwise the last of its
+    parts to finish merges them.
+    """
+    try:
+        plan = read_variant_query_plan(job_id)
+        payloads = variant_query_payloads(plan, chunk, part)
+        responses = split_query(payloads, True)
+        found = dict()
+
+        for payload, response in zip(payloads, responses):
+            for variant in response["variants"]:
+                _, pos, ref, alt, _ = variant.split("\t")
+                found.setdefault(
+                    (int(pos), ref, alt),
+                    {
+                        "variant": variant,
+                        "projectName": payload["project_name"],
+                        "datasetName": payload["dataset_name"],
+                    },
+                )
+
+        records = [found[key] for key in sorted(found)]
+        parts = variant_query_parts(plan)
+
+        if parts == 1:
+            _write_records(variant_query_result_key(job_id, chunk), records)
+            record_variant_query_chunk(job_id, chunk, len(records))
+            return
+
+        _write_records(variant_query_part_key(job_id, chunk, part), records)
+        # parts finishing together may both merge, to the same result
+        if record_variant_query_part(job_id, chunk, part) == parts:
+            count = merge_variant_query_parts(job_id, chunk, parts)
+            record_variant_query_chunk(job_id, chunk, count)
+    except Exception as e:
+        # a failed chunk fails the job, sns retries would find it failed anyway
+        print(f"Variant query {job_id} chunk {chunk} part {part} failed: {e}")
+        fail_variant_query(job_id, e)
 
 
 def lambda_handler(event, context):
@@ -45,11 +239,17 @@ def lambda_handler(event, context):
         print("using invoke event")
         is_async = False
 
-    # if gzipped
-    if not isinstance(event, list):
-        event = base64.b64decode(event.encode())
-        event = gzip.decompress(event)
-        event = json.loads(event)
+    if isinstance(event, dict) and "variantQueryJob" in event:
+        job = event["variantQueryJob"]
+        print(f"Variant query {job['jobId']}")
+        return publish_variant_query_job(job["jobId"])
+
+    if isinstance(event, dict) and "variantQuery" in event:
+        job = event["variantQuery"]
+        print(f"Variant query {job['jobId']} chunk {job['chunk']} part {job['part']}")
+        return run_variant_query_chunk(job["jobId"], job["chunk"], job["part"])
+
+    event = unpack(event)
     print("Backend Event Received: {}".format(json.dumps(event)))
     response = split_query(event, is_async)
     return response
@@ -1,30 +1,70 @@
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from threading import Thread
 from datetime import datetime, timezone
 from pathlib import Path
 
+import boto3
+import ijson
 from jsonschema import Draft202012Validator, RefResolver
 from shared.athena import Analysis, Biosample, Dataset, Individual, Run
 
 from shared.utils import clear_tmp
 from smart_open import open as sopen
-from util import get_vcf_chromosome_maps, get_vcfs_samples
-from tabular_to_json import transform_tabular_to_json
+from util import (
+    build_presence_index,
+    delete_presence_index,
+    get_vcf_headers,
+)
+from tabular_to_json import TabularPayload
+from payload import ENTITY_KINDS, DictPayload, JsonPayload
+from relations import DatasetRelations
 
 # uncomment below for debugging
 # os.environ['LD_DEBUG'] = 'all'
 
-
-def create_dataset(attributes):
+aws_lambda = boto3.client("lambda")
+SCHEMA = "./schemas/submit-dataset-schema-new.json"
+# errors reported per entity kind before validation of that kind stops
+MAX_VALIDATION_ERRORS = 1000
+# seconds left to record the status of a presence index build
+PRESENCE_INDEX_MARGIN = 30
+
+
+def invoke_presence_index(dataset_id, vcf_chromosome_maps):
+    # built out of band so the submission does not wait on a full vcf scan,
+    # one invocation per vcf so that each is bounded by the lambda timeout
+    for vcf_chromosome_map in vcf_chromosome_maps:
+        aws_lambda.invoke(
+            FunctionName=os.environ["AWS_LAMBDA_FUNCTION_NAME"],
+            InvocationType="Event",
+            Payload=json.dumps(
+                {
+                    "presenceIndex": {
+                        "datasetId": dataset_id,
+                        "vcfChromosomeMap": vcf_chromosome_map,
+                    }
+                }
+            ),
+        )
+
+
+def create_dataset(attributes, records, analyses_samples):
     vcf_locations = set(attributes.get("vcfLocations", []))
-    errored, errors, vcf_chromosome_maps = get_vcf_chromosome_maps(vcf_locations)
+    errored, errors, vcf_chromosome_maps, vcfs_samples = get_vcf_headers(
+        vcf_locations
+    )
 
     if errored:
-        raise Exception(f"Error getting VCF chromosome maps: {errors}")
+        raise Exception(f"Error reading VCF headers: {errors}")
 
     datasetId = attributes.get("datasetId", None)
     threads = []
+    # a stale index could hide variants of the resubmitted vcfs
+    delete_presence_index(datasetId)
 
     # dataset metadata entry information
     json_dataset = attributes.get("dataset", None)
@@ -38,62 +78,85 @@ def create_dataset(attributes):
     threads.append(Thread(target=Dataset.upload_array, args=([json_dataset],)))
     threads[-1].start()
 
-    print("De-serialising started")
-    individuals = attributes.get("individuals", [])
-    biosamples = attributes.get("biosamples", [])
-    runs = attributes.get("runs", [])
-    analyses = attributes.get("analyses", [])
-    print("De-serialising complete")
-
-    analyses_samples = set([analysis["vcfSampleId"] for analysis in analyses])
-    errored, errors, vcfs_samples = get_vcfs_samples(attributes["vcfLocations"])
-
-    if errored:
-        raise Exception(f"Error getting VCF samples: {errors}")
-
     # check if all samples in analyses are in the VCFs
     if not analyses_samples.issubset(vcfs_samples):
         raise Exception(f"All samples in analyses not in VCFs")
     if not vcfs_samples.issubset(vcfs_samples):
         raise Exception(f"All samples in VCFs not in analyses")
 
-    # upload to s3
-    if len(individuals) > 0:
-        threads.append(Thread(target=Individual.upload_array, args=(individuals,)))
-        threads[-1].start()
-
-    if len(biosamples) > 0:
-        threads.append(Thread(target=Biosample.upload_array, args=(biosamples,)))
-        threads[-1].start()
-
-    if len(runs) > 0:
-        threads.append(Thread(target=Run.upload_array, args=(runs,)))
-        threads[-1].start()
-
-    if len(analyses) > 0:
-        threads.append(Thread(target=Analysis.upload_array, args=(analyses,)))
+    # stream each entity kind from the payload to s3
+    relations = DatasetRelations(datasetId)
+    for kind, model in zip(ENTITY_KINDS, (Individual, Biosample, Run, Analysis)):
+        threads.append(
+            Thread(
+                target=model.upload_array,
+                args=(relations.track(kind, records(kind)),),
+            )
+        )
         threads[-1].start()
 
     print("Awaiting uploads")
     [thread.join() for thread in threads]
+    relations.upload()
     print("Upload finished")
 
+    invoke_presence_index(datasetId, vcf_chromosome_maps)
+
 
-def validate_request(parameters):
-    # load validator
-    new_schema = "./schemas/submit-dataset-schema-new.json"
-    schema_dir = os.path.dirname(os.path.abspath(new_schema))
-    new_schema = json.load(open(new_schema))
+def load_validator(kind=None):
+    # validators are not thread safe, every thread loads its own
+    schema_dir = os.path.dirname(os.path.abspath(SCHEMA))
+    new_schema = json.load(open(SCHEMA))
     resolveNew = RefResolver(base_uri="file://" + schema_dir + "/", referrer=new_schema)
-    validator = Draft202012Validator(new_schema, resolver=resolveNew)
-    errors = []
+    # a single record of the given entity kind, or the whole submission
+    schema = new_schema["properties"][kind]["items"] if kind else new_schema
+    return Draft202012Validator(schema, resolver=resolveNew)
 
-    for error in sorted(validator.iter_errors(parameters), key=lambda e: e.path):
-        error_message = f"{error.message} "
-        for part in list(error.path):
-            error_message += f"/{part}"
-        errors.append(error_message)
-    return errors
+
+def format_error(error, prefix=()):
+    error_message = f"{error.message} "
+    for part in list(prefix) + list(error.path):
+        error_message += f"/{part}"
+    return error_message
+
+
+def validate_records(kind, records):
+    validator = load_validator(kind)
+    errors = []
+    samples = set()
+
+    for index, record in enumerate(records):
+        for error in validator.iter_errors(record):
+            errors.append(format_error(error, (kind, index)))
+        if kind == "analyses" and isinstance(record, dict) and "vcfSampleId" in record:
+            samples.add(record["vcfSampleId"])
+        if len(errors) >= MAX_VALIDATION_ERRORS:
+            break
+    return errors[:MAX_VALIDATION_ERRORS], samples
+
+
+def validate_request(parameters, records):
+    """
+    Validates the top level fields of the submission, then streams every
+    entity kind through its own schema. Returns the errors and the vcf
+    samples referenced by the analyses.
+    """
+    validator = load_validator()
+    errors = [
+        format_error(error)
+        for error in sorted(validator.iter_errors(parameters), key=lambda e: e.path)
+    ]
+
+    with ThreadPoolExecutor(len(ENTITY_KINDS)) as executor:
+        futures = [
+            executor.submit(validate_records, kind, records(kind))
+            for kind in ENTITY_KINDS
+        ]
+    results = [future.result() for future in futures]
+
+    for kind_errors, _ in results:
+        errors.extend(kind_errors)
+    return errors, results[ENTITY_KINDS.index("analyses")][1]
 
 
 def format_info(project_name, dataset_name, additional_info):
@@ -104,21 +167,53 @@ def format_info(project_name, dataset_name, additional_info):
     }
 
 
+def entity_records(payload, project_name, dataset_name, kind):
+    for record in payload.records(kind):
+        # anything but an object is left for the validator to report
+        if isinstance(record, dict):
+            # a copy, records held in memory are read once per pass
+            record = {
+                **record,
+                "datasetId": f"{project_name}:{dataset_name}",
+                "projectName": project_name,
+                "info": format_info(project_name, dataset_name, record.get("info", "")),
+            }
+        yield record
+
+
 def lambda_handler(event, context):
     print("Backend Event Received: {}".format(json.dumps(event)))
 
     if not event:
         return {"success": False, "message": "No body sent with request."}
+
+    if presence_index := event.get("presenceIndex"):
+        deadline = (
+            time.time()
+            + context.get_remaining_time_in_millis() / 1000
+            - PRESENCE_INDEX_MARGIN
+        )
+        try:
+            built = build_presence_index(
+                presence_index["datasetId"],
+                presence_index["vcfChromosomeMap"],
+                deadline,
+            )
+        finally:
+            clear_tmp()
+        if not built:
+            return {"success": False, "message": "Presence index failed"}
+        return {"success": True, "message": "Presence index built"}
+
     try:
-        body_dict = dict()
+        payload = DictPayload(dict())
         # json/csv/tsv submission entry
         s3payload = event.get("s3Payload")
         if type(s3payload) == str:
             if not s3payload.endswith(".json"):
                 raise ValueError
             else:
-                with sopen(s3payload, "r") as payload:
-                    body_dict = json.loads(payload.read())
+                payload = JsonPayload(s3payload)
         elif type(s3payload) == dict:
             if not all(
                 [
@@ -128,7 +223,8 @@ def lambda_handler(event, context):
             ):
                 raise ValueError
             else:
-                body_dict = transform_tabular_to_json(s3payload)
+                payload = TabularPayload(s3payload)
+        body_dict = payload.head
         # vcf files attached to the request
         body_dict["vcfLocations"] = event.get("vcfLocations", [])
         project_name = event.get("projectName")  # This is a required field
@@ -139,32 +235,10 @@ def lambda_handler(event, context):
         body_dict["projectName"] = project_name
         body_dict["dataset"]["datasetName"] = dataset_name
         body_dict["dataset"]["projectName"] = project_name
-
-        for individual in body_dict.get("individuals", []):
-            individual["datasetId"] = body_dict["datasetId"]
-            individual["projectName"] = project_name
-            individual["info"] = format_info(
-                project_name, dataset_name, individual.get("info", "")
-            )
-        for biosample in body_dict.get("biosamples", []):
-            biosample["datasetId"] = body_dict["datasetId"]
-            biosample["projectName"] = project_name
-            biosample["info"] = format_info(
-                project_name, dataset_name, biosample.get("info", "")
-            )
-        for run in body_dict.get("runs", []):
-            run["datasetId"] = body_dict["datasetId"]
-            run["projectName"] = project_name
-            run["info"] = format_info(project_name, dataset_name, run.get("info", ""))
-        for analysis in body_dict.get("analyses", []):
-            analysis["datasetId"] = body_dict["datasetId"]
-            analysis["projectName"] = project_name
-            analysis["info"] = format_info(
-                project_name, dataset_name, analysis.get("info", "")
-            )
         body_dict["index"] = False
+        records = partial(entity_records, payload, project_name, dataset_name)
 
-    except ValueError:
+    except (ValueError, ijson.JSONError):
         return {"success": False, "message": "Invalid payload"}
     except KeyError:
         return {
@@ -174,14 +248,16 @@ def lambda_handler(event, context):
     except Exception as e:
         return {"success": False, "message": str(e)}
 
-    if validation_errors := validate_request(body_dict):
+    validation_errors, analyses_samples = validate_request(body_dict, records)
+
+    if validation_errors:
         print(", ".join(validation_errors))
         return {"success": False, "message": validation_errors}
 
     print("Validated the payload")
 
     try:
-        create_dataset(body_dict)
+        create_dataset(body_dict, records, analyses_samples)
         response = {"success": True, "message": "Dataset submitted successfully"}
     except Exception as e:
         response = {"success": False, "message": str(e)}
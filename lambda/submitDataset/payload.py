@@ -0,0 +1,77 @@
+import ijson
+from ijson.common import ObjectBuilder
+from smart_open import open as sopen
+
+
+ENTITY_KINDS = ("individuals", "biosamples", "runs", "analyses")
+
+
+class JsonPayload:
+    """
+    JSON submission streamed from S3 with ijson.
+
+    Only the small top level fields are kept in memory, the entity arrays
+    are parsed again, one record at a time, on every call to records().
+    """
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.head = dict()
+        self.kinds = set()
+        self._read_head()
+
+    def _read_head(self):
+        key = None
+        builder = None
+
+        with sopen(self.uri, "rb") as payload:
+            events = ijson.parse(payload, use_float=True)
+            _, event, _ = next(events, (None, None, None))
+
+            if event != "start_map":
+                raise ValueError("Payload is not a JSON object")
+
+            for prefix, event, value in events:
+                if prefix == "":
+                    # a top level key or the end of the payload
+                    if builder is not None:
+                        self.head[key] = builder.value
+                    key, builder = value, None
+                    if key not in ENTITY_KINDS:
+                        builder = ObjectBuilder()
+                elif builder is not None:
+                    builder.event(event, value)
+                elif prefix == key and key not in self.kinds:
+                    self.kinds.add(key)
+                    # stands in for the array, so that the submission schema
+                    # still sees the key and its type
+                    self.head[key] = (
+                        []
+                        if event == "start_array"
+                        else {} if event == "start_map" else value
+                    )
+
+    def records(self, kind):
+        if kind not in self.kinds or self.head[kind] != []:
+            return
+        with sopen(self.uri, "rb") as payload:
+            yield from ijson.items(payload, f"{kind}.item", use_float=True)
+
+
+class DictPayload:
+    """
+    Submission already held in memory, such as one built from tabular files.
+    """
+
+    def __init__(self, body):
+        self._body = body
+        self.head = {
+            key: [] if key in ENTITY_KINDS and isinstance(value, list) else value
+            for key, value in body.items()
+        }
+        self.kinds = set(ENTITY_KINDS).intersection(body)
+
+    def records(self, kind):
+        if kind not in self.kinds or not isinstance(self._body[kind], list):
+            return iter(())
+        return iter(self._body[kind])
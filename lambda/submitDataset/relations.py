@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+import boto3
+from shared.athena.orc_writer import RollingOrcWriter
+from shared.utils import ENV_ATHENA
+
+
+s3 = boto3.client("s3")
+
+RELATIONS_SCHEMA = (
+    "struct<individualid:string,biosampleid:string,runid:string,analysisid:string>"
+)
+# the field of each entity kind linking it to its parent entity
+PARENT_FIELDS = {
+    "biosamples": "individualId",
+    "runs": "biosampleId",
+    "analyses": "runId",
+}
+
+
+def relations_folder(dataset_id):
+    # the folder of the dataset is its partition of the relations table
+    return f"relations-cache/{dataset_id}/"
+
+
+def relations_key(dataset_id):
+    return f"{relations_folder(dataset_id)}relations"
+
+
+class DatasetRelations:
+    """
+    Links between the entities of a dataset, gathered while the records
+    stream to S3 and written as the dataset's partition of the relations
+    table, in place of a join across every dataset of the beacon.
+    """
+
+    def __init__(self, dataset_id):
+        self.dataset_id = dataset_id
+        self.individuals = []
+        self.children = {kind: defaultdict(list) for kind in PARENT_FIELDS}
+
+    def track(self, kind, records):
+        # passes the records through, keeping only their ids
+        for record in records:
+            if kind == "individuals":
+                self.individuals.append(record.get("id"))
+            elif kind in PARENT_FIELDS:
+                parent = record.get(PARENT_FIELDS[kind])
+                self.children[kind][parent].append(record.get("id"))
+            yield record
+
+    def _linked(self, kind, parent):
+        # left outer join semantics, an entity without children still has a row
+        return (parent is not None and self.children[kind].get(parent)) or [None]
+
+    def rows(self):
+        for individual in self.individuals or [None]:
+            for biosample in self._linked("biosamples", individual):
+                for run in self._linked("runs", biosample):
+                    for analysis in self._linked("analyses", run):
+                        yield individual, biosample, run, analysis
+
+    def upload(self):
+        with RollingOrcWriter(
+            relations_key(self.dataset_id),
+            RELATIONS_SCHEMA,
+            bloom_filter_columns=[
+                "individualid",
+                "biosampleid",
+                "runid",
+                "analysisid",
+            ],
+        ) as writer:
+            for row in self.rows():
+                writer.write(row)
+        self._delete_stale_objects()
+
+    def _delete_stale_objects(self):
+        # files of the partition not written by this upload, such as those
+        # unloaded by the indexer's backfill of older datasets
+        key = relations_key(self.dataset_id)
+        paginator = s3.get_paginator("list_objects_v2")
+        stale = []
+
+        for page in paginator.paginate(
+            Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+            Prefix=relations_folder(self.dataset_id),
+        ):
+            for item in page.get("Contents", []):
+                if item["Key"] != key and not item["Key"].startswith(f"{key}.part-"):
+                    stale.append({"Key": item["Key"]})
+
+        for n in range(0, len(stale), 1000):
+            s3.delete_objects(
+                Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+                Delete={"Objects": stale[n : n + 1000]},
+            )
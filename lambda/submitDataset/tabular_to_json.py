@@ -1,268 +1,300 @@
-from functools import lru_cache
-from itertools import chain
 import json
 import os
 
 import duckdb
 
-REGION = os.environ["REGION"]
-
-
-@lru_cache(maxsize=1000)
-def fetch_term(con, term):
-    if not len(term):
-        return {"id": "", "label": "", "ontology": ""}
-    result = con.execute(f"SELECT * FROM dictionary WHERE id = '{term}'").df()
-    return result.iloc[0].to_dict()
-
-
-def get_disease_codes(diseases_df, individual_id):
-    if not individual_id in diseases_df.index:
-        return []
-    diseases_str = diseases_df.loc[individual_id].iloc[0]
-    diseases = diseases_str.split(",") if diseases_str else []
-    return diseases
-
-
-def transform_dataset(con):
-    datasets_df = con.execute("SELECT * FROM dataset").df()
-
-    for row in datasets_df.iterrows():
-        idx, data = row
-        data = data.to_dict()
-        dataset = {
-            "id": data["id"],
-            "createDateTime": data["createDateTime"],
-            "dataUseConditions": {
-                "duoDataUse": [
-                    {
-                        "id": cond,
-                        "label": fetch_term(con, cond)["label"],
-                        "version": ver,
-                    }
-                    for (cond, ver) in zip(
-                        data["dataUseConditions"].split(","),
-                        data["dataUseConditionsVersions"].split(","),
-                    )
-                ]
-            },
-            "description": data["description"],
-            "externalUrl": data["externalUrl"],
-            "info": {},
-            "name": data["name"],
-            "updateDateTime": data["updateDateTime"],
-            "version": data["version"],
-        }
-
-    return dataset
-
+from payload import ENTITY_KINDS
 
-def transform_individuals(con):
-    individuals_df = con.execute("SELECT * FROM individuals").df()
-    diseases_df = (
-        con.execute(
-            "SELECT individual_id, GROUP_CONCAT(disease, ',') diseases FROM diseases GROUP BY individual_id"
-        )
-        .df()
-        .set_index("individual_id")
+REGION = os.environ["REGION"]
+# rows pulled from duckdb at a time while streaming records
+CHUNK_ROWS = 10000
+
+# columns holding dictionary term ids, the lists are comma separated
+TERM_COLUMNS = {
+    "individuals": ["ethnicity_id", "geographic_origin_id", "sex_id"],
+    "diseases": ["disease"],
+    "biosamples": [
+        "biosample_status_id",
+        "histological_diagnosis_id",
+        "sample_origin_type_id",
+        "obtention_procedure_id",
+        "tumor_progression_id",
+        "sample_origin_detail_id",
+    ],
+    "runs": ["library_source", "platform_model"],
+}
+TERM_LIST_COLUMNS = {
+    "dataset": ["dataUseConditions"],
+    "individuals": ["interventions_or_procedures"],
+    "biosamples": ["pathological_tnm_finding"],
+}
+
+
+def term(column, alias):
+    # {id, label} of a term column joined to the terms table as alias
+    return f"{{'id': coalesce({column}, ''), 'label': coalesce({alias}.label, '')}}"
+
+
+def term_list(table, column, item):
+    """
+    Subquery aggregating a comma separated term column into a list per row,
+    in the order written. item is the list element, over code and label.
+    """
+    return f"""
+        SELECT
+            codes._row,
+            list({item} ORDER BY codes.pos) AS items
+        FROM (
+            SELECT
+                rowid AS _row,
+                unnest(string_split({column}, ',')) AS code,
+                generate_subscripts(string_split({column}, ','), 1) AS pos
+            FROM {table}
+            WHERE coalesce({column}, '') <> ''
+        ) codes
+        LEFT JOIN terms ON terms.id = codes.code
+        GROUP BY codes._row
+    """
+
+
+DATASET_QUERY = """
+    WITH conditions AS (
+        SELECT
+            codes._row,
+            list(
+                {'id': codes.code, 'label': coalesce(terms.label, ''), 'version': codes.version}
+                ORDER BY codes.pos
+            ) AS items
+        FROM (
+            SELECT
+                rowid AS _row,
+                unnest(string_split("dataUseConditions", ',')) AS code,
+                unnest(string_split("dataUseConditionsVersions", ',')) AS version,
+                generate_subscripts(string_split("dataUseConditions", ','), 1) AS pos
+            FROM dataset
+        ) codes
+        LEFT JOIN terms ON terms.id = codes.code
+        -- conditions and versions are paired up to the shorter of the two
+        WHERE codes.code IS NOT NULL AND codes.version IS NOT NULL
+        GROUP BY codes._row
     )
+    SELECT {
+        'id': d.id,
+        'createDateTime': d."createDateTime",
+        'dataUseConditions': {'duoDataUse': coalesce(conditions.items, [])},
+        'description': d.description,
+        'externalUrl': d."externalUrl",
+        'name': d.name,
+        'updateDateTime': d."updateDateTime",
+        'version': d.version
+    } AS record
+    FROM dataset d
+    LEFT JOIN conditions ON conditions._row = d.rowid
+    ORDER BY d.rowid
+"""
+
+INDIVIDUALS_QUERY = f"""
+    WITH diseases_of AS (
+        SELECT
+            diseases.individual_id,
+            list(
+                {{'diseaseCode': {term("diseases.disease", "terms")}}}
+                ORDER BY diseases.rowid
+            ) AS items
+        FROM diseases
+        LEFT JOIN terms ON terms.id = diseases.disease
+        WHERE diseases.disease IS NOT NULL
+        GROUP BY diseases.individual_id
+    ),
+    procedures AS ({term_list(
+        "individuals",
+        "interventions_or_procedures",
+        "{'procedureCode': {'id': codes.code, 'label': coalesce(terms.label, '')}}",
+    )})
+    SELECT {{
+        'id': coalesce(i.id, ''),
+        'ethnicity': {term("i.ethnicity_id", "ethnicity")},
+        'geographicOrigin': {term("i.geographic_origin_id", "origin")},
+        'diseases': coalesce(diseases_of.items, []),
+        'interventionsOrProcedures': coalesce(procedures.items, []),
+        'karyotypicSex': coalesce(i.karyotypic_sex, ''),
+        'sex': {term("i.sex_id", "sex")}
+    }} AS record
+    FROM individuals i
+    LEFT JOIN terms ethnicity ON ethnicity.id = i.ethnicity_id
+    LEFT JOIN terms origin ON origin.id = i.geographic_origin_id
+    LEFT JOIN terms sex ON sex.id = i.sex_id
+    LEFT JOIN diseases_of ON diseases_of.individual_id = i.id
+    LEFT JOIN procedures ON procedures._row = i.rowid
+    ORDER BY i.rowid
+"""
+
+BIOSAMPLES_QUERY = f"""
+    WITH findings AS ({term_list(
+        "biosamples",
+        "pathological_tnm_finding",
+        "{'id': codes.code, 'label': coalesce(terms.label, '')}",
+    )})
+    SELECT {{
+        'id': coalesce(b.id, ''),
+        'individualId': coalesce(b.individual_id, ''),
+        'biosampleStatus': {term("b.biosample_status_id", "status")},
+        'pathologicalTnmFinding': coalesce(findings.items, []),
+        'collectionDate': coalesce(b.collection_date, ''),
+        'collectionMoment': coalesce(b.collection_moment, ''),
+        'histologicalDiagnosis': {term("b.histological_diagnosis_id", "diagnosis")},
+        'sampleOriginType': {term("b.sample_origin_type_id", "origin_type")},
+        'notes': '',
+        -- optional, dropped from the record when empty
+        'obtentionProcedure': CASE WHEN coalesce(b.obtention_procedure_id, '') <> ''
+            THEN {{'procedureCode': {term("b.obtention_procedure_id", "procedure")}}}
+        END,
+        'tumorProgression': CASE WHEN coalesce(b.tumor_progression_id, '') <> ''
+            THEN {term("b.tumor_progression_id", "progression")}
+        END,
+        'sampleOriginDetail': CASE WHEN coalesce(b.sample_origin_detail_id, '') <> ''
+            THEN {term("b.sample_origin_detail_id", "origin_detail")}
+        END
+    }} AS record
+    FROM biosamples b
+    LEFT JOIN terms status ON status.id = b.biosample_status_id
+    LEFT JOIN terms diagnosis ON diagnosis.id = b.histological_diagnosis_id
+    LEFT JOIN terms origin_type ON origin_type.id = b.sample_origin_type_id
+    LEFT JOIN terms procedure ON procedure.id = b.obtention_procedure_id
+    LEFT JOIN terms progression ON progression.id = b.tumor_progression_id
+    LEFT JOIN terms origin_detail ON origin_detail.id = b.sample_origin_detail_id
+    LEFT JOIN findings ON findings._row = b.rowid
+    ORDER BY b.rowid
+"""
+
+RUNS_QUERY = f"""
+    SELECT {{
+        'id': coalesce(r.id, ''),
+        'biosampleId': coalesce(r.biosample_id, ''),
+        'individualId': coalesce(r.individual_id, ''),
+        'libraryLayout': coalesce(r.library_layout, ''),
+        'librarySelection': coalesce(r.library_selection, ''),
+        'librarySource': {term("r.library_source", "source")},
+        'libraryStrategy': coalesce(r.library_strategy, ''),
+        'platform': coalesce(r.platform, ''),
+        'platformModel': {term("r.platform_model", "model")},
+        'runDate': coalesce(r.run_date, '')
+    }} AS record
+    FROM runs r
+    LEFT JOIN terms source ON source.id = r.library_source
+    LEFT JOIN terms model ON model.id = r.platform_model
+    ORDER BY r.rowid
+"""
+
+ANALYSES_QUERY = """
+    SELECT {
+        'id': coalesce(a.id, ''),
+        'individualId': coalesce(a.individual_id, ''),
+        'biosampleId': coalesce(a.biosample_id, ''),
+        'runId': coalesce(a.run_id, ''),
+        'aligner': coalesce(a.aligner, ''),
+        'analysisDate': coalesce(a.analysis_date, ''),
+        'pipelineName': coalesce(a.pipeline_name, ''),
+        'pipelineRef': coalesce(a.pipeline_ref, ''),
+        'variantCaller': coalesce(a.variant_caller, ''),
+        'vcfSampleId': coalesce(a.vcf_sample_id, '')
+    } AS record
+    FROM analyses a
+    ORDER BY a.rowid
+"""
+
+QUERIES = {
+    "individuals": INDIVIDUALS_QUERY,
+    "biosamples": BIOSAMPLES_QUERY,
+    "runs": RUNS_QUERY,
+    "analyses": ANALYSES_QUERY,
+}
+
+
+def missing_terms_query():
+    used = [
+        f'SELECT "{column}" AS code FROM {table}'
+        for table, columns in TERM_COLUMNS.items()
+        for column in columns
+    ] + [
+        f"SELECT unnest(string_split(\"{column}\", ',')) AS code FROM {table}"
+        for table, columns in TERM_LIST_COLUMNS.items()
+        for column in columns
+    ]
+    return f"""
+        SELECT DISTINCT used.code
+        FROM ({" UNION ALL ".join(used)}) used
+        ANTI JOIN terms ON terms.id = used.code
+        WHERE coalesce(used.code, '') <> ''
+        ORDER BY used.code
+    """
+
+
+class TabularPayload:
+    """
+    CSV/TSV submission loaded into duckdb. The beacon records are built by
+    joins against the dictionary and streamed in chunks, once per call to
+    records(), the same way JsonPayload streams a JSON submission.
+    """
+
+    def __init__(self, s3payload):
+        print("Transforming CSV/TSV to JSON")
+        self.con = duckdb.connect("/tmp/metadata.db")
+        self.con.execute("SET home_directory='/tmp';")
+        self.con.execute("INSTALL httpfs; LOAD httpfs;")
+        self.con.execute(f"SET s3_region='{REGION}';")
+        self.con.execute(f"SET s3_endpoint='s3.{REGION}.amazonaws.com';")
+        for table, file_key in s3payload.items():
+            file_extension = file_key.split(".")[-1]
+            delim = "," if file_extension == "csv" else "\t"
+            self.con.execute(
+                f"""
+                CREATE OR REPLACE TABLE {table} AS
+                SELECT * FROM read_csv(
+                    '{file_key}',
+                    ALL_VARCHAR=TRUE,
+                    DELIM='{delim}'
+                )"""
+            )
+        # the first entry of an id wins, as with the former per term lookups
+        self.con.execute(
+            """
+            CREATE OR REPLACE TABLE terms AS
+            SELECT id, arg_min(label, rowid) AS label
+            FROM dictionary
+            GROUP BY id
+            """
+        )
 
-    individuals = []
-
-    for data in individuals_df.iterrows():
-        idx, data = data
-        data.fillna("", inplace=True)
-        data = data.to_dict()
-        individual = {
-            "id": data["id"],
-            "ethnicity": {
-                "id": data["ethnicity_id"],
-                "label": fetch_term(con, data["ethnicity_id"])["label"],
-            },
-            "geographicOrigin": {
-                "id": data["geographic_origin_id"],
-                "label": fetch_term(con, data["geographic_origin_id"])["label"],
-            },
-            "diseases": [
-                {"diseaseCode": {"id": code, "label": fetch_term(con, code)["label"]}}
-                for code in get_disease_codes(diseases_df, data["id"])
-            ],
-            "interventionsOrProcedures": [
-                {"procedureCode": {"id": proc, "label": fetch_term(con, proc)["label"]}}
-                for proc in (
-                    data["interventions_or_procedures"].split(",")
-                    if data["interventions_or_procedures"]
-                    else []
-                )
-            ],
-            "karyotypicSex": data["karyotypic_sex"],
-            "sex": {
-                "id": data["sex_id"],
-                "label": fetch_term(con, data["sex_id"])["label"],
-            },
-        }
-        individuals.append(individual)
-
-    return individuals
-
-
-def transform_biosamples(con):
-    biosamples_df = con.execute("SELECT * FROM biosamples").df()
-
-    biosamples = []
-
-    for data in biosamples_df.iterrows():
-        idx, data = data
-        data.fillna("", inplace=True)
-        data = data.to_dict()
-        biosample = {
-            "id": data["id"],
-            "individualId": data["individual_id"],
-            "biosampleStatus": {
-                "id": data["biosample_status_id"],
-                "label": fetch_term(con, data["biosample_status_id"])["label"],
-            },
-            "pathologicalTnmFinding": [
-                {"id": code, "label": fetch_term(con, code)["label"]}
-                for code in (
-                    data["pathological_tnm_finding"].split(",")
-                    if data["pathological_tnm_finding"]
-                    else []
-                )
-            ],
-            "collectionDate": data["collection_date"],
-            "collectionMoment": data["collection_moment"],
-            "histologicalDiagnosis": {
-                "id": data["histological_diagnosis_id"],
-                "label": fetch_term(con, data["histological_diagnosis_id"])["label"],
-            },
-            "sampleOriginType": {
-                "id": data["sample_origin_type_id"],
-                "label": fetch_term(con, data["sample_origin_type_id"])["label"],
-            },
-            "info": {},
-            "notes": "",
-        }
-
-        if data["obtention_procedure_id"]:
-            biosample["obtentionProcedure"] = {
-                "procedureCode": {
-                    "id": data["obtention_procedure_id"],
-                    "label": fetch_term(con, data["obtention_procedure_id"])["label"],
-                }
-            }
-        if data["tumor_progression_id"]:
-            biosample["tumorProgression"] = {
-                "id": data["tumor_progression_id"],
-                "label": fetch_term(con, data["tumor_progression_id"])["label"],
-            }
-        if data["sample_origin_detail_id"]:
-            biosample["sampleOriginDetail"] = {
-                "id": data["sample_origin_detail_id"],
-                "label": fetch_term(con, data["sample_origin_detail_id"])["label"],
-            }
-        biosamples.append(biosample)
-
-    return biosamples
-
-
-def transform_runs(con):
-    runs_df = con.execute("SELECT * FROM runs").df()
-
-    runs = []
-
-    for data in runs_df.iterrows():
-        idx, data = data
-        data.fillna("", inplace=True)
-        data = data.to_dict()
-        run = {
-            "id": data["id"],
-            "biosampleId": data["biosample_id"],
-            "individualId": data["individual_id"],
-            "libraryLayout": data["library_layout"],
-            "librarySelection": data["library_selection"],
-            "librarySource": {
-                "id": data["library_source"],
-                "label": fetch_term(con, data["library_source"])["label"],
-            },
-            "libraryStrategy": data["library_strategy"],
-            "platform": data["platform"],
-            "platformModel": {
-                "id": data["platform_model"],
-                "label": fetch_term(con, data["platform_model"])["label"],
-            },
-            "runDate": data["run_date"],
-        }
-        runs.append(run)
-
-    return runs
-
-
-def transform_analyses(con):
-    analyses_df = con.execute("SELECT * FROM analyses").df()
-
-    analyses = []
-
-    for data in analyses_df.iterrows():
-        idx, data = data
-        data.fillna("", inplace=True)
-        data = data.to_dict()
-        analysis = {
-            "id": data["id"],
-            "individualId": data["individual_id"],
-            "biosampleId": data["biosample_id"],
-            "runId": data["run_id"],
-            "aligner": data["aligner"],
-            "analysisDate": data["analysis_date"],
-            "pipelineName": data["pipeline_name"],
-            "pipelineRef": data["pipeline_ref"],
-            "variantCaller": data["variant_caller"],
-            "vcfSampleId": data["vcf_sample_id"],
+        missing = self.con.execute(missing_terms_query()).fetchall()
+        if missing:
+            raise Exception(
+                f"Terms not found in the dictionary: {', '.join(c for (c,) in missing)}"
+            )
+
+        if not (datasets := self.con.execute(DATASET_QUERY).fetchall()):
+            raise KeyError("dataset")
+        self.head = {
+            # the last dataset row is the one submitted
+            "dataset": {**datasets[-1][0], "info": {}},
+            "assemblyId": "GRCh38",
+            **{kind: [] for kind in ENTITY_KINDS},
         }
-        analyses.append(analysis)
-
-    return analyses
-
+        self.kinds = set(ENTITY_KINDS)
 
-def transform_tabular_to_json(s3payload) -> dict:
-    print("Transforming CSV/TSV to JSON")
-    con = duckdb.connect("/tmp/metadata.db")
-    con.execute("SET home_directory='/tmp';")
-    con.execute("INSTALL httpfs; LOAD httpfs;")
-    con.execute(f"SET s3_region='{REGION}';") 
-    con.execute(f"SET s3_endpoint='s3.{REGION}.amazonaws.com';")
-    for table, file_key in s3payload.items():
-        file_extension = file_key.split(".")[-1]
-        delim = "," if file_extension == "csv" else "\t"
-        con.execute(
-            f"""
-            CREATE TABLE IF NOT EXISTS {table} AS
-            SELECT * FROM read_csv(
-                '{file_key}',
-                ALL_VARCHAR=TRUE,
-                DELIM='{delim}'
-            )"""
+    def records(self, kind):
+        # a cursor of its own, records are streamed from several threads.
+        # duckdb serialises the structs faster than python converts them
+        result = self.con.cursor().execute(
+            f"SELECT to_json(record) FROM ({QUERIES[kind]})"
         )
 
-    con.execute("SHOW TABLES").df()
-
-    dataset = transform_dataset(con)
-
-    individuals = transform_individuals(con)
-
-    biosamples = transform_biosamples(con)
-
-    runs = transform_runs(con)
-
-    analyses = transform_analyses(con)
-
-    body_dict = {
-        "dataset": dataset,
-        "assemblyId": "GRCh38",
-        "individuals": individuals,
-        "biosamples": biosamples,
-        "runs": runs,
-        "analyses": analyses,
-    }
-
-    return body_dict
+        while rows := result.fetchmany(CHUNK_ROWS):
+            for (record,) in rows:
+                record = json.loads(record)
+                if kind == "biosamples":
+                    record = {
+                        key: value for key, value in record.items() if value is not None
+                    }
+                    record["info"] = {}
+                yield record
@@ -1,51 +1,167 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Set
+import json
+import subprocess
+import threading
+import time
 
-from shared.utils import get_vcf_chromosomes, get_vcf_samples
+import boto3
 
+from shared.dynamodb import get_vcf_header
+from shared.utils import (
+    ENV_ATHENA,
+    BloomFilter,
+    dump_presence_index,
+    presence_index_block,
+    presence_index_key,
+    presence_index_prefix,
+    presence_index_status_key,
+)
 
-def get_vcf_chromosome_map(vcf_location):
-    errored, error, chroms = get_vcf_chromosomes(vcf_location)
-    vcf_chromosome_map = None
-    if not errored:
-        vcf_chromosome_map = {"vcf": vcf_location, "chromosomes": chroms}
 
-    return errored, error, vcf_chromosome_map
+s3 = boto3.client("s3")
 
 
-def get_vcf_chromosome_maps(vcf_locations):
-    executor = ThreadPoolExecutor(32)
+def get_vcf_headers(vcf_locations):
+    # one bounded pool for all vcfs, headers are memoized in the vcfs table
     errored = False
     errors = []
     vcf_chromosome_maps = []
-    vcf_chromosome_map_futures = [
-        executor.submit(get_vcf_chromosome_map, vcf_location)
-        for vcf_location in set(vcf_locations)
-    ]
+    vcfs_samples = set()
 
-    for vcf_chromosome_map_future in as_completed(vcf_chromosome_map_futures):
-        (
-            task_errored,
-            error,
-            vcf_chromosome_map,
-        ) = vcf_chromosome_map_future.result()
-        errored = errored or task_errored
-        errors.append(error)
-        vcf_chromosome_maps.append(vcf_chromosome_map)
+    with ThreadPoolExecutor(32) as executor:
+        futures = {
+            executor.submit(get_vcf_header, vcf_location): vcf_location
+            for vcf_location in set(vcf_locations)
+        }
 
-    return errored, errors, vcf_chromosome_maps
+        for future in as_completed(futures):
+            task_errored, error, header = future.result()
+            errored = errored or task_errored
+            if task_errored:
+                errors.append(error)
+                continue
+            vcf_chromosome_maps.append(
+                {"vcf": futures[future], "chromosomes": header["chromosomes"]}
+            )
+            vcfs_samples.update(header["samples"])
 
+    return errored, errors, vcf_chromosome_maps, vcfs_samples
 
-def get_vcfs_samples(vcfs) -> Set[str]:
-    errored = False
-    errors = []
-    vcfs_samples = set()
-    vcf_samples_futures = [
-        ThreadPoolExecutor().submit(get_vcf_samples, vcf) for vcf in vcfs
+
+def _block_bloom(positions):
+    bloom = BloomFilter.for_capacity(len(positions))
+    for position in positions:
+        bloom.add(position)
+    return bloom
+
+
+def build_chromosome_blooms(vcf_location, chromosome, deadline):
+    """
+    Blooms of the positions of each block of the chromosome, sized to the
+    records of the block. Records come in position order, so only the
+    positions of one block are held at a time.
+    """
+    blooms = dict()
+    block = None
+    positions = []
+    args = [
+        "bcftools",
+        "query",
+        "--regions",
+        chromosome,
+        "--format",
+        "%POS\n",
+        vcf_location,
     ]
-    for vcf_samples_future in vcf_samples_futures:
-        task_errored, error, samples = vcf_samples_future.result()
-        errored = errored or task_errored
-        errors.append(error)
-        vcfs_samples.update(samples)
-    return errored, errors, vcfs_samples
+    query_process = subprocess.Popen(
+        args, stdout=subprocess.PIPE, cwd="/tmp", encoding="utf-8"
+    )
+    # stopped before the lambda times out, so that the failure is recorded
+    watchdog = threading.Timer(deadline - time.time(), query_process.kill)
+    watchdog.start()
+
+    try:
+        for line in query_process.stdout:
+            position = line.strip()
+            line_block = presence_index_block(position)
+            if line_block != block:
+                if positions:
+                    blooms[block] = _block_bloom(positions)
+                block = line_block
+                positions = []
+            positions.append(position)
+        if positions:
+            blooms[block] = _block_bloom(positions)
+        query_process.stdout.close()
+        returncode = query_process.wait()
+    finally:
+        watchdog.cancel()
+
+    if time.time() >= deadline:
+        raise Exception(
+            f"Timed out reading positions of {vcf_location} on {chromosome}"
+        )
+    if returncode != 0:
+        raise Exception(
+            f"Error reading positions of {vcf_location} on {chromosome}"
+        )
+    return chromosome, blooms
+
+
+def delete_presence_index(dataset_id):
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Prefix=presence_index_prefix(dataset_id),
+    ):
+        objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+        if objects:
+            s3.delete_objects(
+                Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+                Delete={"Objects": objects},
+            )
+
+
+def write_presence_index_status(dataset_id, vcf_location, status, **fields):
+    s3.put_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=presence_index_status_key(dataset_id, vcf_location),
+        Body=json.dumps({"vcf": vcf_location, "status": status, **fields}),
+    )
+
+
+def build_presence_index(dataset_id, vcf_chromosome_map, deadline):
+    """
+    Builds and writes the presence index of one vcf of the dataset, its
+    chromosomes scanned in parallel, giving up at deadline. The outcome is
+    recorded in the status object of the vcf, a vcf left without an index
+    is searched in full.
+    """
+    vcf_location = vcf_chromosome_map["vcf"]
+    write_presence_index_status(dataset_id, vcf_location, "building")
+
+    try:
+        with ThreadPoolExecutor(32) as executor:
+            blooms = dict(
+                executor.map(
+                    lambda chromosome: build_chromosome_blooms(
+                        vcf_location, chromosome, deadline
+                    ),
+                    vcf_chromosome_map["chromosomes"],
+                )
+            )
+
+        s3.put_object(
+            Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+            Key=presence_index_key(dataset_id, vcf_location),
+            Body=dump_presence_index(blooms),
+        )
+    except Exception as e:
+        print(f"Presence index of {vcf_location} in {dataset_id} failed: {e}")
+        write_presence_index_status(dataset_id, vcf_location, "failed", message=str(e))
+        return False
+
+    write_presence_index_status(dataset_id, vcf_location, "completed")
+    print(f"Presence index written for {vcf_location} in {dataset_id}")
+    return True
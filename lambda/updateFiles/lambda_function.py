@@ -1,11 +1,12 @@
 import json
 import os
-import subprocess
 from urllib.parse import unquote_plus
 
 import boto3
 from botocore.exceptions import ClientError
 
+from shared.dynamodb import get_vcf_header
+
 HUB_NAME = os.environ["HUB_NAME"]
 DPORTAL_BUCKET = os.environ["DPORTAL_BUCKET"]
 PROJECTS_TABLE = os.environ["DYNAMO_PROJECTS_TABLE"]
@@ -33,41 +34,30 @@ s3 = boto3.client("s3")
 
 
 def count_samples_and_update_vcf(vcf_location):
-    try:
-        num_samples = count_samples(f"s3://{DPORTAL_BUCKET}/projects/{vcf_location}")
+    errored, error, header = get_vcf_header(
+        f"s3://{DPORTAL_BUCKET}/projects/{vcf_location}", chromosomes=False
+    )
+    if errored:
+        print(f"Error counting samples for {vcf_location}: {error}")
+        num_samples = 0
         update_fields = {
             "num_samples": {
                 "N": str(num_samples),
             },
+            "error_message": {"S": error},
         }
-    except subprocess.CalledProcessError as e:
-        print(f"Error counting samples for {vcf_location}: {e.__dict__}")
-        num_samples = 0
+    else:
+        num_samples = len(header["samples"])
+        print(f"Counted {num_samples} samples")
         update_fields = {
             "num_samples": {
                 "N": str(num_samples),
             },
-            "error_message": {"S": e.stderr},
         }
     update_file(vcf_location, update_fields)
     return num_samples
 
 
-def count_samples(s3_location):
-    process_args = ["bcftools", "query", "-l", s3_location]
-    print(f"Running process with args: {process_args}")
-    query_process = subprocess.run(
-        args=process_args,
-        capture_output=True,
-        check=True,
-        cwd="/tmp",
-        encoding="ascii",
-    )
-    num_samples = query_process.stdout.count("\n")
-    print(f"Counted {num_samples} samples")
-    return num_samples
-
-
 def get_all_counts(project, all_files):
     vcf_locations = [
         f"{project}/project-files/{file_name}"
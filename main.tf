@@ -44,7 +44,8 @@ locals {
     BEACON_SERVICE_TYPE_ARTIFACT = var.beacon-service-type-artifact
     BEACON_SERVICE_TYPE_VERSION  = var.beacon-service-type-version
     # configurations
-    CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE = var.config-max-variant-search-base-range
+    CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE    = var.config-max-variant-search-base-range
+    CONFIG_MAX_VARIANT_QUERY_JOB_BASE_RANGE = var.config-max-variant-query-job-base-range
   }
   # athena related variables
   athena_variables = {
@@ -65,6 +66,7 @@ locals {
     ATHENA_TERMS_INDEX_TABLE       = aws_cloudformation_stack.sbeacon_terms_index_stack.parameters.TableName
     ATHENA_TERMS_CACHE_TABLE       = aws_glue_catalog_table.sbeacon-terms-cache.name
     ATHENA_RELATIONS_TABLE         = aws_glue_catalog_table.sbeacon-relations.name
+    ATHENA_CARRIERS_TABLE          = aws_glue_catalog_table.sbeacon-carriers.name
   }
   # dynamodb variables
   dynamodb_variables = {
@@ -74,6 +76,9 @@ locals {
     DYNAMO_PROJECT_USERS_TABLE               = aws_dynamodb_table.project_users.name
     DYNAMO_PROJECT_USERS_UID_INDEX           = local.project_users_uid_index
     DYNAMO_QUOTA_USER_TABLE                  = aws_dynamodb_table.sbeacon-dataportal-users-quota.name
+    DYNAMO_VARIANT_QUERIES_TABLE             = aws_dynamodb_table.variant_queries.name
+    DYNAMO_COHORT_JOBS_TABLE                 = aws_dynamodb_table.cohort_jobs.name
+    DYNAMO_VCFS_TABLE                        = aws_dynamodb_table.vcfs.name
     DYNAMO_DATAPORTAL_LOCKS_TABLE            = aws_dynamodb_table.dataportal_locks_table.name
     DYNAMO_JUPYTER_INSTANCES_TABLE           = aws_dynamodb_table.juptyer_notebooks.name
     DYNAMO_USER_INFO_TABLE                   = aws_dynamodb_table.sbeacon_dataportal_users_info.name
@@ -108,7 +113,7 @@ module "lambda-submitDataset" {
   image_uri           = module.docker_image_submitDataset_lambda.image_uri
   package_type        = "Image"
   memory_size         = 1769
-  timeout             = 60
+  timeout             = 900
   attach_policy_jsons = true
   policy_jsons = [
     data.aws_iam_policy_document.lambda-submitDataset.json,
@@ -336,8 +341,9 @@ module "lambda-getGenomicVariants" {
     data.aws_iam_policy_document.athena-full-access.json,
     data.aws_iam_policy_document.dynamodb-onto-access.json,
     data.aws_iam_policy_document.dynamodb-quota-access.json,
+    data.aws_iam_policy_document.dynamodb-variant-queries-access.json,
   ]
-  number_of_policy_jsons = 4
+  number_of_policy_jsons = 5
   source_path            = "${path.module}/lambda/getGenomicVariants"
 
   tags = var.common-tags
@@ -524,21 +530,30 @@ module "lambda-getRuns" {
 module "lambda-splitQuery" {
   source = "terraform-aws-modules/lambda/aws"
 
-  function_name      = "sbeacon-backend-splitQuery"
-  description        = "Splits a dataset into smaller slices of VCFs and invokes performQuery on each."
-  handler            = "lambda_function.lambda_handler"
-  runtime            = "python3.12"
-  memory_size        = 1769
-  timeout            = 30
-  attach_policy_json = true
-  policy_json        = data.aws_iam_policy_document.lambda-splitQuery.json
-  source_path        = "${path.module}/lambda/splitQuery"
-  tags               = var.common-tags
+  function_name       = "sbeacon-backend-splitQuery"
+  description         = "Splits a dataset into smaller slices of VCFs and invokes performQuery on each."
+  handler             = "lambda_function.lambda_handler"
+  runtime             = "python3.12"
+  memory_size         = 1769
+  timeout             = 30
+  attach_policy_jsons = true
+  policy_jsons = [
+    data.aws_iam_policy_document.lambda-splitQuery.json,
+    data.aws_iam_policy_document.dynamodb-variant-queries-access.json,
+  ]
+  number_of_policy_jsons = 2
+  source_path            = "${path.module}/lambda/splitQuery"
+  tags                   = var.common-tags
 
-  environment_variables = {
-    PERFORM_QUERY_LAMBDA    = module.lambda-performQuery.lambda_function_name,
-    PERFORM_QUERY_TOPIC_ARN = aws_sns_topic.performQuery.arn
-  }
+  environment_variables = merge(
+    {
+      PERFORM_QUERY_LAMBDA    = module.lambda-performQuery.lambda_function_name,
+      PERFORM_QUERY_TOPIC_ARN = aws_sns_topic.performQuery.arn,
+      SPLIT_QUERY_TOPIC_ARN   = aws_sns_topic.splitQuery.arn,
+      ATHENA_METADATA_BUCKET  = aws_s3_bucket.metadata-bucket.bucket
+    },
+    local.dynamodb_variables
+  )
 
   layers = [
     local.python_libraries_layer,
@@ -571,8 +586,9 @@ module "lambda-performQuery" {
   ]
 
   environment_variables = merge({
-    HTS_S3_HOST     = "s3.${var.region}.amazonaws.com"
-    VARIANTS_BUCKET = aws_s3_bucket.variants-bucket.bucket
+    HTS_S3_HOST      = "s3.${var.region}.amazonaws.com"
+    VARIANTS_BUCKET  = aws_s3_bucket.variants-bucket.bucket
+    VCF_QUERY_ENGINE = var.variant-query-engine
     },
     local.sbeacon_variables,
   local.dynamodb_variables)
@@ -699,15 +715,16 @@ module "lambda-updateFiles" {
   source_path        = "${path.module}/lambda/updateFiles"
   tags               = var.common-tags
 
-  environment_variables = {
-    HUB_NAME                              = var.hub_name
-    DPORTAL_BUCKET                        = aws_s3_bucket.dataportal-bucket.bucket
-    DYNAMO_PROJECTS_TABLE                 = aws_dynamodb_table.projects.name
-    DYNAMO_VCFS_TABLE                     = aws_dynamodb_table.vcfs.name
-    DYNAMO_CLINIC_JOBS_TABLE              = aws_dynamodb_table.clinic_jobs.name
-    DYNAMO_CLINIC_JOBS_PROJECT_NAME_INDEX = local.clinic_jobs_project_name_index
-    HTS_S3_HOST                           = "s3.${var.region}.amazonaws.com"
-  }
+  environment_variables = merge(
+    {
+      HUB_NAME                              = var.hub_name
+      DPORTAL_BUCKET                        = aws_s3_bucket.dataportal-bucket.bucket
+      DYNAMO_PROJECTS_TABLE                 = aws_dynamodb_table.projects.name
+      DYNAMO_CLINIC_JOBS_PROJECT_NAME_INDEX = local.clinic_jobs_project_name_index
+      HTS_S3_HOST                           = "s3.${var.region}.amazonaws.com"
+    },
+    local.dynamodb_variables
+  )
 
   layers = [
     local.binaries_layer,
@@ -845,7 +862,7 @@ module "lambda-generateCohortVCfs" {
   runtime             = "python3.12"
   handler             = "lambda_function.lambda_handler"
   memory_size         = var.region == "ap-southeast-3" ? 3008 : 4096
-  timeout             = 60
+  timeout             = 900
   source_path         = "${path.module}/lambda/generateCohortVCfs"
   attach_policy_jsons = true
   policy_jsons = [
@@ -98,6 +98,45 @@ resource "aws_s3_bucket_lifecycle_configuration" "metadata_bucket_lifecycle" {
     }
   }
 
+  rule {
+    id     = "clean-old-variant-queries"
+    status = "Enabled"
+
+    filter {
+      prefix = "variant-queries/"
+    }
+
+    expiration {
+      days = 7
+    }
+  }
+
+  rule {
+    id     = "clean-old-sample-sets"
+    status = "Enabled"
+
+    filter {
+      prefix = "sample-sets/"
+    }
+
+    expiration {
+      days = 1
+    }
+  }
+
+  rule {
+    id     = "clean-old-staged-carriers"
+    status = "Enabled"
+
+    filter {
+      prefix = "carriers-cache/"
+    }
+
+    expiration {
+      days = 1
+    }
+  }
+
   rule {
     id     = "expire-noncurrent-versions"
     status = "Enabled"
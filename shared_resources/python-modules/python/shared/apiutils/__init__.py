@@ -23,6 +23,7 @@ from .responses import (
     build_filtering_terms_response,
     bundle_response,
 )
+from .pagination import decode_page_token, encode_page_token
 from .router import AuthError, BeaconError, PortalError, LambdaRouter
 from .schemas import DefaultSchemas
 from .quota import require_quota
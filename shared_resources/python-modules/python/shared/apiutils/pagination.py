@@ -0,0 +1,21 @@
+import base64
+import binascii
+import json
+
+
+# opaque continuation tokens handed to the clients as pagination.nextPage
+# and accepted back as pagination.currentPage
+def encode_page_token(cursor: dict) -> str:
+    cursor_str = json.dumps(cursor, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(cursor_str.encode()).decode()
+
+
+def decode_page_token(token: str) -> dict:
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid pagination token")
+
+    if not isinstance(cursor, dict):
+        raise ValueError("Invalid pagination token")
+    return cursor
@@ -18,6 +18,8 @@ from pydantic.functional_validators import BeforeValidator
 from shared.utils import ENV_BEACON, ENV_CONFIG
 from strenum import StrEnum
 
+from .pagination import decode_page_token
+
 #
 # Thirdparty Code as annotated
 # Code from https://github.com/EGA-archive/beacon2-ri-api
@@ -32,6 +34,13 @@ BEACON_API_VERSION = ENV_BEACON.BEACON_API_VERSION
 BEACON_DEFAULT_GRANULARITY = ENV_BEACON.BEACON_DEFAULT_GRANULARITY
 CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE = ENV_CONFIG.CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE
 
+
+# CHANGE: asynchronous variant query jobs validate against their own range limit
+def max_base_range(info: ValidationInfo):
+    return (info.context or {}).get(
+        "max_base_range", CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE
+    )
+
 INDIVIDUALS_TABLE_COLUMNS = [
     "id",
     "diseases",
@@ -125,33 +134,35 @@ class RequestQueryParams(CamelModel):
     @field_validator("start", "end")
     @classmethod
     def vallidate_base_positions(cls, base: list[int], info: ValidationInfo):
+        max_range = max_base_range(info)
         # if base range is give; must not exeed limit
         if len(base) == 2:
             if base[0] >= base[1]:
                 raise ValueError(f"Values in {info.field_name} must be ascending")
-            elif abs(base[0] - base[1]) > CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE:
+            elif abs(base[0] - base[1]) > max_range:
                 raise ValueError(
-                    f"""Range in '{info.field_name}' exceeds max allowed ({CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE})"""
+                    f"""Range in '{info.field_name}' exceeds max allowed ({max_range})"""
                 )
         return base
 
     @model_validator(mode="after")
-    def validate_base_range(self):
-        error_message = f"Base range should be positive and less than {CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE}. Consider using start (eg: [100, 200]) and end (eg: [250, 300]) ranges or shorten the range between start and end positions (eg: start=[100], end=[200])"
+    def validate_base_range(self, info: ValidationInfo):
+        max_range = max_base_range(info)
+        error_message = f"Base range should be positive and less than {max_range}. Consider using start (eg: [100, 200]) and end (eg: [250, 300]) ranges or shorten the range between start and end positions (eg: start=[100], end=[200])"
         # if start and end is give; that must be within limit
         if (
             len(self.start) == 1
             and len(self.end) == 1
-            and abs(self.start[0] - self.end[0]) > CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE
+            and abs(self.start[0] - self.end[0]) > max_range
         ):
             raise ValueError(error_message, ["start", "end"])
         # if start is a range and end is a base
         if len(self.start) == 2 and len(self.end) == 1:
-            if abs(self.end[0] - self.start[0]) > CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE:
+            if abs(self.end[0] - self.start[0]) > max_range:
                 raise ValueError(error_message, ["start", "end"])
         # if start is a base and end is a range
         if len(self.start) == 1 and len(self.end) == 2:
-            if abs(self.end[1] - self.start[0]) > CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE:
+            if abs(self.end[1] - self.start[0]) > max_range:
                 raise ValueError(error_message, ["start", "end"])
         return self
 
@@ -237,6 +248,15 @@ class CustomFilter(CamelModel):
 class Pagination(CamelModel):
     skip: int = 0
     limit: int = 10
+    # CHANGE: opaque continuation token returned as nextPage by a previous response
+    current_page: Optional[str] = None
+
+    @field_validator("current_page")
+    @classmethod
+    def validate_current_page(cls, token: Optional[str]):
+        if token is not None:
+            decode_page_token(token)
+        return token
 
 
 # Thirdparty Code
@@ -267,6 +287,8 @@ class RequestQuery(CamelModel):
     _filters: dict = PrivateAttr()
     _search: str = PrivateAttr(default=None)
     projects: list[str] = []
+    # CHANGE: optional fields of the records to return, all when empty
+    fields: List[str] = []
 
     def __init__(self, **data):
         super().__init__(**data)
@@ -282,7 +304,7 @@ class RequestParams(CamelModel):
 
     # TODO update to parse body of API gateway POST and GET requests
     # CHANGE: parse API gateway request
-    def from_request(self, query_params, sub=None) -> Self:
+    def from_request(self, query_params, sub=None, context=None) -> Self:
         req_params_dict = dict()
         for k, v in query_params.items():
             if k == "requestedSchema":
@@ -291,6 +313,12 @@ class RequestParams(CamelModel):
                 self.query.pagination.skip = int(v)
             elif k == "limit":
                 self.query.pagination.limit = int(v)
+            elif k == "currentPage":
+                self.query.pagination = Pagination(
+                    skip=self.query.pagination.skip,
+                    limit=self.query.pagination.limit,
+                    current_page=v,
+                )
             elif k == "includeResultsetResponses":
                 self.query.include_resultset_responses = IncludeResultsetResponses(v)
             elif k == "requestedGranularity":
@@ -309,10 +337,17 @@ class RequestParams(CamelModel):
                 self.projects = projects
             elif k == "search":
                 self.query._search = v
+            elif k == "fields":
+                self.query.fields = v.split(",")
             else:
                 req_params_dict[k] = v
         # query parameters related to variants
-        if len(req_params_dict):
+        if len(req_params_dict) and context:
+            self.query.request_parameters = RequestQueryParams.model_validate(
+                req_params_dict, context=context
+            )
+            self.query.request_parameters._user_params = req_params_dict
+        elif len(req_params_dict):
             self.query.request_parameters = RequestQueryParams(**req_params_dict)
         self.sub = sub
         return self
@@ -333,7 +368,7 @@ class RequestParams(CamelModel):
 
 
 # TODO create a decorator for lambda handlers
-def parse_request(event) -> Tuple[RequestParams, str]:
+def parse_request(event, max_base_range=None) -> Tuple[RequestParams, str]:
     body_dict = dict()
     if event["httpMethod"] == "POST":
         try:
@@ -353,7 +388,13 @@ def parse_request(event) -> Tuple[RequestParams, str]:
     )
 
     try:
-        request_params = RequestParams(**body_dict).from_request(params, sub)
+        if max_base_range is None:
+            request_params = RequestParams(**body_dict).from_request(params, sub)
+        else:
+            context = {"max_base_range": max_base_range}
+            request_params = RequestParams.model_validate(
+                body_dict, context=context
+            ).from_request(params, sub, context)
     except ValidationError as e:
         errors = defaultdict(set)
 
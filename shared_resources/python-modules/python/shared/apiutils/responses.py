@@ -64,7 +64,10 @@ def build_response(data, num_total_results, qparams, func):
     response = {
         "id": "",  # TODO: Set the name of the dataset/cohort
         "setType": "",  # TODO: Set the type of collection
-        "exists": num_total_results > 0,
+        # CHANGE: pages of unknown total exist when they have results
+        "exists": (
+            num_total_results > 0 if num_total_results is not None else len(data) > 0
+        ),
         "resultsCount": len(data),
         "results": data,
         # 'info': None,
@@ -85,16 +88,26 @@ def build_beacon_resultset_response(
     func_response_type,
     entity_schema: DefaultSchemas,
     variant_info_mapping=None,
+    next_page=None,
 ):
     """
     Transform data into the Beacon response format.
     """
-
+    # CHANGE: variant info mapping and keyset pagination tokens
+    info = {}
+    if variant_info_mapping is not None:
+        info["variantInfoMapping"] = variant_info_mapping
+    if next_page is not None:
+        info["pagination"] = {
+            "currentPage": qparams.query.pagination.current_page,
+            "nextPage": next_page,
+        }
+
+    # CHANGE: keyset paged results leave out the total they do not know
+    exists = num_total_results > 0 if num_total_results is not None else len(data) > 0
     beacon_response = {
         "meta": build_meta(qparams, entity_schema, Granularity.RECORD),
-        "responseSummary": build_response_summary(
-            num_total_results > 0, num_total_results
-        ),
+        "responseSummary": build_response_summary(exists, num_total_results),
         "response": {
             "resultSets": [
                 build_response(data, num_total_results, qparams, func_response_type)
@@ -102,11 +115,7 @@ def build_beacon_resultset_response(
         },
         # CHANGE: variables taken from terraform
         "beaconHandovers": json.loads(ENV_BEACON.BEACON_HANDOVERS),
-        "info": (
-            {"variantInfoMapping": variant_info_mapping}
-            if variant_info_mapping is not None
-            else {}
-        ),
+        "info": info,
     }
     return beacon_response
 
@@ -173,16 +182,25 @@ def build_beacon_collection_response(
     qparams: RequestParams,
     func_response_type,
     entity_schema: DefaultSchemas,
+    next_page=None,
 ):
+    # CHANGE: keyset paged results leave out the total they do not know
+    exists = num_total_results > 0 if num_total_results is not None else len(data) > 0
     beacon_response = {
         "meta": build_meta(qparams, entity_schema, Granularity.RECORD),
-        "responseSummary": build_response_summary(
-            num_total_results > 0, num_total_results
-        ),
+        "responseSummary": build_response_summary(exists, num_total_results),
         # TODO: 'info': build_extended_info(),
         "beaconHandovers": json.loads(ENV_BEACON.BEACON_HANDOVERS),
         "response": {"collections": func_response_type(data, qparams)},
     }
+    # CHANGE: keyset pagination tokens
+    if next_page is not None:
+        beacon_response["info"] = {
+            "pagination": {
+                "currentPage": qparams.query.pagination.current_page,
+                "nextPage": next_page,
+            }
+        }
     return beacon_response
 
 
@@ -5,3 +5,6 @@ from .individual import Individual
 from .biosample import Biosample
 from .analysis import Analysis
 from .run import Run
+from .carriers import stage_carriers
+from .filtering_terms import get_catalog_filtering_terms
+from .record_pages import get_record_page
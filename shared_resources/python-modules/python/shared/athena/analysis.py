@@ -1,12 +1,11 @@
 import json
-from collections import defaultdict
+from itertools import chain
 
 import boto3
 import jsons
-import pyorc
-from smart_open import open as sopen
 
 from .common import AthenaModel, extract_terms
+from .orc_writer import RollingOrcWriter
 from shared.utils import ENV_ATHENA
 
 
@@ -32,7 +31,6 @@ class Analysis(jsons.JsonSerializable, AthenaModel):
         "pipelineRef",
         "variantCaller",
     ]
-    _table_column_types = defaultdict(lambda: "string")
 
     def __init__(
         self,
@@ -70,7 +68,9 @@ class Analysis(jsons.JsonSerializable, AthenaModel):
 
     @classmethod
     def upload_array(cls, array):
-        if len(array) == 0:
+        array = iter(array)
+        first = next(array, None)
+        if first is None:
             return
         header_entity = (
             "struct<"
@@ -78,45 +78,34 @@ class Analysis(jsons.JsonSerializable, AthenaModel):
             + ">"
         )
         header_terms = "struct<kind:string,id:string,term:string,label:string,type:string,_projectname:string>"
-        key = array[0]["datasetId"]
-        projectname = array[0]["projectName"]
+        key = first["datasetId"]
+        projectname = first["projectName"]
 
-        with sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/analyses-cache/{key}", "wb"
-        ) as s3file_entity, sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/terms-cache/analyses-{key}", "wb"
-        ) as s3file_terms:
-            with pyorc.Writer(
-                s3file_entity,
-                header_entity,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_entity, pyorc.Writer(
-                s3file_terms,
-                header_terms,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_terms:
-                for analysis in array:
-                    row = tuple(
-                        (
-                            analysis.get(k, "")
-                            if type(analysis.get(k, "")) == str
-                            else json.dumps(analysis.get(k, ""))
-                        )
-                        for k in [k.strip("_") for k in cls._table_columns]
+        with RollingOrcWriter(
+            f"analyses-cache/{key}", header_entity
+        ) as writer_entity, RollingOrcWriter(
+            f"terms-cache/analyses-{key}", header_terms
+        ) as writer_terms:
+            for analysis in chain([first], array):
+                row = tuple(
+                    (
+                        analysis.get(k, "")
+                        if type(analysis.get(k, "")) == str
+                        else json.dumps(analysis.get(k, ""))
                     )
-                    writer_entity.write(row)
-                    for term, label, typ in extract_terms([jsons.dump(analysis)]):
-                        row = (
-                            "analyses",
-                            analysis["id"],
-                            term,
-                            label,
-                            typ,
-                            projectname,
-                        )
-                        writer_terms.write(row)
+                    for k in [k.strip("_") for k in cls._table_columns]
+                )
+                writer_entity.write(row)
+                for term, label, typ in extract_terms([analysis]):
+                    row = (
+                        "analyses",
+                        analysis["id"],
+                        term,
+                        label,
+                        typ,
+                        projectname,
+                    )
+                    writer_terms.write(row)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,11 @@
 import json
-from collections import defaultdict
+from itertools import chain
 
 import boto3
 import jsons
-import pyorc
-from smart_open import open as sopen
 
 from .common import AthenaModel, extract_terms
+from .orc_writer import RollingOrcWriter
 from shared.utils import ENV_ATHENA
 
 
@@ -41,7 +40,6 @@ class Biosample(jsons.JsonSerializable, AthenaModel):
         "info",
         "notes",
     ]
-    _table_column_types = defaultdict(lambda: "string")
 
     def __init__(
         self,
@@ -97,7 +95,9 @@ class Biosample(jsons.JsonSerializable, AthenaModel):
 
     @classmethod
     def upload_array(cls, array):
-        if len(array) == 0:
+        array = iter(array)
+        first = next(array, None)
+        if first is None:
             return
         header_entity = (
             "struct<"
@@ -105,46 +105,34 @@ class Biosample(jsons.JsonSerializable, AthenaModel):
             + ">"
         )
         header_terms = "struct<kind:string,id:string,term:string,label:string,type:string,_projectname:string>"
-        key = array[0]["datasetId"]
-        projectname = array[0]["projectName"]
+        key = first["datasetId"]
+        projectname = first["projectName"]
 
-        with sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/biosamples-cache/{key}", "wb"
-        ) as s3file_entity, sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/terms-cache/biosamples-{key}",
-            "wb",
-        ) as s3file_terms:
-            with pyorc.Writer(
-                s3file_entity,
-                header_entity,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_entity, pyorc.Writer(
-                s3file_terms,
-                header_terms,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_terms:
-                for biosample in array:
-                    row = tuple(
-                        (
-                            biosample.get(k, "")
-                            if type(biosample.get(k, "")) == str
-                            else json.dumps(biosample.get(k, ""))
-                        )
-                        for k in [k.strip("_") for k in cls._table_columns]
+        with RollingOrcWriter(
+            f"biosamples-cache/{key}", header_entity
+        ) as writer_entity, RollingOrcWriter(
+            f"terms-cache/biosamples-{key}", header_terms
+        ) as writer_terms:
+            for biosample in chain([first], array):
+                row = tuple(
+                    (
+                        biosample.get(k, "")
+                        if type(biosample.get(k, "")) == str
+                        else json.dumps(biosample.get(k, ""))
                     )
-                    writer_entity.write(row)
-                    for term, label, typ in extract_terms([biosample]):
-                        row = (
-                            "biosamples",
-                            biosample["id"],
-                            term,
-                            label,
-                            typ,
-                            projectname,
-                        )
-                        writer_terms.write(row)
+                    for k in [k.strip("_") for k in cls._table_columns]
+                )
+                writer_entity.write(row)
+                for term, label, typ in extract_terms([biosample]):
+                    row = (
+                        "biosamples",
+                        biosample["id"],
+                        term,
+                        label,
+                        typ,
+                        projectname,
+                    )
+                    writer_terms.write(row)
 
 
 if __name__ == "__main__":
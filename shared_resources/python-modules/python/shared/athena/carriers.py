@@ -0,0 +1,32 @@
+import uuid
+
+import pyorc
+from smart_open import open as sopen
+
+from shared.utils import ENV_ATHENA
+
+
+def stage_carriers(dataset_samples):
+    """
+    Stage {dataset_id: sample_names} as a partition of the carriers table
+    so that entity lookups join against it instead of inlining the samples.
+    Returns the id of the staged set, to be used as _queryid in the joins.
+    """
+    query_id = uuid.uuid4().hex
+    header = "struct<_datasetid:string,_vcfsampleid:string>"
+
+    with sopen(
+        f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/carriers-cache/{query_id}/carriers",
+        "wb",
+    ) as s3file:
+        with pyorc.Writer(
+            s3file,
+            header,
+            compression=pyorc.CompressionKind.SNAPPY,
+            compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
+        ) as writer:
+            for dataset_id, sample_names in dataset_samples.items():
+                for sample_name in sample_names:
+                    writer.write((dataset_id, sample_name))
+
+    return query_id
@@ -13,6 +13,8 @@ from shared.utils import ENV_ATHENA, ENV_DYNAMO
 athena = boto3.client("athena")
 dynamodb = boto3.client("dynamodb")
 pattern = re.compile(r"^\w[^:]+:.+$")
+# size of the whole filtered set, selected alongside a page of records
+TOTAL_COLUMN = "_total"
 
 # If we hit one of these keywords, the window for a WHERE clause has closed
 # https://docs.aws.amazon.com/athena/latest/ug/select.html
@@ -215,6 +217,23 @@ class AthenaModel:
     repeated everywhere.
     """
 
+    @classmethod
+    def select_columns(cls, fields):
+        """
+        Columns to select for the requested record fields, always with the
+        id, or * when none of the fields is a column of the table.
+        """
+        columns = {
+            col.lower(): col.lower()
+            for col in cls._table_columns
+            if not col.startswith("_")
+        }
+        selected = {columns[field.lower()] for field in fields if field.lower() in columns}
+
+        if not selected:
+            return "*"
+        return ", ".join(["id"] + sorted(selected - {"id"}))
+
     @classmethod
     def get_by_query(
         cls, query, /, *, queue=None, execution_parameters=None, projects=None, sub=None
@@ -238,6 +257,37 @@ class AthenaModel:
                 queue.put(cls.parse_array(exec_id))
         return []
 
+    @classmethod
+    def get_page_by_query(
+        cls,
+        query,
+        /,
+        *,
+        execution_parameters=None,
+        projects=None,
+        sub=None,
+        projected=False,
+    ):
+        """
+        As get_by_query, also returning the _total column of the results
+        when the query selects one, otherwise None.
+        """
+        query = query.format(
+            database=ENV_ATHENA.ATHENA_METADATA_DATABASE, table=cls._table_name
+        )
+        exec_id = run_custom_query(
+            query,
+            queue=None,
+            return_id=True,
+            execution_parameters=execution_parameters,
+            projects=projects,
+            sub=sub,
+        )
+
+        if exec_id:
+            return cls.parse_array(exec_id, with_total=True, projected=projected)
+        return [], None
+
     @classmethod
     def get_existence_by_query(
         cls, query, /, *, queue=None, execution_parameters=None, projects=None, sub=None
@@ -261,9 +311,10 @@ class AthenaModel:
             queue.put(len(result) > 1)
 
     @classmethod
-    def parse_array(cls, exec_id):
+    def parse_array(cls, exec_id, *, with_total=False, projected=False):
         instances = []
         var_list = list()
+        total = None
         case_map = {k.lower(): k for k in cls().__dict__.keys()}
 
         with sopen(
@@ -275,17 +326,24 @@ class AthenaModel:
                 if n == 0:
                     var_list = row
                 else:
-                    instance = cls()
+                    # projected records only carry the selected columns
+                    instance = cls.__new__(cls) if projected else cls()
                     for attr, val in zip(var_list, row):
+                        if with_total and attr == TOTAL_COLUMN:
+                            total = int(val)
                         if not attr in case_map:
                             continue
-                        try:
-                            val = json.loads(val)
-                        except:
-                            val = val
+                        # ids are strings, however numeric they look
+                        if attr != "id":
+                            try:
+                                val = json.loads(val)
+                            except:
+                                val = val
                         instance.__dict__[case_map[attr]] = val
                     instances.append(instance)
 
+        if with_total:
+            return instances, total
         return instances
 
     @classmethod
@@ -1,14 +1,13 @@
 import json
 import csv
 import sys
-from collections import defaultdict
+from itertools import chain
 
 import jsons
 import boto3
-import pyorc
-from smart_open import open as sopen
 
 from .common import AthenaModel, extract_terms
+from .orc_writer import RollingOrcWriter
 from shared.utils import ENV_ATHENA
 
 
@@ -36,7 +35,6 @@ class Dataset(jsons.JsonSerializable, AthenaModel):
         "updateDateTime",
         "version",
     ]
-    _table_column_types = defaultdict(lambda: "string")
 
     def __init__(
         self,
@@ -76,7 +74,9 @@ class Dataset(jsons.JsonSerializable, AthenaModel):
 
     @classmethod
     def upload_array(cls, array):
-        if len(array) == 0:
+        array = iter(array)
+        first = next(array, None)
+        if first is None:
             return
         header_entity = (
             "struct<"
@@ -84,46 +84,35 @@ class Dataset(jsons.JsonSerializable, AthenaModel):
             + ">"
         )
         header_terms = "struct<kind:string,id:string,term:string,label:string,type:string,_projectname:string,_datasetname:string>"
-        key = array[0]["id"]
-        projectname = array[0]["projectName"]
-
-        with sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/datasets-cache/{key}", "wb"
-        ) as s3file_entity, sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/terms-cache/datasets-{key}", "wb"
-        ) as s3file_term:
-            with pyorc.Writer(
-                s3file_entity,
-                header_entity,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_entity, pyorc.Writer(
-                s3file_term,
-                header_terms,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_terms:
-                for dataset in array:
-                    row = tuple(
-                        (
-                            dataset.get(k, "")
-                            if type(dataset.get(k, "")) == str
-                            else json.dumps(dataset.get(k, ""))
-                        )
-                        for k in [k.strip("_") for k in cls._table_columns]
+        key = first["id"]
+        projectname = first["projectName"]
+
+        with RollingOrcWriter(
+            f"datasets-cache/{key}", header_entity
+        ) as writer_entity, RollingOrcWriter(
+            f"terms-cache/datasets-{key}", header_terms
+        ) as writer_terms:
+            for dataset in chain([first], array):
+                row = tuple(
+                    (
+                        dataset.get(k, "")
+                        if type(dataset.get(k, "")) == str
+                        else json.dumps(dataset.get(k, ""))
                     )
-                    writer_entity.write(row)
-                    for term, label, typ in extract_terms([dataset]):
-                        row = (
-                            "datasets",
-                            dataset["id"],
-                            term,
-                            label,
-                            typ,
-                            projectname,
-                            dataset["datasetName"],
-                        )
-                        writer_terms.write(row)
+                    for k in [k.strip("_") for k in cls._table_columns]
+                )
+                writer_entity.write(row)
+                for term, label, typ in extract_terms([dataset]):
+                    row = (
+                        "datasets",
+                        dataset["id"],
+                        term,
+                        label,
+                        typ,
+                        projectname,
+                        dataset["datasetName"],
+                    )
+                    writer_terms.write(row)
 
 
 def parse_datasets_with_samples(exec_id):
@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+from .common import ApprovedProjects
+from shared.utils import (
+    ENV_ATHENA,
+    FILTERING_TERMS_MANIFEST_KEY,
+    filtering_terms_catalog_key,
+    trigrams,
+)
+
+
+# how long a warm container trusts its manifest before revalidating the etag
+MANIFEST_REVALIDATE_SECONDS = 30
+
+
+s3 = boto3.client("s3")
+_lock = threading.Lock()
+_manifest = {"etag": None, "checked": 0, "body": None}
+# project name -> (etag, catalog) of the catalogs loaded so far
+_catalogs = dict()
+
+
+def _load_manifest():
+    if time.time() - _manifest["checked"] < MANIFEST_REVALIDATE_SECONDS:
+        return _manifest["body"]
+
+    kwargs = {
+        "Bucket": ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        "Key": FILTERING_TERMS_MANIFEST_KEY,
+    }
+    if _manifest["etag"]:
+        kwargs["IfNoneMatch"] = _manifest["etag"]
+
+    try:
+        response = s3.get_object(**kwargs)
+        _manifest["body"] = json.loads(response["Body"].read())
+        _manifest["etag"] = response["ETag"]
+        print(f"Loaded filtering terms version {_manifest['body']['version']}")
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        if code in ("304", "NotModified"):
+            pass
+        elif code == "NoSuchKey":
+            # not published yet, callers fall back to athena
+            _manifest["body"] = None
+            _manifest["etag"] = None
+        else:
+            raise e
+    _manifest["checked"] = time.time()
+
+    return _manifest["body"]
+
+
+def _load_catalog(project, etag):
+    if project in _catalogs and _catalogs[project][0] == etag:
+        return _catalogs[project][1]
+
+    response = s3.get_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=filtering_terms_catalog_key(project),
+    )
+    catalog = json.loads(response["Body"].read())
+    # positions are intersected while searching
+    catalog["trigrams"] = {
+        trigram: set(positions) for trigram, positions in catalog["trigrams"].items()
+    }
+    _catalogs[project] = (response["ETag"], catalog)
+    return catalog
+
+
+def _search(catalog, positions, search):
+    search = search.lower()
+
+    # searches shorter than a trigram scan the candidate terms
+    for trigram in trigrams(search):
+        positions = positions & catalog["trigrams"].get(trigram, set())
+
+    for position in positions:
+        term, label, _ = catalog["terms"][position]
+        if search in term.lower() or search in label.lower():
+            yield position
+
+
+def get_catalog_filtering_terms(
+    *, skip, limit, search=None, kind=None, dataset_id=None, projects=None, sub=None
+):
+    """
+    A page of the distinct filtering terms of the projects visible to the
+    user, in term order, optionally of one kind of entity or one dataset and
+    matching the search text in their id or label. Returns None when no
+    catalog has been published.
+    """
+    with _lock:
+        manifest = _load_manifest()
+
+        if manifest is None:
+            return None
+
+        approved_projects = ApprovedProjects(
+            project_names=projects, user_sub=sub
+        ).get_approved_projects()
+        catalogs = [
+            _load_catalog(project, manifest["projects"][project])
+            for project in approved_projects
+            if project in manifest["projects"]
+        ]
+
+    terms = set()
+
+    for catalog in catalogs:
+        if dataset_id is not None:
+            positions = set(catalog["datasets"].get(dataset_id, []))
+        elif kind is not None:
+            positions = set(catalog["kinds"].get(kind, []))
+        else:
+            positions = set(range(len(catalog["terms"])))
+
+        if search:
+            positions = _search(catalog, positions, search)
+        terms.update(tuple(catalog["terms"][position]) for position in positions)
+
+    return [
+        {"id": term, "label": label, "type": typ}
+        for term, label, typ in sorted(terms)[skip : skip + limit]
+    ]
@@ -1,12 +1,11 @@
 import json
-from collections import defaultdict
+from itertools import chain
 
-import pyorc
 import jsons
 import boto3
-from smart_open import open as sopen
 
 from .common import AthenaModel, extract_terms
+from .orc_writer import RollingOrcWriter
 from shared.utils import ENV_ATHENA
 
 
@@ -34,7 +33,6 @@ class Individual(jsons.JsonSerializable, AthenaModel):
         "sex",
         "treatments",
     ]
-    _table_column_types = defaultdict(lambda: "string")
 
     def __init__(
         self,
@@ -76,7 +74,9 @@ class Individual(jsons.JsonSerializable, AthenaModel):
 
     @classmethod
     def upload_array(cls, array):
-        if len(array) == 0:
+        array = iter(array)
+        first = next(array, None)
+        if first is None:
             return
         header_entity = (
             "struct<"
@@ -84,46 +84,34 @@ class Individual(jsons.JsonSerializable, AthenaModel):
             + ">"
         )
         header_terms = "struct<kind:string,id:string,term:string,label:string,type:string,_projectname:string>"
-        key = array[0]["datasetId"]
-        projectname = array[0]["projectName"]
+        key = first["datasetId"]
+        projectname = first["projectName"]
 
-        with sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/individuals-cache/{key}", "wb"
-        ) as s3file_entity, sopen(
-            f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/terms-cache/individuals-{key}",
-            "wb",
-        ) as s3file_terms:
-            with pyorc.Writer(
-                s3file_entity,
-                header_entity,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_entity, pyorc.Writer(
-                s3file_terms,
-                header_terms,
-                compression=pyorc.CompressionKind.SNAPPY,
-                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
-            ) as writer_terms:
-                for individual in array:
-                    row = tuple(
-                        (
-                            individual.get(k, "")
-                            if type(individual.get(k, "")) == str
-                            else json.dumps(individual.get(k, ""))
-                        )
-                        for k in [k.strip("_") for k in cls._table_columns]
+        with RollingOrcWriter(
+            f"individuals-cache/{key}", header_entity
+        ) as writer_entity, RollingOrcWriter(
+            f"terms-cache/individuals-{key}", header_terms
+        ) as writer_terms:
+            for individual in chain([first], array):
+                row = tuple(
+                    (
+                        individual.get(k, "")
+                        if type(individual.get(k, "")) == str
+                        else json.dumps(individual.get(k, ""))
                     )
-                    writer_entity.write(row)
-                    for term, label, typ in extract_terms([jsons.dump(individual)]):
-                        row = (
-                            "individuals",
-                            individual["id"],
-                            term,
-                            label,
-                            typ,
-                            projectname,
-                        )
-                        writer_terms.write(row)
+                    for k in [k.strip("_") for k in cls._table_columns]
+                )
+                writer_entity.write(row)
+                for term, label, typ in extract_terms([individual]):
+                    row = (
+                        "individuals",
+                        individual["id"],
+                        term,
+                        label,
+                        typ,
+                        projectname,
+                    )
+                    writer_terms.write(row)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import os
+import re
+from contextlib import ExitStack
+
+import boto3
+import pyorc
+from smart_open import open as sopen
+
+from shared.utils import ENV_ATHENA
+
+
+s3 = boto3.client("s3")
+# rows written to a part file before rolling over to the next one
+ORC_PART_ROWS = int(os.environ.get("ORC_PART_ROWS", 250000))
+# bytes buffered per stripe before it is flushed, pyorc defaults to 64MiB
+ORC_STRIPE_SIZE = int(os.environ.get("ORC_STRIPE_SIZE", 16 * 1024 * 1024))
+# false positive rate of the bloom filters
+ORC_BLOOM_FILTER_FPP = 0.01
+part_pattern = re.compile(r"\.part-(\d+)$")
+
+
+def part_key(key, part):
+    # the first part keeps the plain key, so single part uploads look as before
+    return key if part == 0 else f"{key}.part-{part:05d}"
+
+
+class RollingOrcWriter:
+    """
+    ORC writer to s3://{metadata bucket}/{key} that rolls over into
+    {key}.part-00001, {key}.part-00002, ... every `part_rows` rows.
+
+    Parts are uploaded as they fill, so only one part is buffered at a time.
+    Parts left over from an earlier, larger upload of the same key are
+    removed on close. Columns in `bloom_filter_columns` get ORC bloom
+    filters, so that lookups of files athena queries in place, such as the
+    relations partitions, can skip row groups.
+    """
+
+    def __init__(
+        self, key, schema, *, part_rows=None, stripe_size=None, bloom_filter_columns=()
+    ):
+        self.key = key
+        self.schema = schema
+        self.bloom_filter_columns = list(bloom_filter_columns)
+        self.part_rows = part_rows or ORC_PART_ROWS
+        self.stripe_size = stripe_size or ORC_STRIPE_SIZE
+        self.parts = 0
+        self._rows = 0
+        self._stack = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._stack is not None:
+            # aborts the multipart upload of the unfinished part
+            self._stack.__exit__(exc_type, exc, tb)
+            self._stack = None
+        return False
+
+    def _open(self):
+        self._stack = ExitStack()
+        s3file = self._stack.enter_context(
+            sopen(
+                f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/{part_key(self.key, self.parts)}",
+                "wb",
+            )
+        )
+        self._writer = self._stack.enter_context(
+            pyorc.Writer(
+                s3file,
+                self.schema,
+                stripe_size=self.stripe_size,
+                compression=pyorc.CompressionKind.SNAPPY,
+                compression_strategy=pyorc.CompressionStrategy.COMPRESSION,
+                bloom_filter_columns=self.bloom_filter_columns or None,
+                bloom_filter_fpp=ORC_BLOOM_FILTER_FPP,
+            )
+        )
+        self.parts += 1
+        self._rows = 0
+
+    def _close_part(self):
+        if self._stack is not None:
+            self._stack.close()
+            self._stack = None
+
+    def write(self, row):
+        if self._stack is None or self._rows == self.part_rows:
+            self._close_part()
+            self._open()
+        self._writer.write(row)
+        self._rows += 1
+
+    def close(self):
+        self._close_part()
+        self._delete_stale_parts()
+
+    def _delete_stale_parts(self):
+        paginator = s3.get_paginator("list_objects_v2")
+        stale = []
+
+        for page in paginator.paginate(
+            Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET, Prefix=f"{self.key}.part-"
+        ):
+            for item in page.get("Contents", []):
+                match = part_pattern.search(item["Key"])
+                if match and int(match.group(1)) >= max(self.parts, 1):
+                    stale.append({"Key": item["Key"]})
+
+        for n in range(0, len(stale), 1000):
+            s3.delete_objects(
+                Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+                Delete={"Objects": stale[n : n + 1000]},
+            )
@@ -0,0 +1,100 @@
+import hashlib
+import json
+
+from shared.apiutils import RequestParams, decode_page_token, encode_page_token
+from .common import TOTAL_COLUMN
+
+
+def get_page_query(limit, conditions="", *, columns="*", skip=0, with_total=False):
+    # one row past the page tells whether another page follows
+    total = f", COUNT(*) OVER () AS {TOTAL_COLUMN}" if with_total else ""
+    offset = f"OFFSET {skip}" if skip else ""
+    query = f"""
+    SELECT {columns}{total} FROM "{{database}}"."{{table}}"
+    {conditions}
+    ORDER BY id
+    {offset}
+    LIMIT {limit + 1};
+    """
+    return query
+
+
+def filters_hash(model, request: RequestParams):
+    # a token only continues the listing it was issued for
+    listing = {
+        "table": model._table_name,
+        "filters": [f.model_dump(mode="json") for f in request.query.filters],
+        "projects": sorted(request.projects or []),
+    }
+    return hashlib.sha256(
+        json.dumps(listing, sort_keys=True).encode()
+    ).hexdigest()[:16]
+
+
+def get_record_page(model, request: RequestParams, conditions, execution_parameters):
+    """
+    A page of the records matching the conditions, in id order, with the
+    size of the whole filtered set and the token of the next page, if any.
+
+    The first page is counted in the same scan it is read from. Following
+    pages are read from after the last id of the previous one (keyset
+    pagination), with the total carried over in the token.
+
+    When the request names the fields it needs, only their columns are
+    read and decoded, and the records hold just those fields.
+    """
+    pagination = request.query.pagination
+    listing = filters_hash(model, request)
+    cursor = (
+        decode_page_token(pagination.current_page)
+        if pagination.current_page
+        else None
+    )
+    # a token of another listing starts this one over
+    if cursor is not None and (
+        cursor.get("listing") != listing or "after" not in cursor
+    ):
+        cursor = None
+    execution_parameters = list(execution_parameters or [])
+    columns = model.select_columns(request.query.fields)
+
+    if cursor is None:
+        query = get_page_query(
+            pagination.limit,
+            conditions,
+            columns=columns,
+            skip=pagination.skip,
+            with_total=True,
+        )
+    else:
+        conditions = f"{conditions} AND id > ?" if conditions else "WHERE id > ?"
+        execution_parameters.append("'{}'".format(cursor["after"].replace("'", "''")))
+        query = get_page_query(pagination.limit, conditions, columns=columns)
+
+    records, total = model.get_page_by_query(
+        query,
+        execution_parameters=execution_parameters or None,
+        projects=request.projects,
+        sub=request.sub,
+        projected=columns != "*",
+    )
+
+    if cursor is not None:
+        total = cursor["total"]
+    elif total is None:
+        # skipped past the end, there is no row to read the total from
+        total = model.get_count_by_query(
+            f"""SELECT COUNT(id) FROM "{{database}}"."{{table}}" {conditions};""",
+            execution_parameters=execution_parameters or None,
+            projects=request.projects,
+            sub=request.sub,
+        )
+
+    next_page = None
+    if len(records) > pagination.limit:
+        records = records[: pagination.limit]
+        next_page = encode_page_token(
+            {"listing": listing, "after": records[-1].id, "total": total}
+        )
+
+    return records, total, next_page
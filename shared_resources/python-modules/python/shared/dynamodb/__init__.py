@@ -1,7 +1,29 @@
+from .cohort_jobs import (
+    CohortJob,
+    CohortJobStatus,
+    advance_cohort_job,
+    create_cohort_job,
+    fail_cohort_job,
+    fail_stale_cohort_job,
+    record_cohort_task,
+)
 from .ontologies import Anscestors, Descendants, Ontology
 from .quota import Quota, UsageMap
 from .locks import acquire_lock, release_lock
 from .user_info import UserInfo
+from .variant_queries import (
+    VariantQuery,
+    VariantQueryStatus,
+    create_variant_query,
+    fail_stale_variant_query,
+    fail_variant_query,
+    record_variant_query_chunk,
+    record_variant_query_part,
+    variant_query_part_key,
+    variant_query_plan_key,
+    variant_query_result_key,
+)
+from .vcfs import Vcf, get_vcf_header, inspect_vcf, vcf_cache_key
 from .rbac import (
     # Models
     Role,
@@ -0,0 +1,164 @@
+import time
+
+import boto3
+from pynamodb.models import Model
+from pynamodb.attributes import (
+    BooleanAttribute,
+    NumberAttribute,
+    NumberSetAttribute,
+    UnicodeAttribute,
+)
+from pynamodb.exceptions import UpdateError
+from shared.utils import ENV_DYNAMO
+
+
+SESSION = boto3.session.Session()
+REGION = SESSION.region_name
+# jobs are dropped after a week, their files stay with the user
+COHORT_JOB_TTL = 7 * 24 * 60 * 60
+# a running job without a finished task for this long has lost one, to a
+# timeout or running out of memory, tasks time out after 15 minutes
+COHORT_STAGE_DEADLINE = 30 * 60
+
+
+class CohortJobStatus:
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+class CohortJob(Model):
+    """
+    Progress of a distributed cohort export.
+
+    The export runs in stages of independent tasks, extraction first and
+    then the merges building the cohort file. doneTasks holds the tasks of
+    the current stage that have finished, updatedAt when the last of them
+    finished or the stage started.
+    """
+
+    class Meta:
+        table_name = ENV_DYNAMO.DYNAMO_COHORT_JOBS_TABLE
+        region = REGION
+
+    jobId = UnicodeAttribute(hash_key=True)
+    uid = UnicodeAttribute(default="")
+    jobPath = UnicodeAttribute(default="")
+    merge = BooleanAttribute(default=False)
+    status = UnicodeAttribute(default=CohortJobStatus.RUNNING)
+    stage = UnicodeAttribute(default="")
+    totalTasks = NumberAttribute(default=0)
+    doneTasks = NumberSetAttribute(null=True)
+    error = UnicodeAttribute(default="")
+    createdAt = NumberAttribute(default=0)
+    updatedAt = NumberAttribute(default=0)
+    expiresAt = NumberAttribute(attr_name="ExpirationTime", default=0)
+
+    def to_dict(self):
+        return {
+            "jobId": self.jobId,
+            "status": self.status,
+            "stage": self.stage,
+            "totalTasks": self.totalTasks,
+            "completedTasks": len(self.doneTasks or ()),
+            "error": self.error,
+            "createdAt": self.createdAt,
+        }
+
+    def stage_done(self):
+        return len(self.doneTasks or ()) == self.totalTasks
+
+
+def create_cohort_job(job_id, uid, job_path, merge, stage, total_tasks):
+    now = int(time.time())
+    job = CohortJob(
+        job_id,
+        uid=uid,
+        jobPath=job_path,
+        merge=merge,
+        stage=stage,
+        totalTasks=total_tasks,
+        createdAt=now,
+        updatedAt=now,
+        expiresAt=now + COHORT_JOB_TTL,
+    )
+    job.save()
+    return job
+
+
+def record_cohort_task(job_id, stage, task):
+    """
+    Marks a task of the stage as done. Retried tasks add themselves again,
+    so this is idempotent, and tasks of a stage already passed are ignored.
+    Returns the job, or None when the task is stale.
+    """
+    job = CohortJob(job_id)
+    try:
+        job.update(
+            actions=[
+                CohortJob.doneTasks.add({task}),
+                CohortJob.updatedAt.set(int(time.time())),
+            ],
+            condition=(CohortJob.stage == stage)
+            & (CohortJob.status == CohortJobStatus.RUNNING),
+        )
+    except UpdateError:
+        return None
+    return job
+
+
+def advance_cohort_job(job_id, stage, next_stage, total_tasks):
+    """
+    Moves a job whose stage is done on to the next one. Only one of the
+    tasks racing to finish the stage succeeds, it alone returns True and
+    starts the next stage. A next_stage of None completes the job.
+    """
+    if next_stage is None:
+        actions = [CohortJob.status.set(CohortJobStatus.COMPLETED)]
+    else:
+        actions = [
+            CohortJob.stage.set(next_stage),
+            CohortJob.totalTasks.set(total_tasks),
+            CohortJob.doneTasks.remove(),
+            CohortJob.updatedAt.set(int(time.time())),
+        ]
+    try:
+        CohortJob(job_id).update(
+            actions=actions,
+            condition=(CohortJob.stage == stage)
+            & (CohortJob.status == CohortJobStatus.RUNNING),
+        )
+    except UpdateError:
+        return False
+    return True
+
+
+def fail_cohort_job(job_id, error):
+    try:
+        CohortJob(job_id).update(
+            actions=[
+                CohortJob.status.set(CohortJobStatus.FAILED),
+                CohortJob.error.set(str(error)[:1000]),
+            ],
+            condition=CohortJob.status == CohortJobStatus.RUNNING,
+        )
+    except UpdateError:
+        return False
+    return True
+
+
+def fail_stale_cohort_job(job: CohortJob):
+    """
+    Fails a running job whose stage has not moved for COHORT_STAGE_DEADLINE,
+    returns whether it did.
+    """
+    if (
+        job.status != CohortJobStatus.RUNNING
+        # jobs started before updatedAt was kept only have createdAt
+        or time.time() < (job.updatedAt or job.createdAt) + COHORT_STAGE_DEADLINE
+    ):
+        return False
+    if not fail_cohort_job(job.jobId, "Cohort job stopped making progress"):
+        return False
+    job.refresh()
+    return True
@@ -0,0 +1,170 @@
+import time
+
+import boto3
+from pynamodb.models import Model
+from pynamodb.attributes import (
+    MapAttribute,
+    NumberAttribute,
+    UnicodeAttribute,
+)
+from pynamodb.exceptions import UpdateError
+from shared.utils import ENV_DYNAMO
+
+
+SESSION = boto3.session.Session()
+REGION = SESSION.region_name
+# jobs and their result objects are dropped after a week
+VARIANT_QUERY_TTL = 7 * 24 * 60 * 60
+# a chunk lost to a splitQuery timeout never reports, running jobs older
+# than this are failed when polled
+VARIANT_QUERY_DEADLINE = 60 * 60
+
+
+class VariantQueryStatus:
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+class VariantQuery(Model):
+    """
+    Progress of an asynchronous variant query job.
+
+    The search is split into chunks of consecutive positions, resultCounts
+    maps each finished chunk to the number of distinct variants it found.
+    Chunks searched in parts record them in doneParts, keyed by chunk.
+    """
+
+    class Meta:
+        table_name = ENV_DYNAMO.DYNAMO_VARIANT_QUERIES_TABLE
+        region = REGION
+
+    jobId = UnicodeAttribute(hash_key=True)
+    uid = UnicodeAttribute(default="")
+    status = UnicodeAttribute(default=VariantQueryStatus.RUNNING)
+    assemblyId = UnicodeAttribute(default="")
+    referenceName = UnicodeAttribute(default="")
+    totalChunks = NumberAttribute(default=0)
+    resultCounts = MapAttribute(default=dict)
+    doneParts = MapAttribute(default=dict)
+    error = UnicodeAttribute(default="")
+    createdAt = NumberAttribute(default=0)
+    expiresAt = NumberAttribute(attr_name="ExpirationTime", default=0)
+
+    def to_dict(self):
+        return {
+            "jobId": self.jobId,
+            "status": self.status,
+            "assemblyId": self.assemblyId,
+            "referenceName": self.referenceName,
+            "totalChunks": self.totalChunks,
+            "completedChunks": len(self.resultCounts.as_dict()),
+            "error": self.error,
+            "createdAt": self.createdAt,
+        }
+
+    def chunk_counts(self):
+        counts = self.resultCounts.as_dict()
+        return [int(counts[str(chunk)]) for chunk in range(self.totalChunks)]
+
+
+def create_variant_query(job_id, uid, assembly_id, reference_name, total_chunks):
+    now = int(time.time())
+    job = VariantQuery(
+        job_id,
+        uid=uid,
+        assemblyId=assembly_id,
+        referenceName=reference_name,
+        totalChunks=total_chunks,
+        # an empty search has nothing to wait for
+        status=(
+            VariantQueryStatus.RUNNING if total_chunks else VariantQueryStatus.COMPLETED
+        ),
+        resultCounts={},
+        doneParts={},
+        createdAt=now,
+        expiresAt=now + VARIANT_QUERY_TTL,
+    )
+    job.save()
+    return job
+
+
+def record_variant_query_chunk(job_id, chunk, count):
+    """
+    Stores the result count of a chunk and completes the job with its last
+    chunk. Retried chunks overwrite their own entry, so this is idempotent.
+    """
+    job = VariantQuery(job_id)
+    job.update(
+        actions=[VariantQuery.resultCounts[str(chunk)].set(count)],
+        condition=VariantQuery.jobId.exists(),
+    )
+
+    if (
+        job.status == VariantQueryStatus.RUNNING
+        and len(job.resultCounts.as_dict()) == job.totalChunks
+    ):
+        try:
+            job.update(
+                actions=[VariantQuery.status.set(VariantQueryStatus.COMPLETED)],
+                condition=VariantQuery.status == VariantQueryStatus.RUNNING,
+            )
+        except UpdateError:
+            # completed or failed by another chunk
+            pass
+    return job
+
+
+def record_variant_query_part(job_id, chunk, part):
+    """
+    Marks a part of a chunk as searched, idempotently, and returns the
+    number of parts of the chunk searched so far.
+    """
+    job = VariantQuery(job_id)
+    job.update(
+        actions=[VariantQuery.doneParts[str(chunk)].add({part})],
+        condition=VariantQuery.jobId.exists(),
+    )
+    return len(job.doneParts.as_dict()[str(chunk)])
+
+
+def fail_variant_query(job_id, error):
+    try:
+        VariantQuery(job_id).update(
+            actions=[
+                VariantQuery.status.set(VariantQueryStatus.FAILED),
+                VariantQuery.error.set(str(error)[:1000]),
+            ],
+            condition=VariantQuery.status == VariantQueryStatus.RUNNING,
+        )
+    except UpdateError:
+        pass
+
+
+def fail_stale_variant_query(job: VariantQuery):
+    """
+    Fails a job still running past VARIANT_QUERY_DEADLINE, returns whether
+    it did.
+    """
+    if (
+        job.status != VariantQueryStatus.RUNNING
+        or time.time() < job.createdAt + VARIANT_QUERY_DEADLINE
+    ):
+        return False
+    fail_variant_query(job.jobId, "Variant query did not finish in time")
+    job.refresh()
+    return True
+
+
+def variant_query_plan_key(job_id):
+    return f"variant-queries/{job_id}/plan.json"
+
+
+def variant_query_part_key(job_id, chunk, part):
+    # distinct variants of a part of a chunk, merged into the chunk's result
+    return f"variant-queries/{job_id}/parts/{chunk:06d}-{part:06d}.jsonl"
+
+
+def variant_query_result_key(job_id, chunk):
+    # json lines of the distinct variants of a chunk, in position order
+    return f"variant-queries/{job_id}/{chunk:06d}.jsonl"
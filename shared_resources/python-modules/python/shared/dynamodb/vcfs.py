@@ -0,0 +1,125 @@
+import json
+
+import boto3
+from botocore.exceptions import ClientError
+from pynamodb.models import Model
+from pynamodb.attributes import (
+    BooleanAttribute,
+    ListAttribute,
+    NumberAttribute,
+    UnicodeAttribute,
+)
+from shared.utils import ENV_DYNAMO, get_vcf_chromosomes, get_vcf_samples
+from shared.utils.vcf_header import (
+    VcfHeaderError,
+    find_index,
+    read_index_chromosomes,
+    read_vcf_header,
+    split_s3_location,
+)
+
+
+SESSION = boto3.session.Session()
+REGION = SESSION.region_name
+# items are capped at 400KB, larger sample lists are read from the vcf each time
+MAX_CACHED_SAMPLES_BYTES = 300 * 1024
+
+s3 = boto3.client("s3")
+
+
+class Vcf(Model):
+    """
+    A VCF file, with the sample count kept by updateFiles and the header and
+    index contents memoized against the ETags they were read at.
+    """
+
+    class Meta:
+        table_name = ENV_DYNAMO.DYNAMO_VCFS_TABLE
+        region = REGION
+
+    vcfLocation = UnicodeAttribute(hash_key=True)
+    num_samples = NumberAttribute(null=True)
+    etag = UnicodeAttribute(null=True)
+    gzipped = BooleanAttribute(null=True)
+    samples = ListAttribute(of=UnicodeAttribute, null=True)
+    contigs = ListAttribute(of=UnicodeAttribute, null=True)
+    indexEtag = UnicodeAttribute(null=True)
+    chromosomes = ListAttribute(of=UnicodeAttribute, null=True)
+
+
+def vcf_cache_key(location):
+    # project files share the items updateFiles keys by {project}/project-files/...
+    _, key = split_s3_location(location)
+    if key and key.startswith("projects/"):
+        return key[len("projects/") :]
+    return location
+
+
+def inspect_vcf(location, chromosomes=True):
+    """
+    Samples and, unless chromosomes is False, indexed chromosomes of a VCF
+    on S3. The header and index are only fetched when their ETags differ
+    from the ones memoized in the VCFs table.
+    """
+    bucket, key = split_s3_location(location)
+    etag = s3.head_object(Bucket=bucket, Key=key)["ETag"]
+    cache_key = vcf_cache_key(location)
+    actions = []
+
+    try:
+        vcf = Vcf.get(cache_key)
+    except Vcf.DoesNotExist:
+        vcf = Vcf(cache_key)
+
+    if vcf.etag != etag or vcf.samples is None:
+        vcf.etag, vcf.gzipped, vcf.samples, vcf.contigs = read_vcf_header(location)
+        actions += [
+            Vcf.etag.set(vcf.etag),
+            Vcf.gzipped.set(vcf.gzipped),
+            Vcf.contigs.set(vcf.contigs),
+        ]
+        if len(json.dumps(vcf.samples)) <= MAX_CACHED_SAMPLES_BYTES:
+            actions.append(Vcf.samples.set(vcf.samples))
+        else:
+            actions.append(Vcf.samples.remove())
+    header = {"samples": vcf.samples}
+
+    if chromosomes:
+        if not vcf.gzipped:
+            raise VcfHeaderError(f"{location} is not a gzipped vcf file.")
+        index_key, index_etag = find_index(location)
+
+        if vcf.indexEtag != index_etag or vcf.chromosomes is None:
+            vcf.indexEtag = index_etag
+            vcf.chromosomes = read_index_chromosomes(location, index_key, vcf.contigs)
+            actions += [
+                Vcf.indexEtag.set(vcf.indexEtag),
+                Vcf.chromosomes.set(vcf.chromosomes),
+            ]
+        header["chromosomes"] = vcf.chromosomes
+
+    if actions:
+        vcf.update(actions=actions)
+    return header
+
+
+def get_vcf_header(location, chromosomes=True):
+    """
+    inspect_vcf in the (errored, error, result) form of get_vcf_samples and
+    get_vcf_chromosomes, which still serve locations outside of S3.
+    """
+    if split_s3_location(location)[0] is None:
+        errored, error, samples = get_vcf_samples(location)
+        header = {"samples": samples}
+        if chromosomes and not errored:
+            errored, error, header["chromosomes"] = get_vcf_chromosomes(location)
+        return errored, error, header
+
+    try:
+        return False, "", inspect_vcf(location, chromosomes)
+    except VcfHeaderError as e:
+        error = str(e)
+    except ClientError as e:
+        print(f"Error reading {location}: {e}")
+        error = f"Could not access {location}."
+    return True, error, None
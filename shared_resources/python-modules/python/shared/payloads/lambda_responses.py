@@ -21,3 +21,5 @@ class PerformQueryResponse(jsons.JsonSerializable):
     variants: list
     call_count: int
     sample_names: list
+    # last position fully scanned when the query stopped early at its limit
+    horizon: int = None
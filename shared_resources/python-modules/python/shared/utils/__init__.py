@@ -1,5 +1,7 @@
 from .chrom_matching import (
     get_matching_chromosome,
+    get_reference_chromosome_map,
+    get_vcf_chromosome,
     get_vcf_chromosomes,
     get_vcf_samples,
 )
@@ -13,4 +15,21 @@ from .lambda_utils import (
     make_temp_file,
     clear_tmp,
 )
-from .lambda_utils import LambdaClient
+from .lambda_utils import ThrottleBudgetExceeded, ThrottleController
+from .dataset_catalog import DATASET_CATALOG_KEY, build_dataset_catalog
+from .filtering_terms_catalog import (
+    FILTERING_TERMS_MANIFEST_KEY,
+    FILTERING_TERMS_PREFIX,
+    build_filtering_terms_catalogs,
+    filtering_terms_catalog_key,
+    trigrams,
+)
+from .presence_index import (
+    BloomFilter,
+    dump_presence_index,
+    load_presence_bloom,
+    presence_index_block,
+    presence_index_key,
+    presence_index_prefix,
+    presence_index_status_key,
+)
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+import aiohttp
+import boto3
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+
+from .lambda_utils import (
+    MAX_THROTTLE_RETRIES,
+    THROTTLE_ERRORS,
+    ThrottleBudgetExceeded,
+    ThrottleController,
+)
+
+
+class LambdaInvokeError(Exception):
+    pass
+
+
+class AsyncLambdaClient:
+    """
+    Invokes lambdas from a single event loop thread sharing one connection
+    pool, instead of holding a blocking boto3 call open per thread.
+
+    submit() may be called from any thread and returns a
+    concurrent.futures.Future resolving to the response payload bytes;
+    cancelling the future cancels the invocation. Invocations in flight
+    are bounded by an AIMD ThrottleController capped at max_in_flight.
+    """
+
+    def __init__(self, max_in_flight, deadline, name="AsyncLambdaClient"):
+        self.max_in_flight = max_in_flight
+        self.deadline = deadline
+        self.throttle = ThrottleController(name, max_in_flight)
+        session = boto3.session.Session()
+        self._credentials = session.get_credentials()
+        self._region = session.region_name
+        self._endpoint = f"https://lambda.{self._region}.amazonaws.com"
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # the loop outlives the invocation so warm containers keep connections
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+        return self._loop
+
+    async def _open(self):
+        self._slot_freed = asyncio.Condition()
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+            timeout=aiohttp.ClientTimeout(total=None),
+        )
+
+    def _signed_headers(self, function_name, invocation_type, body):
+        request = AWSRequest(
+            method="POST",
+            url=f"{self._endpoint}/2015-03-31/functions/{function_name}/invocations",
+            data=body,
+            headers={"X-Amz-Invocation-Type": invocation_type},
+        )
+        SigV4Auth(
+            self._credentials.get_frozen_credentials(), "lambda", self._region
+        ).add_auth(request)
+        return request.url, dict(request.headers)
+
+    async def _acquire(self):
+        async with self._slot_freed:
+            await self._slot_freed.wait_for(self.throttle.try_acquire)
+
+    async def _release(self, succeeded):
+        # a success may have raised the limit, wake a waiter per new slot
+        grown = self.throttle.on_success() if succeeded else 0
+        self.throttle.release()
+        async with self._slot_freed:
+            self._slot_freed.notify(1 + grown)
+
+    async def _attempt(self, function_name, invocation_type, body):
+        """
+        One invocation holding a slot, returns (throttled, payload).
+        """
+        url, headers = self._signed_headers(function_name, invocation_type, body)
+        await self._acquire()
+        status = None
+
+        try:
+            async with self._session.post(url, data=body, headers=headers) as resp:
+                payload = await resp.read()
+                error_type = resp.headers.get("x-amzn-ErrorType", "").split(":")[0]
+                status = resp.status
+                function_error = resp.headers.get("X-Amz-Function-Error")
+        except aiohttp.ServerDisconnectedError:
+            # pooled connection dropped while the container was frozen
+            return True, None
+        finally:
+            await self._release(status is not None and status < 300)
+
+        if status < 300:
+            if function_error:
+                raise LambdaInvokeError(f"{function_error}: {payload[:1000]}")
+            return False, payload
+        if error_type in THROTTLE_ERRORS or status == 429:
+            self.throttle.on_throttle()
+            return True, None
+        raise LambdaInvokeError(f"{status} {error_type}: {payload[:1000]}")
+
+    async def _invoke(self, function_name, invocation_type, body, deadline):
+        give_up = time.monotonic() + deadline
+
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            throttled, payload = await self._attempt(
+                function_name, invocation_type, body
+            )
+            if not throttled:
+                return payload
+            delay = self.throttle.backoff(attempt)
+            if time.monotonic() + delay > give_up:
+                break
+            await asyncio.sleep(delay)
+
+        raise ThrottleBudgetExceeded(f"{function_name}: throttled {attempt + 1} times")
+
+    async def _bounded_invoke(self, function_name, invocation_type, body, deadline):
+        return await asyncio.wait_for(
+            self._invoke(function_name, invocation_type, body, deadline), deadline
+        )
+
+    def submit(
+        self, *, FunctionName, Payload, InvocationType="RequestResponse", deadline=None
+    ):
+        loop = self._start()
+        body = Payload.encode() if isinstance(Payload, str) else Payload
+
+        return asyncio.run_coroutine_threadsafe(
+            self._bounded_invoke(
+                FunctionName, InvocationType, body, deadline or self.deadline
+            ),
+            loop,
+        )
@@ -109,6 +109,24 @@ def get_matching_chromosome(vcf_chromosomes, target_chromosome):
     return None
 
 
+def get_reference_chromosome_map(vcf_chromosomes):
+    # what get_matching_chromosome returns for every resolvable name, precomputed
+    references = dict()
+
+    for vcf_chrom in vcf_chromosomes:
+        references.setdefault(vcf_chrom, vcf_chrom)
+        if reference := _match_chromosome_name(vcf_chrom):
+            references.setdefault(reference, vcf_chrom)
+    return references
+
+
+def get_vcf_chromosome(vcf_chromosome_map, target_chromosome):
+    # entries served from the dataset catalog carry the resolved names
+    if (references := vcf_chromosome_map.get("references")) is not None:
+        return references.get(target_chromosome)
+    return get_matching_chromosome(vcf_chromosome_map["chromosomes"], target_chromosome)
+
+
 def _match_chromosome_name(chromosome_name):
     for i in range(len(chromosome_name)):
         chrom = chromosome_name[i:]  # progressively remove prefix
@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+from .chrom_matching import get_reference_chromosome_map
+
+
+# datasets, vcfs and chromosome names per assembly, republished by the
+# indexer whenever the datasets table is rebuilt
+DATASET_CATALOG_KEY = "dataset-catalog/catalog.json"
+
+
+def build_dataset_catalog(datasets, version):
+    """
+    datasets are dicts with id, assemblyId, projectName, datasetName,
+    vcfLocations and vcfChromosomeMap as stored in the datasets table
+    """
+    assemblies = defaultdict(list)
+
+    for dataset in datasets:
+        assemblies[dataset["assemblyId"]].append(
+            {
+                "id": dataset["id"],
+                "projectName": dataset["projectName"],
+                "datasetName": dataset["datasetName"],
+                "vcfLocations": dataset["vcfLocations"],
+                "vcfChromosomeMap": [
+                    {
+                        "vcf": vcfm["vcf"],
+                        "chromosomes": vcfm["chromosomes"],
+                        "references": get_reference_chromosome_map(
+                            vcfm["chromosomes"]
+                        ),
+                    }
+                    for vcfm in dataset["vcfChromosomeMap"]
+                ],
+            }
+        )
+
+    return {"version": version, "assemblies": assemblies}
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+
+# filtering terms of each project and the search index over them, published
+# by the indexer whenever the terms are reindexed
+FILTERING_TERMS_PREFIX = "filtering-terms/"
+FILTERING_TERMS_MANIFEST_KEY = f"{FILTERING_TERMS_PREFIX}manifest.json"
+
+
+def filtering_terms_catalog_key(project):
+    return f"{FILTERING_TERMS_PREFIX}projects/{project}.json"
+
+
+def trigrams(text):
+    text = text.lower()
+    return {text[n : n + 3] for n in range(len(text) - 2)}
+
+
+def build_filtering_terms_catalogs(rows, version):
+    """
+    rows are (project, term, label, type, kind, dataset id) tuples. Returns
+    a catalog per project, holding its terms in term order, the positions
+    of the terms found in each kind of entity and in each dataset, and a
+    trigram index over the term ids and labels.
+    """
+    projects = defaultdict(lambda: defaultdict(lambda: (set(), set())))
+
+    for project, term, label, typ, kind, dataset_id in rows:
+        kinds, datasets = projects[project][(term, label, typ)]
+        kinds.add(kind)
+        if dataset_id:
+            datasets.add(dataset_id)
+
+    catalogs = dict()
+
+    for project, entries in projects.items():
+        terms = sorted(entries)
+        kinds = defaultdict(list)
+        datasets = defaultdict(list)
+        index = defaultdict(list)
+
+        for position, entry in enumerate(terms):
+            entry_kinds, entry_datasets = entries[entry]
+            for kind in sorted(entry_kinds):
+                kinds[kind].append(position)
+            for dataset_id in sorted(entry_datasets):
+                datasets[dataset_id].append(position)
+            term, label, _ = entry
+            for trigram in sorted(trigrams(term) | trigrams(label)):
+                index[trigram].append(position)
+
+        catalogs[project] = {
+            "version": version,
+            "terms": [list(entry) for entry in terms],
+            "kinds": kinds,
+            "datasets": datasets,
+            "trigrams": index,
+        }
+
+    return catalogs
@@ -2,14 +2,18 @@ import contextlib
 import tempfile
 import shutil
 import os
+import json
+import threading
 import time
 import random
 
-import botocore
-import boto3
 
-
-THROTTLE_DELAYS = [0.1 * i for i in range(1, 6)]
+# errors lambda raises when the account or function is out of capacity
+THROTTLE_ERRORS = {"TooManyRequestsException", "ServiceException"}
+# retry budget for throttled invocations of AsyncLambdaClient
+MAX_THROTTLE_RETRIES = 8
+BASE_BACKOFF = 0.1
+MAX_BACKOFF = 5.0
 
 
 # from https://bitbucket.csiro.au/users/jai014/repos/covidbeacon/browse
@@ -25,34 +29,122 @@ class Timer:
         return f"{self.passed()}ms"
 
 
-# from https://bitbucket.csiro.au/users/jai014/repos/covidbeacon/browse
-class LambdaClient:
-    def __init__(self):
-        lambda_config = botocore.config.Config(
-            read_timeout=300,
-            max_pool_connections=500,
-            retries={
-                "total_max_attempts": 1,
-            },
+class ThrottleBudgetExceeded(Exception):
+    pass
+
+
+class ThrottleController:
+    """
+    Additive increase, multiplicative decrease limit on invocations in flight.
+
+    Successes raise the limit by `increase` per `limit` completions (one per
+    round of calls), a throttle multiplies it by `decrease`, at most once per
+    `cooldown` seconds so a burst of throttles from the same round only backs
+    off once. The limit is reported as a CloudWatch embedded metric.
+    """
+
+    def __init__(
+        self,
+        name,
+        max_limit,
+        *,
+        initial_limit=None,
+        min_limit=1,
+        increase=1.0,
+        decrease=0.5,
+        cooldown=1.0,
+        report_interval=10.0,
+    ):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.report_interval = report_interval
+        self._limit = float(initial_limit or max_limit)
+        self._in_flight = 0
+        self._throttles = 0
+        self._last_decrease = 0.0
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    def try_acquire(self):
+        with self._lock:
+            if self._in_flight >= self.limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def on_success(self):
+        with self._lock:
+            before = self.limit
+            self._limit = min(
+                self.max_limit, self._limit + self.increase / max(self._limit, 1)
+            )
+            grown = self.limit - before
+        self._maybe_report()
+        return grown
+
+    def on_throttle(self):
+        now = time.monotonic()
+
+        with self._lock:
+            self._throttles += 1
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self._limit = max(self.min_limit, self._limit * self.decrease)
+        self._maybe_report()
+
+    def backoff(self, attempt):
+        # full jitter, https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2**attempt))
+
+    def _maybe_report(self):
+        now = time.monotonic()
+
+        if now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        self.report()
+
+    def report(self):
+        with self._lock:
+            throttles, self._throttles = self._throttles, 0
+            limit, in_flight = self.limit, self._in_flight
+        # picked up from the log stream by cloudwatch, no client calls needed
+        print(
+            json.dumps(
+                {
+                    "_aws": {
+                        "Timestamp": int(time.time() * 1000),
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": "sBeacon/Lambda",
+                                "Dimensions": [["Client"]],
+                                "Metrics": [
+                                    {"Name": "ConcurrencyLimit", "Unit": "Count"},
+                                    {"Name": "InFlight", "Unit": "Count"},
+                                    {"Name": "Throttles", "Unit": "Count"},
+                                ],
+                            }
+                        ],
+                    },
+                    "Client": self.name,
+                    "ConcurrencyLimit": limit,
+                    "InFlight": in_flight,
+                    "Throttles": throttles,
+                }
+            )
         )
-        self.client = boto3.client("lambda", config=lambda_config)
-
-    def invoke(self, **kwargs):
-        while True:
-            try:
-                response = self.client.invoke(**kwargs)
-            except botocore.exceptions.ClientError as error:
-                response = error.response
-                if response["Error"]["Code"] == "TooManyRequestsException":
-                    time.sleep(random.choice(THROTTLE_DELAYS))
-                    continue
-                elif response["Error"]["Code"] == "ServiceException":
-                    time.sleep(random.choice(THROTTLE_DELAYS))
-                    continue
-                else:
-                    raise error
-            else:
-                return response
 
 
 class BeaconEnvironment:
@@ -222,15 +314,23 @@ class AthenaEnvironment:
     def ATHENA_RELATIONS_TABLE(self):
         return os.environ["ATHENA_RELATIONS_TABLE"]
 
+    @property
+    def ATHENA_CARRIERS_TABLE(self):
+        return os.environ["ATHENA_CARRIERS_TABLE"]
+
 
 class DynamoDBEnvironment:
     # @property
     # def DYNAMO_DATASETS_TABLE(self):
     #     return os.environ["DYNAMO_DATASETS_TABLE"]
 
-    # @property
-    # def DYNAMO_VARIANT_QUERIES_TABLE(self):
-    #     return os.environ["DYNAMO_VARIANT_QUERIES_TABLE"]
+    @property
+    def DYNAMO_VARIANT_QUERIES_TABLE(self):
+        return os.environ["DYNAMO_VARIANT_QUERIES_TABLE"]
+
+    @property
+    def DYNAMO_COHORT_JOBS_TABLE(self):
+        return os.environ["DYNAMO_COHORT_JOBS_TABLE"]
 
     # @property
     # def DYNAMO_VARIANT_QUERY_RESPONSES_TABLE(self):
@@ -320,6 +420,10 @@ class DynamoDBEnvironment:
     def DYNAMO_CLI_UPLOAD_TABLE(self):
         return os.environ["DYNAMO_CLI_UPLOAD_TABLE"]
 
+    @property
+    def DYNAMO_VCFS_TABLE(self):
+        return os.environ["DYNAMO_VCFS_TABLE"]
+
 
 # class SnsEnvironment:
 #     @property
@@ -360,6 +464,10 @@ class ConfigEnvironment:
     def CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE(self):
         return int(os.environ["CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE"])
 
+    @property
+    def CONFIG_MAX_VARIANT_QUERY_JOB_BASE_RANGE(self):
+        return int(os.environ["CONFIG_MAX_VARIANT_QUERY_JOB_BASE_RANGE"])
+
 
 def clear_tmp():
     try:
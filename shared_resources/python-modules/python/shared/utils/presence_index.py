@@ -0,0 +1,255 @@
+from collections import OrderedDict
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+# one object per vcf of a dataset holding bloom filters of variant
+# positions for each block of each of its chromosomes, written after ingestion
+PRESENCE_INDEX_PREFIX = "variant-index"
+PRESENCE_INDEX_MAGIC = b"SBP2"
+PRESENCE_INDEX_FALSE_POSITIVE_RATE = 0.01
+# positions covered by one bloom, a lookup only fetches the block it falls in
+PRESENCE_INDEX_BLOCK_SIZE = 1_000_000
+# enough to fetch the header and table of contents in one request
+PRESENCE_INDEX_HEAD_BYTES = 64 * 1024
+# memory given to the tables of contents and blooms kept across invocations
+PRESENCE_INDEX_CACHE_BYTES = int(
+    os.environ.get("PRESENCE_INDEX_CACHE_BYTES", 64 * 1024 * 1024)
+)
+
+
+s3 = boto3.client("s3")
+
+
+class ByteBudgetCache:
+    """
+    Thread safe LRU cache evicting the least recently used entries once
+    the sizes of the cached values exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        if key in self._entries:
+            _, size = self._entries.pop(key)
+            self.size -= size
+
+
+# key -> etag and table of contents of the cached version, and
+# (key, etag, chromosome, block) -> bloom read from that version
+_index_cache = ByteBudgetCache(PRESENCE_INDEX_CACHE_BYTES)
+
+
+class BloomFilter:
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(
+        cls, capacity, false_positive_rate=PRESENCE_INDEX_FALSE_POSITIVE_RATE
+    ):
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(
+            -capacity * math.log(false_positive_rate) / (math.log(2) ** 2)
+        )
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def _indexes(self, item):
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item):
+        for idx in self._indexes(item):
+            self.bits[idx >> 3] |= 1 << (idx & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[idx >> 3] & (1 << (idx & 7)) for idx in self._indexes(item)
+        )
+
+
+def presence_index_prefix(dataset_id):
+    return f"{PRESENCE_INDEX_PREFIX}/{dataset_id}/"
+
+
+def presence_index_key(dataset_id, vcf):
+    digest = hashlib.sha256(vcf.encode()).hexdigest()
+    return f"{presence_index_prefix(dataset_id)}{digest}"
+
+
+def presence_index_status_key(dataset_id, vcf):
+    # building, completed or failed, with the error of a failed build
+    return f"{presence_index_key(dataset_id, vcf)}.status.json"
+
+
+def presence_index_block(position):
+    return (int(position) - 1) // PRESENCE_INDEX_BLOCK_SIZE
+
+
+def dump_presence_index(blooms):
+    """
+    Serialise {chromosome: {block: BloomFilter}} as
+    MAGIC | uint32 toc length | toc json | bloom bits...
+    so that readers can fetch the bloom of a single block with a ranged GET.
+    Blocks without records are left out.
+    """
+    toc = {"blockSize": PRESENCE_INDEX_BLOCK_SIZE, "chromosomes": dict()}
+    offset = 0
+    sections = []
+
+    for chromosome, blocks in blooms.items():
+        entries = toc["chromosomes"][chromosome] = dict()
+
+        for block, bloom in sorted(blocks.items()):
+            entries[str(block)] = [
+                offset,
+                len(bloom.bits),
+                bloom.num_bits,
+                bloom.num_hashes,
+            ]
+            sections.append(bytes(bloom.bits))
+            offset += len(bloom.bits)
+
+    toc_bytes = json.dumps(toc, separators=(",", ":")).encode()
+    return b"".join(
+        [PRESENCE_INDEX_MAGIC, struct.pack("<I", len(toc_bytes)), toc_bytes, *sections]
+    )
+
+
+def _get_range(bucket, key, start, end, **conditions):
+    return s3.get_object(
+        Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", **conditions
+    )
+
+
+def _load_index(bucket, key):
+    """
+    The cached index of the key, revalidated against its ETag on every
+    call so that a rebuilt index is never read stale. None when the key is
+    not indexed.
+    """
+    cached = _index_cache.get(key)
+
+    try:
+        response = _get_range(
+            bucket,
+            key,
+            0,
+            PRESENCE_INDEX_HEAD_BYTES - 1,
+            **({"IfNoneMatch": cached["etag"]} if cached else {}),
+        )
+    except ClientError as e:
+        code = e.response["Error"]["Code"]
+        if code in ("304", "NotModified"):
+            return cached
+        # not indexed yet or the index is being rebuilt
+        if code not in ("NoSuchKey", "InvalidRange"):
+            raise e
+        _index_cache.pop(key)
+        return None
+
+    head = response["Body"].read()
+    etag = response["ETag"]
+
+    # indexes written in an older layout are searched in full until rebuilt
+    if head[:4] != PRESENCE_INDEX_MAGIC:
+        _index_cache.pop(key)
+        return None
+
+    (toc_length,) = struct.unpack("<I", head[4:8])
+    toc_end = 8 + toc_length
+
+    if toc_end > len(head):
+        head += _get_range(bucket, key, len(head), toc_end - 1, IfMatch=etag)[
+            "Body"
+        ].read()
+
+    toc = json.loads(head[8:toc_end])
+    index = {
+        "etag": etag,
+        "base": toc_end,
+        "blockSize": toc["blockSize"],
+        "entries": toc["chromosomes"],
+    }
+    return _index_cache.put(key, index, toc_end)
+
+
+def load_presence_bloom(bucket, dataset_id, vcf, chromosome, position):
+    """
+    Returns the bloom of the block of the vcf and chromosome covering the
+    1-based position, False if the vcf is indexed but has no records in
+    that block, and None if the vcf is not indexed.
+    """
+    key = presence_index_key(dataset_id, vcf)
+
+    try:
+        index = _load_index(bucket, key)
+
+        if index is None:
+            return None
+
+        block = str((int(position) - 1) // index["blockSize"])
+
+        if block not in index["entries"].get(chromosome, {}):
+            return False
+
+        bloom_key = (key, index["etag"], chromosome, block)
+
+        if (bloom := _index_cache.get(bloom_key)) is not None:
+            return bloom
+
+        offset, length, num_bits, num_hashes = index["entries"][chromosome][block]
+        start = index["base"] + offset
+        # blooms are only read from the version their offsets come from
+        bits = _get_range(
+            bucket, key, start, start + length - 1, IfMatch=index["etag"]
+        )["Body"].read()
+    except ClientError as e:
+        # replaced while reading, search the vcf rather than guess
+        if e.response["Error"]["Code"] not in ("412", "PreconditionFailed"):
+            raise e
+        _index_cache.pop(key)
+        return None
+
+    bloom = BloomFilter(num_bits, num_hashes, bytearray(bits))
+
+    return _index_cache.put(bloom_key, bloom, length)
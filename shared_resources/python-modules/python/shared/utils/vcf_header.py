@@ -0,0 +1,215 @@
+import re
+import struct
+import zlib
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+s3 = boto3.client("s3")
+# first ranged read, doubled on every further read of the same object
+FIRST_RANGE = 64 * 1024
+MAX_RANGE = 4 * 1024 * 1024
+INDEX_SUFFIXES = (".tbi", ".csi")
+contig_pattern = re.compile(r"^##contig=<(.*)>$")
+
+
+class VcfHeaderError(Exception):
+    pass
+
+
+def split_s3_location(location):
+    if not location.startswith("s3://"):
+        return None, None
+    bucket, _, key = location[len("s3://") :].partition("/")
+    return bucket, key
+
+
+class RangedReader:
+    """
+    Reads an S3 object front to back with ranged GETs, only as far as it
+    is consumed. gzip and BGZF objects are inflated member by member.
+    """
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self.etag = None
+        self.gzipped = None
+        self._offset = 0
+        self._size = None
+        self._range = FIRST_RANGE
+        self._buffer = b""
+        self._inflate = None
+
+    def _fetch(self):
+        if self._size is not None and self._offset >= self._size:
+            return b""
+        response = s3.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={self._offset}-{self._offset + self._range - 1}",
+            **({"IfMatch": self.etag} if self.etag else {}),
+        )
+        self.etag = response["ETag"]
+        self._size = int(response["ContentRange"].rpartition("/")[2])
+        data = response["Body"].read()
+        self._offset += len(data)
+        self._range = min(2 * self._range, MAX_RANGE)
+        return data
+
+    def _fill(self):
+        data = self._fetch()
+        if not data:
+            return False
+        if self.gzipped is None:
+            self.gzipped = data[:2] == b"\x1f\x8b"
+        if not self.gzipped:
+            self._buffer += data
+            return True
+
+        while data:
+            if self._inflate is None:
+                self._inflate = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            self._buffer += self._inflate.decompress(data)
+            if not self._inflate.eof:
+                break
+            # the next BGZF block is a gzip member of its own
+            data = self._inflate.unused_data
+            self._inflate = None
+        return True
+
+    def peek(self, n):
+        while len(self._buffer) < n and self._fill():
+            pass
+        return self._buffer[:n]
+
+    def read(self, n):
+        data = self.peek(n)
+        if len(data) < n:
+            raise VcfHeaderError(f"Unexpected end of s3://{self.bucket}/{self.key}")
+        self._buffer = self._buffer[n:]
+        return data
+
+    def readline(self):
+        while b"\n" not in self._buffer and self._fill():
+            pass
+        line, newline, self._buffer = self._buffer.partition(b"\n")
+        return line + newline
+
+    def read_int32(self):
+        return struct.unpack("<i", self.read(4))[0]
+
+
+def _header_contigs(header_lines):
+    # in dictionary order, which is what BCF records and indexes refer to
+    contigs = dict()
+
+    for line in header_lines:
+        if match := contig_pattern.match(line):
+            fields = dict(
+                field.split("=", 1)
+                for field in re.split(r",(?=\w+=)", match.group(1))
+                if "=" in field
+            )
+            if "ID" in fields:
+                contigs[fields["ID"]] = int(fields.get("IDX", len(contigs)))
+    return [contig for contig, _ in sorted(contigs.items(), key=lambda c: c[1])]
+
+
+def read_vcf_header(location):
+    """
+    Reads the header of a VCF or BCF (plain, gzipped or BGZF) from S3.
+    Returns the ETag of the file, whether it is compressed, its samples
+    and its ##contig names.
+    """
+    bucket, key = split_s3_location(location)
+    reader = RangedReader(bucket, key)
+
+    if reader.peek(5) == b"BCF\x02\x02":
+        reader.read(5)
+        text = reader.read(struct.unpack("<I", reader.read(4))[0])
+        lines = text.rstrip(b"\0").decode(errors="replace").splitlines()
+    else:
+        lines = []
+        while (line := reader.readline()) and line.startswith(b"#"):
+            lines.append(line.decode(errors="replace").rstrip("\r\n"))
+            if line.startswith(b"#CHROM"):
+                break
+
+    if not lines or not lines[0].startswith("##fileformat=VCF"):
+        raise VcfHeaderError(f"{location} is not a vcf file.")
+    if not lines[-1].startswith("#CHROM"):
+        raise VcfHeaderError(f"{location} has no #CHROM header line.")
+
+    samples = lines[-1].split("\t")[9:]
+    print(f"vcf - {location} has samples - {len(samples)}")
+    return reader.etag, reader.gzipped, samples, _header_contigs(lines)
+
+
+def _csi_referenced(reader):
+    # the ids of the references that have records, per the bins of each
+    referenced = []
+
+    for tid in range(reader.read_int32()):
+        n_bin = reader.read_int32()
+        for _ in range(n_bin):
+            reader.read(12)
+            reader.read(16 * reader.read_int32())
+        if n_bin:
+            referenced.append(tid)
+    return referenced
+
+
+def find_index(location):
+    """
+    Locates the .tbi or .csi index of a VCF on S3, returns its key and ETag.
+    """
+    bucket, key = split_s3_location(location)
+
+    for suffix in INDEX_SUFFIXES:
+        try:
+            response = s3.head_object(Bucket=bucket, Key=f"{key}{suffix}")
+            return f"{key}{suffix}", response["ETag"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404", "403"):
+                raise
+    raise VcfHeaderError(f"Could not open index file for {location}.")
+
+
+def read_index_chromosomes(location, index_key, header_contigs):
+    """
+    Lists the chromosomes with records, as `tabix --list-chroms` does,
+    from the .tbi or .csi index of a VCF on S3.
+    """
+    bucket, _ = split_s3_location(location)
+    reader = RangedReader(bucket, index_key)
+    magic = reader.read(4)
+
+    if magic == b"TBI\x01":
+        # n_ref, then the tabix configuration ahead of the sequence names
+        reader.read(4 + 24)
+        names = reader.read(reader.read_int32())
+    elif magic == b"CSI\x01":
+        reader.read(8)
+        aux = reader.read(reader.read_int32())
+        names = None
+        if len(aux) >= 28:
+            # tabix style csi indexes carry the names in their aux data
+            names_length = struct.unpack("<i", aux[24:28])[0]
+            names = aux[28 : 28 + names_length]
+    else:
+        raise VcfHeaderError(f"Could not open index file for {location}.")
+
+    if names is not None:
+        chromosomes = [name.decode() for name in names.split(b"\0") if name]
+    else:
+        # BCF indexes refer to the contigs of the header dictionary
+        chromosomes = [
+            header_contigs[tid]
+            for tid in _csi_referenced(reader)
+            if tid < len(header_contigs)
+        ]
+
+    print(f"vcf - {location} has chromosomes - {chromosomes}")
+    return chromosomes
@@ -1 +1,8 @@
-from .search_variants import perform_variant_search
+from .dataset_catalog import get_catalog_datasets
+from .presence import filter_datasets_by_presence
+from .search_variants import (
+    perform_variant_search,
+    perform_variant_search_page,
+    plan_variant_query_job,
+    submit_variant_query_job,
+)
@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+from shared.athena import Dataset
+from shared.athena.common import ApprovedProjects
+from shared.utils import ENV_ATHENA, DATASET_CATALOG_KEY
+
+
+# how long a warm container trusts its copy before revalidating the etag
+CATALOG_REVALIDATE_SECONDS = 30
+
+
+s3 = boto3.client("s3")
+_lock = threading.Lock()
+_catalog = {"etag": None, "checked": 0, "body": None}
+
+
+def _load_catalog():
+    with _lock:
+        if time.time() - _catalog["checked"] < CATALOG_REVALIDATE_SECONDS:
+            return _catalog["body"]
+
+        kwargs = {
+            "Bucket": ENV_ATHENA.ATHENA_METADATA_BUCKET,
+            "Key": DATASET_CATALOG_KEY,
+        }
+        if _catalog["etag"]:
+            kwargs["IfNoneMatch"] = _catalog["etag"]
+
+        try:
+            response = s3.get_object(**kwargs)
+            _catalog["body"] = json.loads(response["Body"].read())
+            _catalog["etag"] = response["ETag"]
+            print(f"Loaded dataset catalog version {_catalog['body']['version']}")
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("304", "NotModified"):
+                pass
+            elif code == "NoSuchKey":
+                # not published yet, callers fall back to athena
+                _catalog["body"] = None
+                _catalog["etag"] = None
+            else:
+                raise e
+        _catalog["checked"] = time.time()
+
+        return _catalog["body"]
+
+
+def get_catalog_datasets(assembly_id, *, projects=None, sub=None, dataset_id=None):
+    """
+    Datasets of the assembly visible to the user, as the datasets table
+    would return them. Returns None when no catalog has been published.
+    """
+    catalog = _load_catalog()
+
+    if catalog is None:
+        return None
+
+    approved_projects = set(
+        ApprovedProjects(project_names=projects, user_sub=sub).get_approved_projects()
+    )
+
+    # fresh instances, callers prune the vcfs of the datasets they get
+    return [
+        Dataset(
+            id=entry["id"],
+            projectName=entry["projectName"],
+            datasetName=entry["datasetName"],
+            vcfLocations=list(entry["vcfLocations"]),
+            vcfChromosomeMap=entry["vcfChromosomeMap"],
+        )
+        for entry in catalog["assemblies"].get(assembly_id, [])
+        if entry["projectName"] in approved_projects
+        and (dataset_id is None or entry["id"] == dataset_id)
+    ]
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from shared.utils import ENV_ATHENA, get_vcf_chromosome, load_presence_bloom
+
+
+THREADS = 32
+
+
+def _may_contain(dataset, vcf, chromosome, position):
+    if not chromosome:
+        return False
+    bloom = load_presence_bloom(
+        ENV_ATHENA.ATHENA_METADATA_BUCKET, dataset.id, vcf, chromosome, position
+    )
+    # vcfs without an index (not built yet) must still be searched
+    if bloom is None:
+        return True
+    return bool(bloom) and position in bloom
+
+
+def filter_datasets_by_presence(datasets, dataset_samples, reference_name, position):
+    """
+    Drop the vcfs whose presence index rules out a variant at the given
+    1-based position, and the datasets left without any vcf.
+    dataset_samples is kept aligned with the returned datasets.
+    """
+    checks = []
+
+    for dataset in datasets:
+        vcf_chromosomes = {
+            vcfm["vcf"]: get_vcf_chromosome(vcfm, reference_name)
+            for vcfm in dataset._vcfChromosomeMap
+        }
+        for vcf in dataset._vcfLocations:
+            checks.append((dataset, vcf, vcf_chromosomes.get(vcf)))
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        results = list(
+            executor.map(
+                lambda check: _may_contain(*check, position),
+                checks,
+            )
+        )
+
+    candidates = {
+        (dataset.id, vcf)
+        for (dataset, vcf, _), result in zip(checks, results)
+        if result
+    }
+    filtered_datasets = []
+    filtered_samples = []
+
+    for n, dataset in enumerate(datasets):
+        vcfs = [vcf for vcf in dataset._vcfLocations if (dataset.id, vcf) in candidates]
+        if not vcfs:
+            continue
+        dataset._vcfLocations = vcfs
+        filtered_datasets.append(dataset)
+        if dataset_samples:
+            filtered_samples.append(dataset_samples[n])
+
+    print(
+        f"Presence index kept {len(candidates)} of {len(checks)} vcfs for position {position}"
+    )
+    return filtered_datasets, filtered_samples
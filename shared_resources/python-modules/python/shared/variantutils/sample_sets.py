@@ -0,0 +1,35 @@
+import hashlib
+import time
+
+import boto3
+
+from shared.utils import ENV_ATHENA
+
+
+# sample subsets handed to performQuery by reference instead of inline
+SAMPLE_SETS_PREFIX = "sample-sets"
+# objects expire after a day, re-upload well before that
+STAGED_TTL = 3600
+
+
+s3 = boto3.client("s3")
+_staged = dict()
+
+
+def stage_sample_set(samples):
+    """
+    Uploads the sample names once, keyed by their digest, and returns the
+    s3 uri performQuery resolves against the vcf sample order.
+    Returns None when there is no subset (all samples are queried).
+    """
+    if not samples:
+        return None
+
+    body = "\n".join(sorted(set(samples))).encode()
+    key = f"{SAMPLE_SETS_PREFIX}/{hashlib.sha256(body).hexdigest()}"
+
+    if _staged.get(key, 0) < time.time():
+        s3.put_object(Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET, Key=key, Body=body)
+        _staged[key] = time.time() + STAGED_TTL
+
+    return f"s3://{ENV_ATHENA.ATHENA_METADATA_BUCKET}/{key}"
@@ -1,29 +1,42 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Generator, List
+from concurrent.futures import as_completed
+from typing import Generator, List, Optional, Tuple
 import os
 import json
 import math
 import gzip
 import base64
+import time
 
 import boto3
 import jsons
 
-from shared.utils import get_matching_chromosome
+from shared.dynamodb import variant_query_plan_key
+from shared.utils import ENV_ATHENA, get_vcf_chromosome
 from shared.payloads import PerformQueryResponse
-from shared.utils import LambdaClient
+from shared.utils.async_lambda import AsyncLambdaClient
+from .sample_sets import stage_sample_set
 
 
 SPLIT_QUERY_LAMBDA = os.environ["SPLIT_QUERY_LAMBDA"]
 SPLIT_SIZE = 20000
-THREADS = 200
+# splitQuery invocations in flight at once
+MAX_IN_FLIGHT = 200
+# splitQuery times out after 30s, stop waiting on a chunk shortly after
+CHUNK_DEADLINE = 35
+# upper bound of windows searched at once while filling a page
+MAX_PAGE_WINDOWS = 32
+# seconds a page may spend searching, within api gateway's 29s timeout
+PAGE_DEADLINE = 25
+# performQuery payloads handled by one splitQuery invocation of a job
+JOB_CHUNK_PAYLOADS = 50
 
 
 s3 = boto3.client("s3")
-aws_lambda = LambdaClient()
+sns = boto3.client("sns")
+aws_lambda = AsyncLambdaClient(MAX_IN_FLIGHT, CHUNK_DEADLINE)
 
 
-def fan_out(payload: List[dict]):
+def _pack(payload: List[dict]):
     # stringified payload
     payload_str = json.dumps(payload)
 
@@ -32,15 +45,22 @@ def fan_out(payload: List[dict]):
         payload_str = json.dumps(
             base64.b64encode(gzip.compress(payload_str.encode())).decode()
         )
+    return payload_str
 
-    response = aws_lambda.invoke(
+
+def fan_out(payload: List[dict], deadline=None):
+    return aws_lambda.submit(
         FunctionName=SPLIT_QUERY_LAMBDA,
         InvocationType="RequestResponse",
-        Payload=payload_str,
+        Payload=_pack(payload),
+        deadline=deadline,
     )
+
+
+def parse_fan_out(payload: List[dict], response: bytes):
     parsed = None
     try:
-        parsed = json.loads(response["Payload"].read())
+        parsed = json.loads(response)
         for item in parsed:
             item["project_name"] = payload[0].get("project_name", "")
             item["dataset_name"] = payload[0].get("dataset_name", "")
@@ -76,52 +96,34 @@ def best_parallelism(N):
     return chosen
 
 
-def perform_variant_search(
-    *,
-    datasets,
-    reference_name,
-    reference_bases,
-    alternate_bases,
-    start,
-    end,
-    variant_type=None,
-    variant_min_length=0,
-    variant_max_length=-1,
-    requested_granularity="boolean",
-    include_datasets="ALL",
-    query_id="TEST",
-    dataset_samples=[],
-    include_samples=False,
-) -> Generator[PerformQueryResponse, None, None]:
-    try:
-        # get vcf file and the name of chromosome in it eg: "chr1", "Chr4", "CHR1" or just "1"
-        vcf_chromosomes = {
-            vcfm["vcf"]: get_matching_chromosome(vcfm["chromosomes"], reference_name)
-            for dataset in datasets
-            for vcfm in dataset._vcfChromosomeMap
-        }
+def _resolve_coordinates(start, end):
+    if len(start) == 2:
+        start_min, start_max = start
+    else:
+        start_min = start[0]
 
-        if len(start) == 2:
-            start_min, start_max = start
-        else:
-            start_min = start[0]
+    if len(end) == 2:
+        end_min, end_max = end
+    else:
+        end_min = start_min
+        end_max = end[0]
 
-        if len(end) == 2:
-            end_min, end_max = end
-        else:
-            end_min = start_min
-            end_max = end[0]
+    if len(start) != 2:
+        start_max = end_max
 
-        if len(start) != 2:
-            start_max = end_max
-    except Exception as e:
-        print("Error occured ", e)
-        return False, []
+    return start_min + 1, start_max + 1, end_min + 1, end_max + 1
 
-    start_min += 1
-    start_max += 1
-    end_min += 1
-    end_max += 1
+
+def _stage_sample_sets(datasets, dataset_samples):
+    # one staged subset per dataset, shared by all of its windows
+    if not dataset_samples:
+        return []
+    return [stage_sample_set(dataset_samples[n]) for n in range(len(datasets))]
+
+
+def _build_payloads(
+    datasets, vcf_chromosomes, sample_sets, window_start, window_end, query
+):
     payloads = []
 
     # parallelism across datasets
@@ -132,53 +134,330 @@ def perform_variant_search(
             if vcf_chromosomes[vcf]
         }
 
-        split_start = start_min
+        split_start = window_start
 
-        while split_start <= start_max:
+        while split_start <= window_end:
             # TODO improve SPLIT_SIZE - make dynamic
-            split_end = min(split_start + SPLIT_SIZE - 1, start_max)
+            split_end = min(split_start + SPLIT_SIZE - 1, window_end)
             for vcf_location, chrom in vcf_locations.items():
                 payload = {
-                    "query_id": query_id,
+                    **query,
                     "dataset_id": dataset.id,
                     "project_name": dataset._projectName,
                     "dataset_name": dataset._datasetName,
                     "vcf_location": vcf_location,
-                    "samples": dataset_samples[n] if dataset_samples else [],
-                    "reference_bases": reference_bases or "N",
-                    "alternate_bases": alternate_bases or "N",
-                    "end_min": end_min,
-                    "end_max": end_max,
-                    "variant_min_length": variant_min_length,
-                    "variant_max_length": variant_max_length,
-                    "include_details": include_datasets in ("HIT", "ALL"),
-                    "include_samples": include_samples,
+                    "sample_set": sample_sets[n] if sample_sets else None,
                     "region": f"{chrom}:{split_start}-{split_end}",
-                    "variant_type": variant_type,
-                    "requested_granularity": requested_granularity,
                 }
                 payloads.append(payload)
             # next split
             split_start += SPLIT_SIZE
 
+    return payloads
+
+
+def _dispatch(payloads, deadline=None) -> Generator[PerformQueryResponse, None, None]:
     print("Start: event publishing")
     # TODO further split by sample counts to avoid payload overflow
     chunk_size = best_parallelism(len(payloads))
     print(
         f"PAYLOADS - {len(payloads)} CHUNK SIZE - {chunk_size} NO CHUNKS - {math.ceil(len(payloads)/chunk_size)}"
     )
-    executor = ThreadPoolExecutor(THREADS)
-    futures = [
-        executor.submit(fan_out, payloads[itr : itr + chunk_size])
-        for itr in range(0, len(payloads), chunk_size)
+    chunks = [
+        payloads[itr : itr + chunk_size] for itr in range(0, len(payloads), chunk_size)
     ]
+    futures = {fan_out(chunk, deadline): chunk for chunk in chunks}
 
-    for future in as_completed(futures):
-        yield from future.result()
+    try:
+        for future in as_completed(futures):
+            yield from parse_fan_out(futures[future], future.result())
+    finally:
+        # callers may stop early (boolean queries), drop what is still running
+        for future in futures:
+            future.cancel()
 
-    # No need to executor.shutdown() the executor at this point, it'd be an unwatned code line
     print("End: retrieved results")
 
 
+def perform_variant_search(
+    *,
+    datasets,
+    reference_name,
+    reference_bases,
+    alternate_bases,
+    start,
+    end,
+    variant_type=None,
+    variant_min_length=0,
+    variant_max_length=-1,
+    requested_granularity="boolean",
+    include_datasets="ALL",
+    query_id="TEST",
+    dataset_samples=[],
+    include_samples=False,
+) -> Generator[PerformQueryResponse, None, None]:
+    try:
+        # get vcf file and the name of chromosome in it eg: "chr1", "Chr4", "CHR1" or just "1"
+        vcf_chromosomes = {
+            vcfm["vcf"]: get_vcf_chromosome(vcfm, reference_name)
+            for dataset in datasets
+            for vcfm in dataset._vcfChromosomeMap
+        }
+        start_min, start_max, end_min, end_max = _resolve_coordinates(start, end)
+    except Exception as e:
+        print("Error occured ", e)
+        return False, []
+
+    query = {
+        "query_id": query_id,
+        "reference_bases": reference_bases or "N",
+        "alternate_bases": alternate_bases or "N",
+        "end_min": end_min,
+        "end_max": end_max,
+        "variant_min_length": variant_min_length,
+        "variant_max_length": variant_max_length,
+        "include_details": include_datasets in ("HIT", "ALL"),
+        "include_samples": include_samples,
+        "variant_type": variant_type,
+        "requested_granularity": requested_granularity,
+    }
+    sample_sets = _stage_sample_sets(datasets, dataset_samples)
+    payloads = _build_payloads(
+        datasets, vcf_chromosomes, sample_sets, start_min, start_max, query
+    )
+
+    yield from _dispatch(payloads)
+
+
+def plan_variant_query_job(
+    *,
+    datasets,
+    reference_name,
+    reference_bases,
+    alternate_bases,
+    start,
+    end,
+    variant_type=None,
+    variant_min_length=0,
+    variant_max_length=-1,
+    query_id,
+    dataset_samples=[],
+) -> dict:
+    """
+    Splits a record granularity search into chunks of consecutive windows.
+
+    Chunks hold disjoint, ordered position ranges, so their results can be
+    paged through one after the other without merging. A chunk searches
+    every vcf, in parts of at most JOB_CHUNK_PAYLOADS performQuery payloads
+    when there are more vcfs than fit in one splitQuery invocation.
+
+    The plan holds the payload of each vcf without its region, the number
+    of them searched per part and the [start, end] range of each chunk.
+    """
+    vcf_chromosomes = {
+        vcfm["vcf"]: get_vcf_chromosome(vcfm, reference_name)
+        for dataset in datasets
+        for vcfm in dataset._vcfChromosomeMap
+    }
+    start_min, start_max, end_min, end_max = _resolve_coordinates(start, end)
+    query = {
+        "query_id": query_id,
+        "reference_bases": reference_bases or "N",
+        "alternate_bases": alternate_bases or "N",
+        "end_min": end_min,
+        "end_max": end_max,
+        "variant_min_length": variant_min_length,
+        "variant_max_length": variant_max_length,
+        "include_details": True,
+        "include_samples": False,
+        "variant_type": variant_type,
+        "requested_granularity": "record",
+    }
+    sample_sets = _stage_sample_sets(datasets, dataset_samples)
+    targets = [
+        {
+            "chromosome": vcf_chromosomes[vcf],
+            "payload": {
+                **query,
+                "dataset_id": dataset.id,
+                "project_name": dataset._projectName,
+                "dataset_name": dataset._datasetName,
+                "vcf_location": vcf,
+                "sample_set": sample_sets[n] if sample_sets else None,
+            },
+        }
+        for n, dataset in enumerate(datasets)
+        for vcf in dataset._vcfLocations
+        if vcf_chromosomes.get(vcf)
+    ]
+    chunks = []
+
+    if targets:
+        part_size = min(len(targets), JOB_CHUNK_PAYLOADS)
+        chunk_span = max(1, JOB_CHUNK_PAYLOADS // len(targets)) * SPLIT_SIZE
+        chunk_start = start_min
+
+        while chunk_start <= start_max:
+            chunk_end = min(chunk_start + chunk_span - 1, start_max)
+            chunks.append([chunk_start, chunk_end])
+            chunk_start = chunk_end + 1
+    else:
+        part_size = 0
+
+    return {
+        "targets": targets,
+        "partSize": part_size,
+        "splitSize": SPLIT_SIZE,
+        "chunks": chunks,
+    }
+
+
+def submit_variant_query_job(job_id, plan: dict):
+    """
+    Stores the plan of a job and hands it to splitQuery, which publishes
+    its chunks outside of the api request.
+    """
+    s3.put_object(
+        Bucket=ENV_ATHENA.ATHENA_METADATA_BUCKET,
+        Key=variant_query_plan_key(job_id),
+        Body=json.dumps(plan),
+    )
+    sns.publish(
+        TopicArn=os.environ["SPLIT_QUERY_TOPIC_ARN"],
+        Message=json.dumps({"variantQueryJob": {"jobId": job_id}}),
+    )
+
+
+def _variant_key(variant):
+    _, pos, ref, alt, _ = variant.split("\t")
+    return int(pos), ref, alt
+
+
+def perform_variant_search_page(
+    *,
+    datasets,
+    reference_name,
+    reference_bases,
+    alternate_bases,
+    start,
+    end,
+    variant_type=None,
+    variant_min_length=0,
+    variant_max_length=-1,
+    query_id="TEST",
+    dataset_samples=[],
+    skip=0,
+    limit=10,
+    cursor=None,
+) -> Tuple[List[Tuple[str, PerformQueryResponse]], Optional[dict]]:
+    """
+    Record granularity variant search honouring pagination.
+
+    Windows are walked in position order, a batch at a time, and the walk stops
+    as soon as `limit` distinct variants past the cursor (after `skip`) are found,
+    or once PAGE_DEADLINE has passed, in which case the page may be short, even
+    empty, and the next one resumes after the windows searched so far.
+    Returns the (variant, response) hits in position order and the cursor of the
+    next page (None on the last page).
+    """
+    try:
+        vcf_chromosomes = {
+            vcfm["vcf"]: get_vcf_chromosome(vcfm, reference_name)
+            for dataset in datasets
+            for vcfm in dataset._vcfChromosomeMap
+        }
+        start_min, start_max, end_min, end_max = _resolve_coordinates(start, end)
+    except Exception as e:
+        print("Error occured ", e)
+        return [], None
+
+    # variants at or before this key were returned in previous pages
+    last_key = (0, "", "")
+    resume_pos = start_min
+
+    if cursor is not None:
+        last_key = (int(cursor["position"]), cursor["ref"], cursor["alt"])
+        # windows before it were searched by a page that ran out of time
+        resume_pos = max(start_min, last_key[0], int(cursor.get("resume", 0)))
+        # left over when the page skipping them ran out of time
+        skip += int(cursor.get("skip", 0))
+
+    give_up = time.monotonic() + PAGE_DEADLINE
+    hits = []
+    windows = 1
+    sample_sets = _stage_sample_sets(datasets, dataset_samples)
+
+    while resume_pos <= start_max and len(hits) < limit and time.monotonic() < give_up:
+        batch_end = min(resume_pos + windows * SPLIT_SIZE - 1, start_max)
+        query = {
+            "query_id": query_id,
+            "reference_bases": reference_bases or "N",
+            "alternate_bases": alternate_bases or "N",
+            "end_min": end_min,
+            "end_max": end_max,
+            "variant_min_length": variant_min_length,
+            "variant_max_length": variant_max_length,
+            "include_details": True,
+            "include_samples": False,
+            "variant_type": variant_type,
+            "requested_granularity": "record",
+            # each vcf window may stop once it alone could fill the page
+            "limit": skip + limit - len(hits),
+        }
+        payloads = _build_payloads(
+            datasets, vcf_chromosomes, sample_sets, resume_pos, batch_end, query
+        )
+        # results are complete only up to the smallest early stop position
+        horizon = batch_end
+        batch_hits = dict()
+
+        try:
+            for query_response in _dispatch(payloads, give_up - time.monotonic()):
+                if query_response.horizon is not None:
+                    horizon = min(horizon, query_response.horizon)
+                for variant in query_response.variants:
+                    key = _variant_key(variant)
+                    if key > last_key and key not in batch_hits:
+                        batch_hits[key] = (variant, query_response)
+        except TimeoutError:
+            # the next page searches this batch again
+            return hits, _resume_cursor(last_key, resume_pos, skip)
+
+        batch_keys = sorted(key for key in batch_hits if key[0] <= horizon)
+
+        for key in batch_keys:
+            if skip > 0:
+                skip -= 1
+                last_key = key
+                continue
+            if len(hits) == limit:
+                # more variants are known beyond this page
+                return hits, _page_cursor(last_key)
+            hits.append(batch_hits[key])
+            last_key = key
+
+        resume_pos = horizon + 1
+        windows = min(windows * 2, MAX_PAGE_WINDOWS)
+
+    if resume_pos > start_max:
+        return hits, None
+    if len(hits) == limit:
+        return hits, _page_cursor(last_key)
+    # out of time before the page filled up
+    return hits, _resume_cursor(last_key, resume_pos, skip)
+
+
+def _page_cursor(key):
+    pos, ref, alt = key
+    return {"position": pos, "ref": ref, "alt": alt}
+
+
+def _resume_cursor(key, resume_pos, skip):
+    cursor = {**_page_cursor(key), "resume": resume_pos}
+    if skip:
+        cursor["skip"] = skip
+    return cursor
+
+
 if __name__ == "__main__":
     pass
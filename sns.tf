@@ -18,6 +18,17 @@ resource "aws_sns_topic_subscription" "performQuery" {
   endpoint  = module.lambda-performQuery.lambda_function_arn
 }
 
+# cohort tasks lambda gave up on, the function fails their jobs
+resource "aws_sns_topic" "cohortTaskFailures" {
+  name = "cohortTaskFailures"
+}
+
+resource "aws_sns_topic_subscription" "cohortTaskFailures" {
+  topic_arn = aws_sns_topic.cohortTaskFailures.arn
+  protocol  = "lambda"
+  endpoint  = module.lambda-generateCohortVCfs.lambda_function_arn
+}
+
 # resource "aws_sns_topic" "indexer" {
 #   name = "indexer"
 # }
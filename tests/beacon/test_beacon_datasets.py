@@ -1,3 +1,4 @@
+import io
 import json
 import os
 import sys
@@ -11,11 +12,20 @@ from moto import mock_aws
 
 def test_get_datasets(resources_dict):
     import lambda_function
+    from shared.cognitoutils import create_permissions_token
 
     event = {
         "resource": "/datasets",
         "path": "/datasets",
         "httpMethod": "POST",
+        "headers": {
+            "x-permissions-token": create_permissions_token(
+                {
+                    "sub": resources_dict["guest_sub"],
+                    "permissions": ["sbeacon_query.create"],
+                }
+            )
+        },
         "requestContext": {
             "authorizer": {
                 "claims": {
@@ -42,3 +52,82 @@ def test_get_datasets(resources_dict):
 
     assert body["responseSummary"]["exists"] is True
     assert body["responseSummary"]["numTotalResults"] == 2
+
+
+def test_get_datasets_pages(resources_dict):
+    import lambda_function
+    from shared.apiutils import decode_page_token
+    from shared.athena import common
+    from shared.cognitoutils import create_permissions_token
+
+    def datasets_event(pagination):
+        return {
+            "resource": "/datasets",
+            "path": "/datasets",
+            "httpMethod": "POST",
+            "headers": {
+                "x-permissions-token": create_permissions_token(
+                    {
+                        "sub": resources_dict["guest_sub"],
+                        "permissions": ["sbeacon_query.create"],
+                    }
+                )
+            },
+            "requestContext": {
+                "authorizer": {
+                    "claims": {
+                        "sub": resources_dict["guest_sub"],
+                        "cognito:groups": "",
+                    }
+                },
+            },
+            "body": json.dumps(
+                {
+                    "projects": ["ci_cd_project"],
+                    "query": {
+                        "filters": [],
+                        "requestedGranularity": "record",
+                        "pagination": pagination,
+                    },
+                    "meta": {"apiVersion": "v2.0"},
+                }
+            ),
+        }
+
+    # numeric looking ids must stay strings through the token
+    pages = [
+        "id,_projectname,_total\n1001,ci_cd_project,3\n1002,ci_cd_project,3\n",
+        "id,_projectname\n1002,ci_cd_project\n1e3,ci_cd_project\n",
+    ]
+    run_custom_query = common.run_custom_query
+
+    with patch.object(
+        common, "sopen", side_effect=lambda *args, **kwargs: io.StringIO(pages.pop(0))
+    ), patch.object(
+        common, "run_custom_query", side_effect=run_custom_query
+    ) as run_query:
+        response = lambda_function.lambda_handler(
+            datasets_event({"skip": 0, "limit": 1}), {}
+        )
+        body = json.loads(response["body"])
+
+        assert body["responseSummary"]["numTotalResults"] == 3
+        datasets = body["response"]["collections"]
+        assert [dataset["id"] for dataset in datasets] == ["1001"]
+        next_page = body["info"]["pagination"]["nextPage"]
+        assert decode_page_token(next_page)["after"] == "1001"
+
+        response = lambda_function.lambda_handler(
+            datasets_event({"skip": 0, "limit": 1, "currentPage": next_page}), {}
+        )
+        body = json.loads(response["body"])
+
+        assert run_query.call_args.kwargs["execution_parameters"] == ["'1001'"]
+        assert body["responseSummary"]["numTotalResults"] == 3
+        datasets = body["response"]["collections"]
+        assert [dataset["id"] for dataset in datasets] == ["1002"]
+        assert decode_page_token(body["info"]["pagination"]["nextPage"]) == {
+            "after": "1002",
+            "listing": decode_page_token(next_page)["listing"],
+            "total": 3,
+        }
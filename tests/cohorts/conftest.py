@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+import boto3
+from moto import mock_aws
+
+from test_utils.mock_resources import setup_resources
+
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../../lambda/generateCohortVCfs/")
+    )
+)
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__), "../../shared_resources/python-modules/python/"
+        )
+    )
+)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def resources_dict():
+    with mock_aws():
+        resources = setup_resources()
+
+        from shared.dynamodb import CohortJob
+
+        CohortJob.create_table(read_capacity_units=5, write_capacity_units=5, wait=True)
+        boto3.client("s3").create_bucket(
+            Bucket=os.environ["DPORTAL_BUCKET"],
+            CreateBucketConfiguration={
+                "LocationConstraint": os.environ["AWS_DEFAULT_REGION"]
+            },
+        )
+
+        yield resources
@@ -0,0 +1,250 @@
+import concurrent.futures
+import io
+import json
+import os
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import boto3
+from smart_open import open as sopen
+
+
+BUCKET = os.environ["DPORTAL_BUCKET"]
+
+
+class Bcftools:
+    """
+    Stands in for bcftools, each output holding the command writing it.
+    Commands with an argument in fail exit with an error.
+    """
+
+    def __init__(self, fail=None):
+        self.fail = fail
+
+    def popen(self, args, **kwargs):
+        process = MagicMock()
+        process.stdout = io.BytesIO(" ".join(args).encode())
+        process.wait.return_value = 1 if self.fail in args else 0
+        return process
+
+    def run(self, args, **kwargs):
+        # bcftools index --csi --output <index> <file>
+        with open(args[args.index("--output") + 1], "wb") as f:
+            f.write(b"csi")
+        return subprocess.CompletedProcess(args, 0, b"", b"")
+
+
+def vcf(dataset, name, samples, chromosomes):
+    return {
+        "dataset": dataset,
+        "vcf": f"s3://{BUCKET}/projects/{dataset}/{name}",
+        "samples": samples,
+        "chromosomes": chromosomes,
+        "output": f"s3://{BUCKET}/outputs/{dataset}/{name}",
+    }
+
+
+def failure_record(event, error):
+    # what the on-failure destination publishes for an invocation
+    record = {
+        "requestContext": {"condition": "RetriesExhausted"},
+        "requestPayload": event,
+        "responsePayload": {"errorMessage": error},
+    }
+    return {"Records": [{"Sns": {"Message": json.dumps(record)}}]}
+
+
+def export(job_id, vcfs, merge, fail=None, lost=None):
+    """
+    Runs an export to the end, invoking the tasks published one at a time.
+    The task numbered lost of the first stage is killed instead, and only
+    reported by the on-failure destination.
+    Returns the job and the commands run, by the file each one wrote.
+    """
+    import lambda_function
+    from cohort_plan import EXTRACT_STAGE, plan_extraction
+    from shared.dynamodb import CohortJob, create_cohort_job
+
+    job_path = f"s3://{BUCKET}/private/identity/cohorts/{job_id}"
+    bcftools = Bcftools(fail)
+    events = []
+
+    def submit(*, FunctionName, Payload, InvocationType):
+        events.append(json.loads(Payload))
+        future = concurrent.futures.Future()
+        future.set_result(b"")
+        return future
+
+    with (
+        patch("metadata_utils.subprocess") as mock_subprocess,
+        patch.object(
+            lambda_function, "run_bcftools", wraps=lambda_function.run_bcftools
+        ) as run_bcftools,
+        patch.object(lambda_function.aws_lambda, "submit", side_effect=submit),
+        patch.dict(os.environ, {"AWS_LAMBDA_FUNCTION_NAME": "generateCohortVcfs"}),
+    ):
+        mock_subprocess.PIPE = subprocess.PIPE
+        mock_subprocess.Popen.side_effect = bcftools.popen
+        mock_subprocess.run.side_effect = bcftools.run
+
+        stage = plan_extraction(job_path, vcfs, merge=merge)
+        job = create_cohort_job(
+            job_id, "sub", job_path, merge, EXTRACT_STAGE, len(stage["tasks"])
+        )
+        lambda_function.start_stage(job, stage)
+
+        while events:
+            event = events.pop(0)
+            task = event["cohortTask"]
+            if (task["stage"], task["task"]) == (EXTRACT_STAGE, lost):
+                killed = event
+                continue
+            lambda_function.lambda_handler(event, None)
+
+        if lost is not None:
+            # the stage never finishes without the killed task
+            assert CohortJob.get(job_id).status == "RUNNING"
+            lambda_function.lambda_handler(
+                failure_record(killed, "Task timed out after 900.00 seconds"), None
+            )
+
+    commands = {call.args[1]: call.args[0] for call in run_bcftools.call_args_list}
+    return CohortJob.get(job_id), commands, job_path
+
+
+def read(path):
+    with sopen(path) as f:
+        return f.read()
+
+
+def keys(prefix):
+    response = boto3.client("s3").list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return [item["Key"] for item in response.get("Contents", [])]
+
+
+def inputs(args):
+    return args[args.index("-Oz") + 1 :]
+
+
+def subcommand(commands, name):
+    return {path: args for path, args in commands.items() if args[1] == name}
+
+
+def test_merge_by_sample_set():
+    vcfs = [
+        vcf("project:a", "chr1.vcf.gz", ["S1", "S2"], ["1"]),
+        vcf("project:a", "chr2.vcf.gz", ["S1", "S2"], ["2"]),
+        vcf("project:b", "all.vcf.gz", ["S3"], ["1", "2"]),
+    ]
+    job, commands, job_path = export("merge-sets", vcfs, merge=True)
+
+    assert job.status == "COMPLETED"
+    assert json.loads(read(f"{job_path}/status.json")) == {"status": "completed"}
+
+    views = subcommand(commands, "view")
+    assert len(views) == 4
+    assert not any("-h" in args for args in views.values())
+
+    # each chromosome merges the samples of both sets once
+    merges = subcommand(commands, "merge")
+    assert len(merges) == 2
+    for args in merges.values():
+        samples = sorted(
+            views[path][views[path].index("-s") + 1] for path in inputs(args)
+        )
+        assert samples == ["S1,S2", "S3"]
+
+    cohort = f"{job_path}/cohort.vcf.gz"
+    assert inputs(commands[cohort]) == list(merges)
+    assert read(cohort) == " ".join(commands[cohort])
+    assert keys(f"private/identity/cohorts/merge-sets/") == [
+        "private/identity/cohorts/merge-sets/cohort.vcf.gz",
+        "private/identity/cohorts/merge-sets/cohort.vcf.gz.csi",
+        "private/identity/cohorts/merge-sets/status.json",
+    ]
+
+
+def test_merge_gathers_vcfs_sharing_a_chromosome():
+    vcfs = [
+        vcf("project:c", "chr1a.vcf.gz", ["S1"], ["1"]),
+        vcf("project:c", "chr1b.vcf.gz", ["S1"], ["1"]),
+        vcf("project:d", "all.vcf.gz", ["S2"], ["1", "2"]),
+    ]
+    job, commands, job_path = export("merge-gather", vcfs, merge=True)
+
+    assert job.status == "COMPLETED"
+
+    # only the set missing a chromosome pads it with a header
+    views = subcommand(commands, "view")
+    assert len(views) == 5
+    assert [args[-1] for args in views.values() if "-h" in args] == [vcfs[0]["vcf"]]
+
+    gathers = [
+        args
+        for path, args in subcommand(commands, "concat").items()
+        if "--allow-overlaps" in args
+    ]
+    assert len(gathers) == 1
+    assert [views[path][-1] for path in inputs(gathers[0])] == [
+        vcfs[0]["vcf"],
+        vcfs[1]["vcf"],
+    ]
+
+    merges = subcommand(commands, "merge")
+    assert len(merges) == 2
+    assert all(len(inputs(args)) == 2 for args in merges.values())
+    assert f"{job_path}/cohort.vcf.gz" in commands
+
+
+def test_extract_per_vcf():
+    vcfs = [
+        vcf("project:a", "chr1.vcf.gz", ["S1", "S2"], ["1"]),
+        vcf("project:b", "all.vcf.gz", ["S3"], ["1", "2"]),
+    ]
+    job, commands, job_path = export("per-vcf", vcfs, merge=False)
+
+    assert job.status == "COMPLETED"
+    assert commands[vcfs[0]["output"]][1] == "view"
+    assert commands[vcfs[1]["output"]][1] == "concat"
+    assert len(inputs(commands[vcfs[1]["output"]])) == 2
+    assert read(vcfs[1]["output"]) == " ".join(commands[vcfs[1]["output"]])
+    assert keys("private/identity/cohorts/per-vcf/parts/") == []
+
+
+def test_failed_task_fails_job():
+    vcfs = [
+        vcf("project:a", "chr1.vcf.gz", ["S1", "S2"], ["1"]),
+        vcf("project:b", "all.vcf.gz", ["S3"], ["1", "2"]),
+    ]
+    job, commands, job_path = export("failed", vcfs, merge=True, fail="merge")
+
+    assert job.status == "FAILED"
+    assert json.loads(read(f"{job_path}/status.json"))["status"] == "failed"
+    assert keys("private/identity/cohorts/failed/parts/") == []
+
+
+def test_killed_task_fails_job():
+    vcfs = [
+        vcf("project:a", "chr1.vcf.gz", ["S1", "S2"], ["1"]),
+        vcf("project:b", "all.vcf.gz", ["S3"], ["1", "2"]),
+    ]
+    job, commands, job_path = export("killed", vcfs, merge=True, lost=1)
+
+    assert job.status == "FAILED"
+    assert json.loads(read(f"{job_path}/status.json")) == {
+        "status": "failed",
+        "message": "Task timed out after 900.00 seconds",
+    }
+    assert keys("private/identity/cohorts/killed/parts/") == []
+
+
+def test_stale_job_fails():
+    from shared.dynamodb import CohortJob, create_cohort_job, fail_stale_cohort_job
+
+    job = create_cohort_job("stale", "sub", "path", False, "extract", 2)
+    assert not fail_stale_cohort_job(job)
+
+    job.update(actions=[CohortJob.updatedAt.set(job.updatedAt - 31 * 60)])
+    assert fail_stale_cohort_job(job)
+    assert job.status == "FAILED"
+    assert not fail_stale_cohort_job(job)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+from test_utils import env  # noqa: F401, to inject keys into the environment
+
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../../lambda/deidentifyFiles/")
+    )
+)
@@ -0,0 +1,142 @@
+"""
+may_contain_pii must never spare a value ANY_PII_PATTERN would change, alone
+or joined with others by PII_VALUE_SEPARATOR. The corpus is fixed, so from
+this directory
+
+    python test_pii_prefilter.py --repeat 1000
+
+reproducibly times anonymise against the pattern alone on it.
+"""
+
+import argparse
+import itertools
+import time
+
+import pytest
+
+pytest.importorskip("ahocorasick")
+
+PII_VALUES = [
+    # email
+    "john.doe@example.com",
+    "contact: siti_rahma+beacon@mail.co.id",
+    # phone
+    "081234567890",
+    "+62 812-3456-7890",
+    "62 0812 3456 789",
+    "021 5551234",
+    "call 0274-512345 after 5pm",
+    "6281234567890",
+    # NIK
+    "3201011205850001",
+    "3171046701900002",
+    # plate
+    "B 1234 XYZ",
+    "parked as D 45 AB",
+    # address
+    "Jl. Merdeka No. 5",
+    "Kelurahan Menteng, Kecamatan Gambir",
+    "jalan Sudirman 12, Kode Pos 10220",
+    "RT 03/RW 07 Desa Sukamaju",
+    # honorific
+    "Dr. Budi Santoso",
+    "seen by Bapak Ahmad Yani",
+    "haji Abdul",
+    "Ny Sri Wahyuni",
+]
+NON_PII_VALUES = [
+    "AC=2;AN=6;AF=0.333",
+    "0/1",
+    "1|0",
+    "rs12345",
+    "PASS",
+    "GT:DP:GQ",
+    "Allele count in genotypes",
+    "chr1",
+    "ENSG00000139618",
+    "1000G",
+    "Nyquist",
+    "Adipose tissue",
+    "Dewar flask",
+    "ratio 5.5",
+    "12345",
+    "ID:rg1 SM:NA12878 PL:ILLUMINA",
+    "bwa mem -t 8 ref.fa r1.fq r2.fq",
+]
+# not PII, but close enough that the pattern has to rule them out
+NEAR_MISS_VALUES = [
+    "HLA-A*01:01:01:01",
+    "NIK 3171046701900002 on file",
+    "sample@run",
+    "Sri A",
+    "VQSRTrancheSNP99.90to100.00",
+    "ratio 0.05",
+    "123456789",
+]
+CORPUS = PII_VALUES + NON_PII_VALUES + NEAR_MISS_VALUES
+
+
+@pytest.fixture(scope="module")
+def deidentification():
+    import deidentification
+
+    return deidentification
+
+
+def scrub(deidentification, value):
+    return deidentification.ANY_PII_PATTERN.sub(deidentification.MASK, value)
+
+
+def test_corpus(deidentification):
+    for value in PII_VALUES:
+        assert deidentification.ANY_PII_PATTERN.search(value), value
+    for value in NON_PII_VALUES + NEAR_MISS_VALUES:
+        assert not deidentification.ANY_PII_PATTERN.search(value), value
+    for value in NEAR_MISS_VALUES:
+        assert deidentification.may_contain_pii(value), value
+
+
+@pytest.mark.parametrize("value", CORPUS)
+def test_anonymise_matches_pattern(deidentification, value):
+    assert deidentification.anonymise(value) == scrub(deidentification, value)
+
+
+def test_non_pii_values_skip_pattern(deidentification):
+    # what the prefilter saves, every one of these would run the full pattern
+    for value in NON_PII_VALUES:
+        assert not deidentification.may_contain_pii(value), value
+    joined = deidentification.PII_VALUE_SEPARATOR.join(NON_PII_VALUES)
+    assert not deidentification.may_contain_pii(joined)
+
+
+@pytest.mark.parametrize("size", [2, 3])
+def test_joined_values(deidentification, size):
+    separator = deidentification.PII_VALUE_SEPARATOR
+
+    for values in itertools.permutations(CORPUS, size):
+        if any(deidentification.ANY_PII_PATTERN.search(value) for value in values):
+            assert deidentification.may_contain_pii(separator.join(values)), values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times anonymise on the corpus")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    import conftest  # noqa: F401, for the path of the lambda
+    import deidentification
+
+    for name, function in (
+        ("pattern", lambda value: scrub(deidentification, value)),
+        ("anonymise", deidentification.anonymise),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for value in CORPUS:
+                function(value)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed / args.repeat / len(CORPUS) * 1e6:.2f}us per value")
+
+
+if __name__ == "__main__":
+    main()
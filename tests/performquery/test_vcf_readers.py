@@ -0,0 +1,88 @@
+import shutil
+
+import pytest
+
+pysam = pytest.importorskip("pysam")
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("bcftools") is None, reason="bcftools is not installed"
+)
+
+REGION = "1:1-1000"
+HEADER = [
+    "##fileformat=VCFv4.2",
+    "##contig=<ID=1,length=1000>",
+    '##INFO=<ID=AC,Number={ac_number},Type=Integer,Description="Allele count">',
+    '##INFO=<ID=AN,Number=1,Type=Integer,Description="Allele number">',
+    '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+    '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3",
+]
+RECORDS = [
+    # counts in INFO, one sample uncalled
+    "1\t10\t.\tA\tG\t.\t.\tAC=2;AN=6\tGT\t0/1\t1|0\t./.",
+    # no alternate alleles
+    "1\t20\t.\tA\t.\t.\t.\t.\tGT\t0/0\t0/0\t0/0",
+    # counted from the genotypes, half called and haploid
+    "1\t30\t.\tA\tG,T\t.\t.\t.\tGT\t./1\t2\t.",
+    # no genotypes
+    "1\t40\t.\tA\tG\t.\t.\t.\tDP\t3\t4\t5",
+    # missing counts
+    "1\t50\t.\tC\tT\t.\t.\tAC=.;AN=.\tGT\t0/1\t0/0\t1/1",
+]
+
+
+@pytest.fixture(params=["A", "1"])
+def vcf_location(request, tmp_path):
+    path = tmp_path / "readers.vcf"
+    header = "\n".join(HEADER).format(ac_number=request.param)
+    path.write_text(header + "\n" + "\n".join(RECORDS) + "\n")
+    return pysam.tabix_index(str(path), preset="vcf")
+
+
+def read(engine, vcf_location):
+    from vcf_readers import get_reader
+
+    reader = get_reader(engine, vcf_location, REGION, None, True)
+    records = [
+        (
+            record.position,
+            record.reference,
+            record.alts,
+            record.counts(),
+            record.calls(),
+            record.carriers({1, 2}),
+        )
+        for record in reader
+    ]
+    return records, reader.sample_names
+
+
+def test_readers_agree(vcf_location):
+    records, sample_names = read("pysam", vcf_location)
+
+    assert read("bcftools", vcf_location) == (records, sample_names)
+    assert [position for position, *_ in records] == [10, 20, 30, 40, 50]
+    assert sample_names == ["S1", "S2", "S3"]
+
+
+@pytest.mark.parametrize("alternate_bases", ["N", "G", "T"])
+def test_query_engines_agree(vcf_location, alternate_bases):
+    from query_engine import perform_query
+
+    payload = {
+        "region": REGION,
+        "vcf_location": vcf_location,
+        "reference_bases": "N",
+        "alternate_bases": alternate_bases,
+        "end_min": 0,
+        "end_max": 1000,
+        "variant_type": None,
+        "requested_granularity": "record",
+        "include_details": True,
+        "include_samples": True,
+    }
+    response = perform_query(payload, engine="pysam")
+
+    assert perform_query(payload, engine="bcftools") == response
+    assert response["exists"]
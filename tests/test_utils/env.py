@@ -3,6 +3,7 @@ import os
 keys = {
     # aws
     "AWS_DEFAULT_REGION": "ap-southeast-2",
+    "AWS_REGION": "ap-southeast-2",
     # beacon variables
     "BEACON_API_VERSION": "BEACON_API_VERSION",
     "BEACON_ID": "BEACON_ID",
@@ -32,6 +33,7 @@ keys = {
     "BEACON_SERVICE_TYPE_VERSION": "BEACON_SERVICE_TYPE_VERSION",
     # configurations
     "CONFIG_MAX_VARIANT_SEARCH_BASE_RANGE": "1000",
+    "CONFIG_MAX_VARIANT_QUERY_JOB_BASE_RANGE": "250000000",
     "ATHENA_WORKGROUP": "ATHENA_WORKGROUP",
     "ATHENA_METADATA_DATABASE": "ATHENA_METADATA_DATABASE",
     "ATHENA_METADATA_BUCKET": "ATHENA_METADATA_BUCKET",
@@ -49,12 +51,16 @@ keys = {
     "ATHENA_TERMS_INDEX_TABLE": "ATHENA_TERMS_INDEX_TABLE",
     "ATHENA_TERMS_CACHE_TABLE": "ATHENA_TERMS_CACHE_TABLE",
     "ATHENA_RELATIONS_TABLE": "ATHENA_RELATIONS_TABLE",
+    "ATHENA_CARRIERS_TABLE": "ATHENA_CARRIERS_TABLE",
     "DYNAMO_ONTOLOGIES_TABLE": "DYNAMO_ONTOLOGIES_TABLE",
     "DYNAMO_ANSCESTORS_TABLE": "DYNAMO_ANSCESTORS_TABLE",
     "DYNAMO_DESCENDANTS_TABLE": "DYNAMO_DESCENDANTS_TABLE",
     "DYNAMO_PROJECT_USERS_TABLE": "DYNAMO_PROJECT_USERS_TABLE",
     "DYNAMO_PROJECT_USERS_UID_INDEX": "DYNAMO_PROJECT_USERS_UID_INDEX",
     "DYNAMO_QUOTA_USER_TABLE": "DYNAMO_QUOTA_USER_TABLE",
+    "DYNAMO_VARIANT_QUERIES_TABLE": "DYNAMO_VARIANT_QUERIES_TABLE",
+    "DYNAMO_COHORT_JOBS_TABLE": "DYNAMO_COHORT_JOBS_TABLE",
+    "DYNAMO_VCFS_TABLE": "DYNAMO_VCFS_TABLE",
     "DYNAMO_PROJECTS_TABLE": "DYNAMO_PROJECTS_TABLE",
     "DYNAMO_JUPYTER_INSTANCES_TABLE": "DYNAMO_JUPYTER_INSTANCES_TABLE",
     "DYNAMO_SAVED_QUERIES_TABLE": "DYNAMO_SAVED_QUERIES_TABLE",
@@ -62,16 +68,33 @@ keys = {
     "DYNAMO_CLINIC_JOBS_TABLE": "DYNAMO_CLINIC_JOBS_TABLE",
     "DYNAMO_CLINICAL_ANNOTATIONS_TABLE": "DYNAMO_CLINICAL_ANNOTATIONS_TABLE",
     "DYNAMO_CLINICAL_VARIANTS_TABLE": "DYNAMO_CLINICAL_VARIANTS_TABLE",
+    "DYNAMO_CLI_UPLOAD_TABLE": "DYNAMO_CLI_UPLOAD_TABLE",
+    "DYNAMO_DATAPORTAL_LOCKS_TABLE": "DYNAMO_DATAPORTAL_LOCKS_TABLE",
+    "DYNAMO_DATASETS_TABLE": "DYNAMO_DATASETS_TABLE",
+    "DYNAMO_ONTO_INDEX_TABLE": "DYNAMO_ONTO_INDEX_TABLE",
+    "DYNAMO_PERMISSIONS_TABLE": "DYNAMO_PERMISSIONS_TABLE",
+    "DYNAMO_ROLES_TABLE": "DYNAMO_ROLES_TABLE",
+    "DYNAMO_ROLE_PERMISSIONS_PERM_ID_INDEX": "DYNAMO_ROLE_PERMISSIONS_PERM_ID_INDEX",
+    "DYNAMO_ROLE_PERMISSIONS_TABLE": "DYNAMO_ROLE_PERMISSIONS_TABLE",
+    "DYNAMO_USER_ROLES_ROLE_ID_INDEX": "DYNAMO_USER_ROLES_ROLE_ID_INDEX",
+    "DYNAMO_USER_ROLES_TABLE": "DYNAMO_USER_ROLES_TABLE",
+    "DYNAMO_VARIANT_QUERY_RESPONSES_TABLE": "DYNAMO_VARIANT_QUERY_RESPONSES_TABLE",
     "JUPYTER_LIFECYCLE_CONFIG_NAME": "JUPYTER_LIFECYCLE_CONFIG_NAME",
     "JUPYTER_INSTACE_ROLE_ARN": "JUPYTER_INSTACE_ROLE_ARN",
     # cognito
     "COGNITO_USER_POOL_ID": "COGNITO_USER_POOL_ID",
     "COGNITO_ADMIN_GROUP_NAME": "administrators",
+    "COGNITO_MANAGER_GROUP_NAME": "managers",
     "COGNITO_REGISTRATION_EMAIL_LAMBDA": "COGNITO_REGISTRATION_EMAIL_LAMBDA",
     # fan outs
     "SPLIT_QUERY_LAMBDA": "SPLIT_QUERY_LAMBDA",
+    "INDEXER_TOPIC_ARN": "INDEXER_TOPIC_ARN",
+    # ses
+    "SES_CONFIG_SET_NAME": "SES_CONFIG_SET_NAME",
+    "SES_SOURCE_EMAIL": "SES_SOURCE_EMAIL",
     # s3
     "CLINIC_TEMP_BUCKET_NAMES": "A,B,C",
+    "DPORTAL_BUCKET": "dportal-bucket",
 }
 
 # Set environment variables for testing
@@ -9,3 +9,6 @@ cd "$SCRIPT_DIR"
 pytest -p no:warnings -vv ./admin/
 pytest -p no:warnings -vv ./dataportal/
 pytest -p no:warnings -vv ./beacon/
+pytest -p no:warnings -vv ./cohorts/
+pytest -p no:warnings -vv ./performquery/
+pytest -p no:warnings -vv ./deidentify/
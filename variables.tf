@@ -194,6 +194,23 @@ variable "config-max-variant-search-base-range" {
   default     = 5000
 }
 
+variable "config-max-variant-query-job-base-range" {
+  type        = number
+  description = "Max allowed range for asynchronous variant query jobs"
+  default     = 250000000
+}
+
+variable "variant-query-engine" {
+  type        = string
+  description = "VCF reader used by performQuery, bcftools (subprocess) or pysam (in-process)"
+  default     = "bcftools"
+
+  validation {
+    condition     = contains(["bcftools", "pysam"], var.variant-query-engine)
+    error_message = "variant-query-engine must be bcftools or pysam"
+  }
+}
+
 # bucket prefixes
 variable "variants-bucket-prefix" {
   type        = string